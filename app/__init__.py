@@ -8,13 +8,14 @@ from .errors.handlers import setup_error_handling
 from .logs import logger
 from config import get_configuration_class
 from utils.contexts.handlers import before_every_request, after_every_request
+from utils.query_middleware import CustomQuery
 
 
 asyncio_loop = asyncio.get_event_loop()
 config_object = get_configuration_class()
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(query_class=CustomQuery)
 
 
 def _bind_request_contexts_handlers(app, blueprint):
@@ -34,11 +35,25 @@ def _setup_blueprints(app):
     _bind_request_contexts_handlers(app, api_blueprint)
 
 
+def _setup_blob_delivery(app):
+    # Without a front proxy, serve X-Accel-Redirect responses in-process
+    if app.config.get('BLOB_DELIVERY') != 'local':
+        return
+
+    from utils.signed_urls import AccelRedirectEmulator
+
+    app.wsgi_app = AccelRedirectEmulator(
+        app.wsgi_app,
+        app.config.get('BLOB_ACCEL_REDIRECT_PREFIX', '/protected-blobs/'),
+        app.config.get('BLOB_STORE_PATH', 'data/blobs'))
+
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(config_object)
 
     _setup_blueprints(app)
+    _setup_blob_delivery(app)
     setup_error_handling(app)
 
     db.init_app(app)
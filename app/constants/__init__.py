@@ -1,14 +1,56 @@
 ACCEPTED_MIME_TYPES = [
-    'application/json', 'application/pdf', 'image/png', 'video/mp4']
+    'application/json', 'application/pdf', 'image/jpeg', 'image/png',
+    'video/mp4']
+ACCESS_LOG_BATCH_SIZE = 500
+ACCESS_LOG_FLUSH_INTERVAL = 2
+ACCESS_LOG_QUEUE_SIZE = 10000
+APP_CACHE_SIZE = 5000
+APP_CACHE_TTL = (60 * 5)
 APP_NAME = ''
+AUTH_IDENTITY_CACHE_SIZE = 10000
+AUTH_IDENTITY_CACHE_TTL = 60
+
+BLOB_CHUNK_SIZE = (64 * 1024)
+BLOB_MAX_SIZE = (512 * 1024 * 1024)
+BLOB_UPLOAD_LIFESPAN = (60 * 60 * 24)
+BLOB_UPLOAD_MAX_CHUNK_SIZE = (8 * 1024 * 1024)
+BLOB_URL_EXPIRY_GRANULARITY = (60 * 15)
+BLOB_URL_LIFESPAN = (60 * 60)
+BLOB_VARIANTS = {
+    'feed': 1080,
+    'thumbnail': 320
+}
+
+COUNTER_SHARD_COUNT = 16
+COUNTER_STRIPING_THRESHOLD = 1000
+
+CURSOR_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
 
 DEFAULT_HASH_TAG_FETCH_SCOPE = 'meta'
 DEFAULT_TOKEN_COUNT = 20
 
+DERIVATIVE_JPEG_QUALITY = 85
+DERIVATIVE_POOL_SIZE = 2
+DERIVATIVE_RETRY_DELAY = (60 * 60)
+DERIVATIVE_VIDEO_POSTER_OFFSET = 1
+
 EMAIL_CONFIRMATION_LINK_LIFESPAN = (60 * 60)
 
+GEOCODING_BATCH_SIZE = 50
+GEOCODING_CACHE_SIZE = 10000
+GEOCODING_CELL_PRECISION = 3
+GEOCODING_RESOLVER_THREADS = 4
+GEOCODING_TIMEOUT = 5
+
+GEOHASH_PRECISION = 12
+
 HASH_TAG_RETRIEVAL_SCOPES = ['meta', 'posts', 'followers']
 
+LOOKUP_CACHE_SIZE = 1000
+LOOKUP_CACHE_TTL = (60 * 10)
+
+MAX_HASH_TAG_LENGTH = 128
+MAX_NOTIFICATION_TEXT_LENGTH = 128
 MAX_USER_BIO_LENGTH = 140
 MIN_COLLECTION_NAME_LENGTH = 2
 MIN_LOCATION_NAME_LENGTH = 2
@@ -18,6 +60,55 @@ MIN_POST_TEXT_LENGTH = 1
 MIN_USER_BIO_LENGTH = 4
 MIN_USERNAME_LENGTH = 2
 
+NEARBY_DEFAULT_RADIUS = 5
+NEARBY_MAX_CELLS = 16
+NEARBY_MAX_RADIUS = 50
+
 NESTED_VALUES_LIMIT = 20
 
+NOTIFICATION_BATCH_SIZE = 1000
+NOTIFICATION_FLUSH_INTERVAL = 2
+NOTIFICATION_QUEUE_SIZE = 50000
+NOTIFICATIONS_READ_BATCH_LIMIT = 100
+
+PASSWORD_HASH_METHOD = 'pbkdf2:sha512:260000'
+PASSWORD_HASHING_POOL_SIZE = 2
+PASSWORD_HASHING_QUEUE_FACTOR = 4
+PASSWORD_HASHING_TIMEOUT = 5
+
+REQUEST_COST = 1
+REQUEST_COUNTER_SYNC_INTERVAL = 10
+
+SEARCH_TEXT_CONFIG = 'english'
+
 SUPPORTED_HTTP_METHODS = ['GET', 'POST', 'PATCH', 'PUT', 'DELETE']
+
+TIMELINE_FAN_OUT_BATCH_SIZE = 1000
+TIMELINE_MAX_LENGTH = 800
+
+TOLL_FREE_DAILY_REQUESTS = 1000
+
+TRENDING_BUCKET_SECONDS = (60 * 5)
+TRENDING_CANDIDATES = 200
+TRENDING_DEFAULT_LIMIT = 10
+TRENDING_DEFAULT_WINDOW = '1h'
+TRENDING_MAX_LIMIT = 50
+TRENDING_RESULT_TTL = 5
+TRENDING_RETENTION_SECONDS = (60 * 60 * 24)
+TRENDING_SKETCH_DEPTH = 4
+TRENDING_SKETCH_WIDTH = 2048
+TRENDING_SNAPSHOT_INTERVAL = 60
+TRENDING_WINDOWS = {
+    '1h': (60 * 60),
+    '6h': (60 * 60 * 6),
+    '24h': (60 * 60 * 24)
+}
+
+TYPEAHEAD_DEFAULT_LIMIT = 8
+TYPEAHEAD_MAX_LIMIT = 20
+TYPEAHEAD_REBUILD_INTERVAL = (60 * 10)
+TYPEAHEAD_SCAN_LIMIT = 1000
+TYPEAHEAD_SYNC_INTERVAL = 10
+
+UNKNOWN_API_KEY_CACHE_SIZE = 10000
+UNKNOWN_API_KEY_CACHE_TTL = 30
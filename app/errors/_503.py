@@ -0,0 +1,9 @@
+from .base import APIError, DEFAULT_ERROR_MESSAGE
+
+
+_ERROR_CODE = 503
+
+
+class ServiceUnavailable(APIError):
+    code = _ERROR_CODE
+    message = 'Service is busy, please try again.'
@@ -2,3 +2,4 @@ from ._401 import *
 from ._403 import *
 from ._404 import *
 from ._500 import *
+from ._503 import *
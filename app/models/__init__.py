@@ -1,21 +1,30 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
+import io
 from json import loads
 import time
 
-from flask import current_app, g, url_for
+from flask import current_app, g
 from sqlalchemy.ext.hybrid import hybrid_property
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from werkzeug.security import check_password_hash, generate_password_hash
 
 from app import db
-from app.constants import ACCEPTED_MIME_TYPES, NESTED_VALUES_LIMIT
+from app.constants import (
+    ACCEPTED_MIME_TYPES, BLOB_VARIANTS, LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL,
+    NESTED_VALUES_LIMIT)
 from app.constants.statuses import (
-    ACTIVE_STATUS_ID, DELETED_STATUS_ID, READ_STATUS_ID)
+    ACTIVE_STATUS_ID, DELETED_STATUS_ID, FAILED_STATUS_ID, PENDING_STATUS_ID,
+    READ_STATUS_ID)
 from app.models.mixins import (
-    HasLocation, HasStatus, HasToken, LookUp, Persistence)
+    HasLocation, HasStatus, HasStripedCounters, HasToken, LookUp, Persistence)
 from utils import generate_unique_reference
+from utils.blob_store import (
+    decode_legacy_payload, get_blob_store, has_variants)
+from utils.caches import LRUCache
 from utils.contexts import (
     get_current_api_ref, get_current_request_data, get_current_request_headers)
+from utils.passwords import get_password_hasher, needs_rehash
+from utils.signed_urls import BlobUrlSigner
 
 
 collection_items = db.Table(
@@ -32,6 +41,15 @@ conversation_participants = db.Table(
 )
 
 
+daily_request_counts = db.Table(
+    'daily_request_counts', db.metadata,
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id'),
+              primary_key=True),
+    db.Column('day', db.Date, primary_key=True),
+    db.Column('count', db.Integer, default=0)
+)
+
+
 followers = db.Table(
     'followers', db.metadata,
     db.Column('follower_id', db.Integer, db.ForeignKey('users.id')),
@@ -42,14 +60,25 @@ followers = db.Table(
 hash_tag_posts = db.Table(
     'hash_tag_posts', db.metadata,
     db.Column('hash_tag_id', db.Integer, db.ForeignKey('hash_tags.id')),
-    db.Column('post_id', db.Integer, db.ForeignKey('posts.id'))
+    db.Column('post_id', db.Integer, db.ForeignKey('posts.id')),
+    db.Index('hash_tag_posts_tag_post_index', 'hash_tag_id', 'post_id')
 )
 
 
 hash_tag_followers = db.Table(
     'hash_tag_followers', db.metadata,
     db.Column('hash_tag_id', db.Integer, db.ForeignKey('hash_tags.id')),
-    db.Column('follower_id', db.Integer, db.ForeignKey('users.id'))
+    db.Column('follower_id', db.Integer, db.ForeignKey('users.id')),
+    db.Index(
+        'hash_tag_followers_tag_follower_index', 'hash_tag_id', 'follower_id')
+)
+
+
+materialized_timelines = db.Table(
+    'materialized_timelines', db.metadata,
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id'),
+              primary_key=True),
+    db.Column('materialized_at', db.DateTime, default=datetime.utcnow)
 )
 
 
@@ -60,6 +89,67 @@ story_viewers = db.Table(
 )
 
 
+timeline_entries = db.Table(
+    'timeline_entries', db.metadata,
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id')),
+    db.Column('post_id', db.Integer, db.ForeignKey('posts.id')),
+    db.Index('timeline_entries_user_post_index', 'user_id', 'post_id')
+)
+
+
+def _load_by_ids(model, ids, *criteria):
+    """Load the rows of `model` with the given ids in one IN query"""
+    ids = {id_ for id_ in ids if id_ is not None}
+    if not ids:
+        return {}
+
+    return {
+        record.id: record for record in model.query.filter(
+            model.id.in_(ids), *criteria)
+    }
+
+
+_lookup_rows = LRUCache(
+    'models.lookup_rows', max_size=LOOKUP_CACHE_SIZE, ttl=LOOKUP_CACHE_TTL)
+
+
+def _lookups_as_json(model, ids):
+    """Return `{id: as_json}` for rows of the `LookUp` table `model`,
+    querying only for the rows that aren't cached"""
+    ids = {id_ for id_ in ids if id_ is not None}
+
+    results, missing = {}, []
+    for id_ in ids:
+        cached = _lookup_rows.get((model.__tablename__, id_))
+        if cached is None:
+            missing.append(id_)
+        else:
+            results[id_] = cached
+
+    for id_, record in _load_by_ids(model, missing).items():
+        results[id_] = record.as_json()
+        _lookup_rows.set((model.__tablename__, id_), results[id_])
+
+    return results
+
+
+def _count_by(column, ids):
+    """Count rows grouped by `column` for the given ids in one query"""
+    ids = {id_ for id_ in ids if id_ is not None}
+    if not ids:
+        return {}
+
+    return dict(
+        db.session.query(
+            column, db.func.count()
+        ).filter(
+            column.in_(ids)
+        ).group_by(
+            column
+        ).all()
+    )
+
+
 class BaseModel(db.Model, HasStatus, Persistence):
     __abstract__ = True
 
@@ -105,6 +195,18 @@ class BaseModel(db.Model, HasStatus, Persistence):
 
         return query
 
+    @classmethod
+    def get_active_by_ids(cls, ids):
+        """Load active records by id in one query, in the order of `ids`"""
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return []
+
+        records = _load_by_ids(
+            cls, ids, cls.status_id == ACTIVE_STATUS_ID)
+
+        return [records[id_] for id_ in ids if id_ in records]
+
     @classmethod
     def scalar_get(cls, required_column, _desc=True, **args):
         cls_column = getattr(cls, required_column)
@@ -126,6 +228,16 @@ class BaseModel(db.Model, HasStatus, Persistence):
 class App(BaseModel, LookUp):
     __tablename__ = 'apps'
 
+    api_key = db.Column(db.String(64), unique=True, index=True)
+
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'uid': self.uid,
+            'name': self.name,
+            'api_key': self.api_key
+        }
+
 
 class AccessLog(BaseModel):
     __tablename__ = 'access_logs'
@@ -146,14 +258,100 @@ class AccessLog(BaseModel):
 
 
 class Blob(BaseModel):
+    """Metadata of a file whose bytes live in the blob store"""
     __tablename__ = 'blobs'
 
-    data = db.Column(db.TEXT)
+    digest = db.Column(db.String(64), index=True)
+    size = db.Column(db.BigInteger)
     mime_type = db.Column(db.Enum(*ACCEPTED_MIME_TYPES))
 
+    # Payloads stored inline before the blob store; `migrate_blobs` moves
+    # them out
+    data = db.deferred(db.Column(db.TEXT))
+
+    @classmethod
+    def create(cls, stream, mime_type, _commit=True):
+        digest, size = get_blob_store().put(stream)
+
+        blob = cls(digest=digest, size=size, mime_type=mime_type)
+        blob.save(_commit=_commit)
+
+        return blob
+
+    @property
+    def path(self):
+        return get_blob_store().path(self.digest)
+
     @property
     def url(self):
-        return url_for('web_blueprint.blob', blob_uid=self.uid)
+        return BlobUrlSigner().url(self.uid)
+
+    def move_to_store(self):
+        """Write the inline payload to the blob store and drop it from the
+        row"""
+        self.digest, self.size = get_blob_store().put(
+            io.BytesIO(decode_legacy_payload(self.data)))
+        self.data = None
+
+    def as_json(self):
+        return Blob.bulk_as_json([self])[0]
+
+    @classmethod
+    def bulk_as_json(cls, blobs):
+        """Serialize `blobs` with URLs that share one signing key and
+        expiry"""
+        signer = BlobUrlSigner()
+
+        results = []
+        for blob in blobs:
+            variants = {}
+            if has_variants(blob.mime_type):
+                variants = {
+                    variant: signer.url(blob.uid, variant)
+                    for variant in BLOB_VARIANTS
+                }
+
+            results.append({
+                'uid': blob.uid,
+                'mime_type': blob.mime_type,
+                'size': blob.size,
+                'url': signer.url(blob.uid),
+                'variants': variants
+            })
+
+        return results
+
+
+class BlobUpload(BaseModel):
+    """A resumable upload streamed to disk in chunks before it becomes a
+    `Blob`"""
+    __tablename__ = 'blob_uploads'
+
+    mime_type = db.Column(db.Enum(*ACCEPTED_MIME_TYPES))
+    size = db.Column(db.BigInteger)
+    offset = db.Column(db.BigInteger, default=0)
+    checksum = db.Column(db.String(64))
+
+    blob_id = db.Column(db.Integer, db.ForeignKey('blobs.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+
+    blob = db.relationship('Blob', uselist=False)
+
+    @property
+    def path(self):
+        return get_blob_store().upload_path(self.uid)
+
+    def is_complete(self):
+        return self.offset == self.size
+
+    def as_json(self):
+        return {
+            'uid': self.uid,
+            'mime_type': self.mime_type,
+            'size': self.size,
+            'offset': self.offset,
+            'blob': self.blob.as_json() if self.blob else None
+        }
 
 
 class Collection(BaseModel):
@@ -172,10 +370,11 @@ class Collection(BaseModel):
         ).count() > 0
 
 
-class Comment(BaseModel):
+class Comment(BaseModel, HasStripedCounters):
     __tablename__ = 'comments'
 
     text = db.Column(db.TEXT)
+    reply_count = db.Column(db.Integer, default=0)
 
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -188,6 +387,17 @@ class Comment(BaseModel):
     def user_can_reply(self, user):
         return self.user == user or self.post.user == user
 
+    def save(self, _commit=True):
+        if self.id is None:
+            Post.increment_counter(self.post_id, 'comment_count')
+
+        super(Comment, self).save(_commit=_commit)
+
+    def delete(self, _commit=True):
+        Post.increment_counter(self.post_id, 'comment_count', -1)
+
+        super(Comment, self).delete(_commit=_commit)
+
 
 class CommentReply(BaseModel):
     __tablename__ = 'comment_replies'
@@ -204,6 +414,17 @@ class CommentReply(BaseModel):
         'User', backref=db.backref('comment_replies', uselist=True),
         uselist=False)
 
+    def save(self, _commit=True):
+        if self.id is None:
+            Comment.increment_counter(self.comment_id, 'reply_count')
+
+        super(CommentReply, self).save(_commit=_commit)
+
+    def delete(self, _commit=True):
+        Comment.increment_counter(self.comment_id, 'reply_count', -1)
+
+        super(CommentReply, self).delete(_commit=_commit)
+
 
 class Conversation(BaseModel):
     __tablename__ = 'conversations'
@@ -214,16 +435,50 @@ class Conversation(BaseModel):
         lazy='dynamic')
 
 
-class HashTag(BaseModel):
+class HashTag(BaseModel, HasStripedCounters):
     __tablename__ = 'hash_tags'
 
     entity = db.Column(db.String(128), unique=True)
+    post_count = db.Column(db.Integer, default=0)
+    follower_count = db.Column(db.Integer, default=0)
 
     followers = db.relationship(
         'User', secondary=hash_tag_followers,
         backref=db.backref('hash_tags_followed', uselist=True), uselist=True,
         lazy='dynamic')
 
+    def is_followed_by(self, user):
+        return db.session.query(
+            hash_tag_followers.c.hash_tag_id
+        ).filter(
+            hash_tag_followers.c.hash_tag_id == self.id,
+            hash_tag_followers.c.follower_id == user.id
+        ).first() is not None
+
+    def as_json(self):
+        return HashTag.bulk_as_json([self])[0]
+
+    @classmethod
+    def bulk_as_json(cls, hash_tags):
+        """Serialize `hash_tags` with one query for all their counters"""
+        hash_tags = list(hash_tags)
+        counters = cls.bulk_counter_values(
+            hash_tags, ('post_count', 'follower_count'))
+
+        return [
+            {
+                'uid': hash_tag.uid,
+                'entity': hash_tag.entity,
+                'posts': {
+                    'count': counters[(hash_tag.id, 'post_count')]
+                },
+                'followers': {
+                    'count': counters[(hash_tag.id, 'follower_count')]
+                }
+            }
+            for hash_tag in hash_tags
+        ]
+
 
 class Like(BaseModel):
     __tablename__ = 'likes'
@@ -236,28 +491,55 @@ class Like(BaseModel):
     user = db.relationship(
         'User', backref=db.backref('likes', uselist=True), uselist=False)
 
+    def save(self, _commit=True):
+        if self.id is None:
+            Post.increment_counter(self.post_id, 'like_count')
+
+        super(Like, self).save(_commit=_commit)
+
+    def delete(self, _commit=True):
+        Post.increment_counter(self.post_id, 'like_count', -1)
+
+        super(Like, self).delete(_commit=_commit)
+
 
 class Location(BaseModel):
     __tablename__ = 'locations'
     __table_args__ = (
         db.UniqueConstraint(
-            'name', 'postal_code', 'street address', 'city',
+            'name', 'postal_code', 'street_address', 'city',
             'state_or_province', 'country', 'latitude', 'longitude',
             name='location_unique_index'),
+        db.Index('locations_resolution_status_index', 'resolution_status_id'),
     )
 
+    resolution_statuses = {
+        ACTIVE_STATUS_ID: 'resolved',
+        FAILED_STATUS_ID: 'failed',
+        PENDING_STATUS_ID: 'pending'
+    }
+
     name = db.Column(db.String(36))
     postal_code = db.Column(db.String(20))
     street_address = db.Column(db.String(20))
     city = db.Column(db.String(32))
     state_or_province = db.Column(db.String(32))
     country = db.Column(db.String(30))
-    latitude = db.Column(db.String(10))
-    longitude = db.Column(db.String(10))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
+    resolution_status_id = db.Column(
+        db.Integer, db.ForeignKey('statuses.id'), default=ACTIVE_STATUS_ID)
 
     @property
     def _name(self):
-        return self.name or '{}, {}, {}.'.format(
+        if self.name:
+            return self.name
+
+        if self.country is None:
+            return '{}, {}'.format(self.latitude, self.longitude)
+
+        return '{}, {}, {}.'.format(
             self.city, self.state_or_province, self.country)
 
     def as_json(self):
@@ -269,7 +551,9 @@ class Location(BaseModel):
             'country': self.country,
             'latitude': self.latitude,
             'longitude': self.longitude,
-            'name': self._name
+            'name': self._name,
+            'resolution_status': self.resolution_statuses.get(
+                self.resolution_status_id)
         }
 
 
@@ -282,7 +566,7 @@ class Message(BaseModel):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
     user = db.relationship(
-        'User', backref=db.backref('likes', uselist=True), uselist=False)
+        'User', backref=db.backref('messages', uselist=True), uselist=False)
 
 
 class MessageAttachment(BaseModel):
@@ -298,31 +582,126 @@ class MessageAttachment(BaseModel):
 
 
 class Notification(BaseModel):
+    """What `actor_count` users did to a target of one of `user`'s, such
+    as a post; the actors are kept as `User` entities"""
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index(
+            'notifications_aggregation_index', 'user_id',
+            'notification_event_id', 'target_entity_type_id',
+            'target_entity_id'),
+    )
 
     text = db.Column(db.String(128))
+    actor_count = db.Column(db.Integer, default=1)
+    target_entity_id = db.Column(db.Integer)
+    # Set while the notification is unread, so there's at most one unread
+    # notification per key however many workers fold events for it at
+    # once; NULLs never conflict, on any dialect
+    unread_aggregation_key = db.Column(db.String(64), unique=True)
 
     notification_event_id = db.Column(
         db.Integer, db.ForeignKey('notification_events.id'))
+    target_entity_type_id = db.Column(
+        db.Integer, db.ForeignKey('notification_entity_types.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
     notification_event = db.relationship('NotificationEvent', uselist=False)
     user = db.relationship('User', uselist=False)
 
+    @staticmethod
+    def aggregation_key(user_id, event_id, target_type_id, target_id):
+        return '{}:{}:{}:{}'.format(
+            user_id, event_id, target_type_id, target_id)
+
     def mark_as_read(self):
-        self.update(status_id=READ_STATUS_ID)
+        Notification.mark_all_as_read(self.user_id, ids=[self.id])
+
+    def is_read(self):
+        return self.status_id == READ_STATUS_ID
+
+    @classmethod
+    def mark_all_as_read(cls, user_id, ids=None, uids=None, up_to_id=None,
+                         _commit=True):
+        """Mark `user_id`'s unread notifications with the given ids or uids,
+        or with ids up to `up_to_id`, read in one UPDATE, take them off the
+        user's unread counter in the same transaction and return how many
+        changed"""
+        criteria = []
+        if ids:
+            criteria.append(cls.id.in_(ids))
+        if uids:
+            criteria.append(cls.uid.in_(uids))
+        if up_to_id is not None:
+            criteria.append(cls.id <= up_to_id)
+
+        if not criteria:
+            return 0
+
+        updated = cls.query.filter(
+            cls.user_id == user_id,
+            cls.status_id.notin_([READ_STATUS_ID, DELETED_STATUS_ID]),
+            db.or_(*criteria)
+        ).update(
+            {cls.status_id: READ_STATUS_ID,
+             cls.unread_aggregation_key: None,
+             cls.modified_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+
+        if updated:
+            User.increment_counter(
+                user_id, 'unread_notification_count', -updated)
+
+        if _commit:
+            db.session.commit()
+
+        return updated
 
     def as_json(self):
-        result = {
-            'text': self.text,
-            'created_at': self.created_at.isoformat(),
-            'notification_entities': [
-                item.as_json() for item in self.notification_entities
-            ],
-            'notification_event': self.notification_event.as_json(),
-        }
+        return Notification.bulk_as_json([self])[0]
 
-        return result
+    @classmethod
+    def bulk_as_json(cls, notifications):
+        """Serialize `notifications` with a fixed number of queries: one for
+        their entities, at most one per entity type, and none for cached
+        lookup rows"""
+        notifications = list(notifications)
+
+        events = _lookups_as_json(
+            NotificationEvent,
+            [notification.notification_event_id
+             for notification in notifications])
+
+        entities = defaultdict(list)
+        notification_ids = [notification.id for notification in notifications]
+        if notification_ids:
+            for entity in NotificationEntity.query.filter(
+                NotificationEntity.notification_id.in_(notification_ids)
+            ).order_by(
+                NotificationEntity.id
+            ):
+                entities[entity.notification_id].append(entity)
+
+        entities_json = NotificationEntity.bulk_as_json(
+            [entity for items in entities.values() for entity in items])
+
+        return [
+            {
+                'uid': notification.uid,
+                'text': notification.text,
+                'is_read': notification.is_read(),
+                'actor_count': notification.actor_count,
+                'created_at': notification.created_at.isoformat(),
+                'notification_entities': [
+                    entities_json[entity.id]
+                    for entity in entities[notification.id]
+                ],
+                'notification_event': events.get(
+                    notification.notification_event_id)
+            }
+            for notification in notifications
+        ]
 
 
 class NotificationEntity(BaseModel):
@@ -341,17 +720,55 @@ class NotificationEntity(BaseModel):
         db.relationship('NotificationEntityType', uselist=False))
 
     def as_json(self):
-        entity_cls = {
-            'Post': Post,
-            'Story': Story,
-            'User': User
-        }[self.notification_entity_type.name]
+        return NotificationEntity.bulk_as_json([self])[self.id]
 
-        return {
-            'entity': entity_cls.get_not_deleted(id=self.entity_id),
-            'notification_entity_type': self.notification_entity_type.as_json()
+    @classmethod
+    def bulk_as_json(cls, notification_entities):
+        """Return `{id: as_json}`, loading the entities of each type with
+        one query"""
+        serializers = {
+            'Post': (Post, Post.bulk_as_json),
+            'Story': (Story, Story.bulk_as_json),
+            'User': (User, User.bulk_as_json)
         }
 
+        notification_entities = list(notification_entities)
+        entity_types = _lookups_as_json(
+            NotificationEntityType,
+            [item.notification_entity_type_id
+             for item in notification_entities])
+
+        ids_by_type = defaultdict(set)
+        for item in notification_entities:
+            entity_type = entity_types.get(item.notification_entity_type_id)
+            if entity_type is not None:
+                ids_by_type[entity_type['name']].add(item.entity_id)
+
+        entities_json = {}
+        for type_name, ids in ids_by_type.items():
+            if type_name not in serializers:
+                # Types this version can't serialize come back as None
+                continue
+
+            model, serialize = serializers[type_name]
+
+            records = _load_by_ids(
+                model, ids, model.status_id != DELETED_STATUS_ID)
+            entities_json[type_name] = dict(
+                zip(records.keys(), serialize(records.values())))
+
+        results = {}
+        for item in notification_entities:
+            entity_type = entity_types.get(item.notification_entity_type_id)
+            type_name = entity_type['name'] if entity_type else None
+
+            results[item.id] = {
+                'entity': entities_json.get(type_name, {}).get(item.entity_id),
+                'notification_entity_type': entity_type
+            }
+
+        return results
+
 
 class NotificationEntityType(BaseModel, LookUp):
     """Whether it's a User, Post, Status"""
@@ -363,11 +780,13 @@ class NotificationEvent(BaseModel, LookUp):
     __tablename__ = 'notification_events'
 
 
-class Post(BaseModel, HasLocation):
+class Post(BaseModel, HasLocation, HasStripedCounters):
     __tablename__ = 'posts'
 
     text = db.Column(db.TEXT)
     comments_enabled = db.Column(db.Boolean, default=True)
+    like_count = db.Column(db.Integer, default=0)
+    comment_count = db.Column(db.Integer, default=0)
 
     collection_id = db.Column(db.Integer, db.ForeignKey('collections.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -389,19 +808,59 @@ class Post(BaseModel, HasLocation):
         return Comment.query.filter_by(post_id=self.id)
 
     def as_json(self):
-        return {
-            'text': self.text,
-            'comments_enabled': self.comments_enabled,
-            'user': self.user.as_json(),
-            'slides': self.post_slides,
-            'location': self.location.as_json(),
-            'likes': {
-                'count': self.likes().count()
-            },
-            'comments': {
-                'count': self.comments().count()
-            }
-        }
+        return Post.bulk_as_json([self])[0]
+
+    @classmethod
+    def bulk_as_json(cls, posts):
+        """Serialize `posts` with a fixed number of queries, however many
+        posts there are"""
+        posts = list(posts)
+        post_ids = [post.id for post in posts]
+
+        users = _load_by_ids(User, [post.user_id for post in posts])
+        users_json = dict(zip(
+            users.keys(), User.bulk_as_json(users.values())))
+        locations = _load_by_ids(
+            Location, [post.location_id for post in posts])
+
+        slides = defaultdict(list)
+        if post_ids:
+            post_slides = PostSlide.query.options(
+                db.joinedload(PostSlide.blob)
+            ).filter(
+                PostSlide.post_id.in_(post_ids)
+            ).order_by(
+                PostSlide.id
+            ).all()
+
+            blobs_json = Blob.bulk_as_json(
+                slide.blob for slide in post_slides)
+            for slide, blob_json in zip(post_slides, blobs_json):
+                slides[slide.post_id].append(blob_json)
+
+        counters = cls.bulk_counter_values(
+            posts, ('like_count', 'comment_count'))
+
+        results = []
+        for post in posts:
+            location = locations.get(post.location_id)
+
+            results.append({
+                'uid': post.uid,
+                'text': post.text,
+                'comments_enabled': post.comments_enabled,
+                'user': users_json.get(post.user_id),
+                'slides': slides[post.id],
+                'location': location.as_json() if location else None,
+                'likes': {
+                    'count': counters[(post.id, 'like_count')]
+                },
+                'comments': {
+                    'count': counters[(post.id, 'comment_count')]
+                }
+            })
+
+        return results
 
 
 class PostSlide(BaseModel):
@@ -442,20 +901,39 @@ class Story(BaseModel, HasLocation):
 
     @hybrid_property
     def has_expired(self):
-        return datetime.utcnow() - timedelta(days=1) < self.created_at
+        return self.created_at < datetime.utcnow() - timedelta(days=1)
 
     def user_can_comment(self, user):
         return self.replies_enabled and user.id not in loads(
             user.blocked_users)
 
     def as_json(self):
-        return {
-            'blob': self.blob.url,
-            'user': self.user.uid,
+        return Story.bulk_as_json([self])[0]
+
+    @classmethod
+    def bulk_as_json(cls, stories):
+        stories = list(stories)
+
+        blobs = _load_by_ids(Blob, [story.blob_id for story in stories])
+        blobs_json = dict(zip(blobs.keys(), Blob.bulk_as_json(blobs.values())))
+        user_uids = {
+            user.id: user.uid for user in _load_by_ids(
+                User, [story.user_id for story in stories]).values()
         }
 
+        # `blob` stays the bare URL clients already read
+        return [
+            {
+                'blob': blobs_json.get(story.blob_id, {}).get('url'),
+                'blob_variants': blobs_json.get(
+                    story.blob_id, {}).get('variants', {}),
+                'user': user_uids.get(story.user_id),
+            }
+            for story in stories
+        ]
+
 
-class User(BaseModel, HasToken, HasLocation):
+class User(BaseModel, HasToken, HasLocation, HasStripedCounters):
     """Users of the social network"""
     __tablename__ = 'users'
 
@@ -470,14 +948,15 @@ class User(BaseModel, HasToken, HasLocation):
     profile_photo_id = db.Column(db.Integer, db.ForeignKey('blobs.id'))
     blocked_users = db.Column(db.TEXT)
     blocked_story_repliers = db.Column(db.TEXT)
+    unread_notification_count = db.Column(db.Integer, default=0)
 
     created_by = db.Column(db.Integer, db.ForeignKey('apps.id'))
 
     profile_photo = db.relationship('Blob', uselist=False)
     followed = db.relationship(
         'User', secondary=followers,
-        primaryjoin=(followers.c.follower_id == id),
-        secondaryjoin=(followers.c.followed_id == id),
+        primaryjoin='followers.c.follower_id == User.id',
+        secondaryjoin='followers.c.followed_id == User.id',
         backref=db.backref('followers', lazy='dynamic'), lazy='dynamic')
 
     @property
@@ -489,30 +968,46 @@ class User(BaseModel, HasToken, HasLocation):
             followers.c.followed_id == user.id).count() > 0
 
     def as_json(self, keys_to_exclude=None):
-        collections = self.collections()
+        return User.bulk_as_json([self], keys_to_exclude=keys_to_exclude)[0]
 
-        result = {
-            'uid': self.uid,
-            'name': self.name,
-            'email': self.email,
-            'email_confirmed': self.email_confirmed,
-            'phone': self.phone,
-            'phone_confirmed': self.phone_confirmed,
-            'profile_photo': self.profile_photo,
-            'created_at': self.created_at.isoformat(),
-            'collections': {
-                'count': self.collections.count(),
-                'uid': None
-            }
-        }
+    @classmethod
+    def bulk_as_json(cls, users, keys_to_exclude=None):
+        users = list(users)
 
-        if isinstance(keys_to_exclude, (list, tuple, set)):
-            map(lambda excluded: result.pop(excluded, None), keys_to_exclude)
+        collection_counts = _count_by(
+            Collection.user_id, [user.id for user in users])
+        profile_photos = _load_by_ids(
+            Blob, [user.profile_photo_id for user in users])
+        profile_photos_json = dict(zip(
+            profile_photos.keys(), Blob.bulk_as_json(profile_photos.values())))
 
         if isinstance(keys_to_exclude, str):
-            result.pop(keys_to_exclude, None)
+            keys_to_exclude = [keys_to_exclude]
+
+        results = []
+        for user in users:
+            result = {
+                'uid': user.uid,
+                'name': user.name,
+                'email': user.email,
+                'email_confirmed': user.email_confirmed,
+                'phone': user.phone,
+                'phone_confirmed': user.phone_confirmed,
+                'profile_photo': profile_photos_json.get(
+                    user.profile_photo_id),
+                'created_at': user.created_at.isoformat(),
+                'collections': {
+                    'count': collection_counts.get(user.id, 0),
+                    'uid': None
+                }
+            }
 
-        return result
+            for excluded in keys_to_exclude or []:
+                result.pop(excluded, None)
+
+            results.append(result)
+
+        return results
 
     @classmethod
     def get_for_auth(cls, **filter_args):
@@ -524,17 +1019,50 @@ class User(BaseModel, HasToken, HasLocation):
 
         return user
 
+    @classmethod
+    def get_unread_notification_count(cls, user_id):
+        """Read `user_id`'s unread notification counter, which doesn't
+        touch `notifications`"""
+        row = db.session.query(
+            cls.id, cls.unread_notification_count
+        ).filter(
+            cls.id == user_id
+        ).first()
+
+        if row is None:
+            return 0
+
+        counters = cls.bulk_counter_values(
+            [row], ('unread_notification_count',))
+
+        return max(counters[(user_id, 'unread_notification_count')], 0)
+
+    def snapshot(self):
+        """Return the columns `UserSnapshot` needs, safe to share between
+        requests"""
+        return {
+            'id': self.id,
+            'uid': self.uid,
+            'name': self.name,
+            'status_id': self.status_id
+        }
+
     @property
     def password(self):
         return self.password_hash
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(
-            password, method='pbkdf2:sha512')
+        self.password_hash = get_password_hasher().hash(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        verified = get_password_hasher().verify(self.password_hash, password)
+
+        # Upgrade hashes made with old parameters while we have the password
+        if verified and needs_rehash(self.password_hash):
+            self.update(password=password)
+
+        return verified
 
     def generate_auth_token(self, expiration=None):
         expiration = expiration or current_app.config['TOKEN_LIFESPAN']
@@ -544,3 +1072,39 @@ class User(BaseModel, HasToken, HasLocation):
         expires_on = datetime.fromtimestamp(time.time() + expiration)
 
         return s.dumps({'id': self.id}).decode('utf-8'), expires_on
+
+
+class UserSnapshot(object):
+    """A cached, authenticated `User`.
+
+    Only the columns in `User.snapshot` are held; any other attribute is
+    read from the full row, loaded on first use.
+    """
+
+    def __init__(self, **columns):
+        self.__dict__.update(columns)
+        self._user = None
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        if self._user is None:
+            self._user = User.query.get(self.id)
+
+        return getattr(self._user, name)
+
+    def __eq__(self, other):
+        return isinstance(other, (User, UserSnapshot)) and other.id == self.id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def is_active(self):
+        return self.status_id == ACTIVE_STATUS_ID
+
+    def is_deleted(self):
+        return self.status_id == DELETED_STATUS_ID
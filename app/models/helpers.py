@@ -1,20 +1,102 @@
+from datetime import datetime
+
 from flask import request
-from . import APILog
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.constants import (
+    ACCESS_LOG_BATCH_SIZE, ACCESS_LOG_FLUSH_INTERVAL, ACCESS_LOG_QUEUE_SIZE)
+from app.logs import logger
+from utils import metrics
+from utils.workers import BackgroundWorker
+from . import AccessLog
+
+
+def insert_ignoring_duplicates(table, rows):
+    """Insert `rows` into `table` in one statement, skipping any that
+    would violate a unique constraint"""
+    if not rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).on_conflict_do_nothing()
+    elif dialect == 'mysql':
+        statement = table.insert().prefix_with('IGNORE')
+    elif dialect == 'sqlite':
+        statement = table.insert().prefix_with('OR IGNORE')
+    else:
+        statement = table.insert()
+
+    db.session.execute(statement, rows)
+
+
+def fit_to_columns(model, record):
+    """Truncate the strings in `record` to the lengths of `model`'s
+    columns, so one long value can't fail a bulk insert"""
+    columns = model.__table__.columns
 
+    for key, value in record.items():
+        length = getattr(columns[key].type, 'length', None) \
+            if key in columns else None
+        if length and isinstance(value, str) and len(value) > length:
+            record[key] = value[:length]
 
-def create_api_log():
-    """Record API call and metadata."""
-    from utils.contexts import get_current_request_data
+    return record
+
+
+def _write_api_logs(records):
+    try:
+        db.session.bulk_insert_mappings(AccessLog, records)
+        db.session.commit()
+        return
+    except SQLAlchemyError:
+        db.session.rollback()
+        logger.error(
+            'Could not write {} access logs at once; retrying one by '
+            'one'.format(len(records)), exc_info=True)
+
+    # Only the rows that fail on their own are dropped
+    for record in records:
+        try:
+            db.session.bulk_insert_mappings(AccessLog, [record])
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            metrics.increment('access-log-writer.rejected')
+            logger.error(
+                'Dropping access log {}'.format(record.get('api_ref')),
+                exc_info=True)
+
+
+api_log_writer = BackgroundWorker(
+    'access-log-writer', _write_api_logs,
+    max_queue_size=ACCESS_LOG_QUEUE_SIZE,
+    batch_size=ACCESS_LOG_BATCH_SIZE,
+    flush_interval=ACCESS_LOG_FLUSH_INTERVAL)
+
+
+def create_api_log(endpoint, user_id, cost, response_data=None):
+    """Queue the API call and its metadata to be written in bulk."""
+    from utils import generate_unique_reference
+    from utils.contexts import get_current_api_ref, get_current_request_data
 
     request_data = {
         'args': request.args,
         'body': get_current_request_data()
     }
 
-    api_log = APILog(
+    return api_log_writer.submit(fit_to_columns(AccessLog, dict(
+        api_ref=get_current_api_ref(),
+        uid=generate_unique_reference(),
+        created_at=datetime.utcnow(),
+        modified_at=datetime.utcnow(),
+        endpoint=endpoint,
+        cost=cost,
+        created_by_id=user_id,
         request_data=str(request_data),
-        request_headers=str(request.headers)
-    )
-    api_log.save()
-
-    return api_log
+        request_headers=str(request.headers),
+        response_data=str(response_data)
+    )))
@@ -1,13 +1,89 @@
+import random
+from collections import defaultdict
+
 from flask import current_app
 from itsdangerous import BadSignature, SignatureExpired
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
+from sqlalchemy import event
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 from app import db, errors, logger
+from app.constants import COUNTER_SHARD_COUNT, COUNTER_STRIPING_THRESHOLD
 from app.constants import statuses
 
 
+counter_shards = db.Table(
+    'counter_shards', db.metadata,
+    db.Column('entity_type', db.String(32)),
+    db.Column('entity_id', db.Integer),
+    db.Column('name', db.String(32)),
+    db.Column('shard', db.Integer),
+    db.Column('count', db.Integer, default=0),
+    db.UniqueConstraint(
+        'entity_type', 'entity_id', 'name', 'shard',
+        name='counter_shards_unique_index')
+)
+
+
+_persistence_listeners = defaultdict(list)
+
+
+def on_persistence_change(model_name):
+    """Register a function to be called with any `model_name` record that
+    is saved, updated or deleted through `Persistence`, once the change is
+    committed"""
+    def decorator(func):
+        _persistence_listeners[model_name].append(func)
+        return func
+
+    return decorator
+
+
+def _notify_persistence_listeners(record):
+    """Queue `record` for its listeners until the session commits"""
+    changes = db.session.info.setdefault('persistence_changes', [])
+    if not any(change is record for change in changes):
+        changes.append(record)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _load_changed_records(session):
+    if session.transaction.nested or \
+            not session.info.get('persistence_changes'):
+        return
+
+    # Listeners run after the commit, when no SQL can be emitted, so they
+    # need every attribute loaded by then
+    session.flush()
+    for record in session.info['persistence_changes']:
+        state = db.inspect(record)
+        if state.persistent and state.expired_attributes:
+            session.refresh(record)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _run_persistence_listeners(session):
+    if session.transaction.nested:
+        return
+
+    for record in session.info.pop('persistence_changes', []):
+        for listener in _persistence_listeners[type(record).__name__]:
+            try:
+                listener(record)
+            except Exception:
+                logger.error(
+                    'Persistence listener {} failed'.format(
+                        listener.__name__),
+                    exc_info=True)
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _forget_uncommitted_changes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('persistence_changes', None)
+
+
 def _commit_to_db():
     try:
         db.session.commit()
@@ -20,9 +96,7 @@ def _commit_to_db():
 class HasLocation(object):
     @declared_attr
     def location_id(self):
-        return db.Column(
-            db.Integer, db.ForeignKey('locations.id'),
-            default=statuses.ACTIVE_STATUS_ID)
+        return db.Column(db.Integer, db.ForeignKey('locations.id'))
 
     @declared_attr
     def location(self):
@@ -30,6 +104,158 @@ class HasLocation(object):
             'Location', lazy=True, foreign_keys=[self.location_id])
 
 
+class HasStripedCounters(object):
+    """Denormalized counter columns maintained on write.
+
+    Once a counter passes `COUNTER_STRIPING_THRESHOLD`, increments go to one
+    of `COUNTER_SHARD_COUNT` rows in `counter_shards` picked at random, so
+    concurrent writers on a hot row don't queue on a single row lock. The
+    true value is the column plus the sum of its shards.
+    """
+
+    @classmethod
+    def _shard_clause(cls, ids, name):
+        return db.and_(
+            counter_shards.c.entity_type == cls.__tablename__,
+            counter_shards.c.entity_id.in_(ids),
+            counter_shards.c.name == name)
+
+    @classmethod
+    def increment_counter(cls, id_, name, delta=1):
+        cls.increment_counters([id_], name, delta)
+
+    @classmethod
+    def increment_counters(cls, ids, name, delta=1):
+        """Add `delta` to counter `name` of every record in `ids`, with one
+        UPDATE for all those under the striping threshold"""
+        ids = set(ids)
+        if not ids:
+            return
+
+        column = getattr(cls, name)
+
+        hot_ids = {
+            row[0] for row in db.session.query(
+                cls.id
+            ).filter(
+                cls.id.in_(ids),
+                column >= COUNTER_STRIPING_THRESHOLD
+            )
+        }
+
+        if ids - hot_ids:
+            cls.query.filter(
+                cls.id.in_(ids - hot_ids)
+            ).update(
+                {column: db.func.coalesce(column, 0) + delta},
+                synchronize_session=False
+            )
+
+        for id_ in hot_ids:
+            cls._increment_shard(id_, name, delta)
+
+    @classmethod
+    def _increment_shard(cls, id_, name, delta):
+        shard = random.randrange(COUNTER_SHARD_COUNT)
+        update_shard = counter_shards.update().where(
+            db.and_(
+                cls._shard_clause([id_], name),
+                counter_shards.c.shard == shard)
+        ).values(
+            count=counter_shards.c.count + delta
+        )
+
+        if db.session.execute(update_shard).rowcount:
+            return
+
+        try:
+            with db.session.begin_nested():
+                db.session.execute(counter_shards.insert().values(
+                    entity_type=cls.__tablename__, entity_id=id_, name=name,
+                    shard=shard, count=delta))
+        except IntegrityError:
+            # Another writer created the shard first
+            db.session.execute(update_shard)
+
+    @classmethod
+    def bulk_counter_values(cls, records, names):
+        """Return `{(id, name): value}` for `records` in one query"""
+        records = list(records)
+        ids = [record.id for record in records]
+
+        values = {
+            (record.id, name): getattr(record, name) or 0
+            for record in records for name in names
+        }
+
+        if not ids:
+            return values
+
+        shard_sums = db.session.query(
+            counter_shards.c.entity_id,
+            counter_shards.c.name,
+            db.func.sum(counter_shards.c.count)
+        ).filter(
+            counter_shards.c.entity_type == cls.__tablename__,
+            counter_shards.c.entity_id.in_(ids),
+            counter_shards.c.name.in_(names)
+        ).group_by(
+            counter_shards.c.entity_id,
+            counter_shards.c.name
+        )
+
+        for id_, name, total in shard_sums:
+            values[(id_, name)] += total or 0
+
+        return values
+
+    @classmethod
+    def reconcile_counter(cls, name, counted_column, ids, *criteria,
+                          _commit=True):
+        """Recompute counter `name` for `ids` from the rows it counts, those
+        matching `criteria` if given.
+
+        The shards are left alone: the column is set to the count less
+        their sum, both read by one statement, so an increment that lands
+        on a shard meanwhile is never lost.
+        """
+        ids = list(ids)
+        if not ids:
+            return
+
+        # Plain increments of the column wait until this commits
+        db.session.query(
+            cls.id
+        ).filter(
+            cls.id.in_(ids)
+        ).with_for_update().all()
+
+        counted = db.select([
+            db.func.count()
+        ]).where(
+            db.and_(counted_column == cls.id, *criteria)
+        ).as_scalar()
+
+        striped = db.select([
+            db.func.coalesce(db.func.sum(counter_shards.c.count), 0)
+        ]).where(
+            db.and_(
+                counter_shards.c.entity_type == cls.__tablename__,
+                counter_shards.c.entity_id == cls.id,
+                counter_shards.c.name == name)
+        ).as_scalar()
+
+        cls.query.filter(
+            cls.id.in_(ids)
+        ).update(
+            {getattr(cls, name): counted - striped},
+            synchronize_session=False
+        )
+
+        if _commit:
+            _commit_to_db()
+
+
 class HasStatus(object):
     @declared_attr
     def status_id(self):
@@ -80,6 +306,8 @@ class Persistence(object):
 
     def save(self, _commit=True):
         db.session.add(self)
+        _notify_persistence_listeners(self)
+
         if _commit:
             _commit_to_db()
 
@@ -87,6 +315,7 @@ class Persistence(object):
         setattr(self, 'status_id', statuses.DELETED_STATUS_ID)
 
         db.session.delete(self)
+        _notify_persistence_listeners(self)
 
         if _commit:
             _commit_to_db()
@@ -96,5 +325,7 @@ class Persistence(object):
 
         for k, v in kwargs.items():
             setattr(self, k, v)
+        _notify_persistence_listeners(self)
+
         if _commit:
             _commit_to_db()
@@ -1,11 +1,15 @@
 from flask import Blueprint
 
-from modules import StoriesView
+from modules import (
+    BlobsView, HashTagsView, MetricsView, NearbyPostsView, NearbyStoriesView,
+    NotificationsView, PostSearchView, ReadNotificationsView, StoriesView,
+    TrendingHashTagsView, TypeaheadView, UnreadNotificationCountView,
+    UploadsView)
 from app.constants import APP_NAME
 from utils.response_helpers import api_success_response
 
 
-api_blueprint = Blueprint(__name__, 'api_blueprint', url_prefix='/api/v1.0')
+api_blueprint = Blueprint('api_blueprint', __name__, url_prefix='/api/v1.0')
 
 
 @api_blueprint.route('/')
@@ -14,8 +18,22 @@ def render_welcome_greeting():
 
 
 mappings = [
+    ('/blobs/<blob_uid>', BlobsView, 'blob'),
+    ('/hashtags/trending', TrendingHashTagsView, 'trending_hash_tags'),
+    ('/hashtags/<hash_tag>', HashTagsView, 'hash_tag'),
+    ('/metrics', MetricsView, 'metrics'),
+    ('/notifications', NotificationsView, 'notifications'),
+    ('/notifications/read', ReadNotificationsView, 'read_notifications'),
+    ('/notifications/unread_count', UnreadNotificationCountView,
+     'unread_notification_count'),
+    ('/posts/nearby', NearbyPostsView, 'nearby_posts'),
+    ('/search/posts', PostSearchView, 'post_search'),
     ('/stories', StoriesView, 'stories'),
+    ('/stories/nearby', NearbyStoriesView, 'nearby_stories'),
     ('/stories/<story_uid>', StoriesView, 'story'),
+    ('/typeahead', TypeaheadView, 'typeahead'),
+    ('/uploads', UploadsView, 'uploads'),
+    ('/uploads/<upload_uid>', UploadsView, 'upload'),
 ]
 
 
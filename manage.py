@@ -1,21 +1,51 @@
 #! /usr/bin/env python
+import calendar
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 from flask_migrate import Migrate, MigrateCommand
 from flask_script import Manager
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
 
 from app import db
+from app.constants import (
+    BLOB_UPLOAD_LIFESPAN, GEOCODING_BATCH_SIZE, TRENDING_RETENTION_SECONDS)
+from app.constants.statuses import (
+    DELETED_STATUS_ID, FAILED_STATUS_ID, PENDING_STATUS_ID, READ_STATUS_ID)
 from app.models import (
     App,
     AppCategory,
+    Blob,
+    BlobUpload,
+    Comment,
+    CommentReply,
     Currency,
+    HashTag,
+    Like,
+    Location,
     MemberCategory,
+    Notification,
+    Post,
     Pricing,
     ProductCategory,
     Skill,
     Status,
-    StoreCategory)
+    StoreCategory,
+    User,
+    hash_tag_posts)
 from modules.apps import AppsRoute
+from utils.derivatives import get_derivative_pipeline
+from utils.geo import distance_expression, encode_geohash, within_radius
+from utils.geocoding import resolve_locations
+from utils.passwords import PasswordHasher
+from utils.search import create_search_index, index_documents
+from utils.timelines import rebuild_timeline
+from utils.trending import (
+    TrendingHashTags, get_snapshot_path, remove_worker_snapshots)
 from wsgi import application
 
 
@@ -202,6 +232,315 @@ def pump_pricings_table():
         Pricing(**pricing).save()
 
 
+@manager.command
+def rebuild_timelines(user_id=None):
+    """Re-materialize the home timeline of one user, or of every user"""
+    print('timelines')
+
+    if user_id is not None:
+        rebuild_timeline(int(user_id))
+        return
+
+    user_ids = [
+        row[0] for row in db.session.query(User.id).order_by(User.id)]
+
+    for index, id_ in enumerate(user_ids, 1):
+        rebuild_timeline(id_)
+
+        if index % 1000 == 0:
+            print('{} of {} timelines rebuilt'.format(index, len(user_ids)))
+
+
+def _batched_ids(model, batch_size, *criteria):
+    last_id = 0
+
+    while True:
+        ids = [
+            row[0] for row in db.session.query(model.id).filter(
+                model.id > last_id, *criteria
+            ).order_by(
+                model.id
+            ).limit(
+                batch_size
+            )
+        ]
+
+        if not ids:
+            return
+
+        yield ids
+        last_id = ids[-1]
+
+
+@manager.command
+def reconcile_counters(batch_size=1000):
+    """Recompute denormalized like, comment, reply and unread notification
+    counts"""
+    print('counters')
+
+    batch_size = int(batch_size)
+
+    for ids in _batched_ids(Post, batch_size):
+        Post.reconcile_counter('like_count', Like.post_id, ids, _commit=False)
+        Post.reconcile_counter('comment_count', Comment.post_id, ids)
+
+    for ids in _batched_ids(Comment, batch_size):
+        Comment.reconcile_counter(
+            'reply_count', CommentReply.comment_id, ids)
+
+    unread = Notification.status_id.notin_(
+        [READ_STATUS_ID, DELETED_STATUS_ID])
+    for ids in _batched_ids(User, batch_size):
+        User.reconcile_counter(
+            'unread_notification_count', Notification.user_id, ids, unread)
+
+
+@manager.command
+def benchmark_password_hashing(pool_sizes='0,1,2,4', logins=200,
+                               concurrency=16):
+    """Measure login verification throughput at several pool sizes"""
+    logins = int(logins)
+    password_hash = PasswordHasher(0).hash('benchmark-password')
+
+    for pool_size in [int(size) for size in pool_sizes.split(',')]:
+        hasher = PasswordHasher(pool_size)
+        hasher.verify(password_hash, 'benchmark-password')  # warm the pool
+
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(int(concurrency)) as request_threads:
+            list(request_threads.map(
+                lambda _: hasher.verify(password_hash, 'benchmark-password'),
+                range(logins)))
+        elapsed = time.monotonic() - started_at
+
+        hasher.shutdown()
+
+        print('pool size {:>2}: {:8.1f} logins/s ({:.3f}s for {})'.format(
+            pool_size, logins / elapsed, elapsed, logins))
+
+
+@manager.command
+def replay_trending_hash_tags(batch_size=10000):
+    """Rebuild the trending hash tag sketches from `hash_tag_posts`.
+
+    The replay replaces the workers' own snapshots, which it already
+    covers, so run it while the workers are stopped.
+    """
+    print('trending hash tags')
+
+    tracker = TrendingHashTags()
+    since = datetime.utcnow() - timedelta(seconds=TRENDING_RETENTION_SECONDS)
+
+    usages = db.session.query(
+        HashTag.entity, Post.created_at
+    ).join(
+        hash_tag_posts, hash_tag_posts.c.hash_tag_id == HashTag.id
+    ).join(
+        Post, Post.id == hash_tag_posts.c.post_id
+    ).filter(
+        Post.created_at >= since
+    ).yield_per(
+        int(batch_size)
+    )
+
+    for entity, created_at in usages:
+        tracker.record(
+            [entity],
+            timestamp=calendar.timegm(created_at.utctimetuple()))
+
+    path = get_snapshot_path()
+    tracker.save(path)
+    remove_worker_snapshots(path)
+
+
+@manager.command
+def reindex_search(batch_size=1000):
+    """Rebuild the full-text search documents of every post and comment"""
+    print('search index')
+
+    batch_size = int(batch_size)
+    create_search_index()
+
+    for entity_type, model in [('post', Post), ('comment', Comment)]:
+        for ids in _batched_ids(model, batch_size):
+            index_documents(entity_type, ids)
+
+
+@manager.command
+def regeocode_locations(batch_size=GEOCODING_BATCH_SIZE,
+                        include_pending=False):
+    """Retry reverse geocoding of locations that failed to resolve.
+
+    Pass `include_pending` to also pick up locations whose job was lost,
+    e.g. when a worker restarted before its queue drained.
+    """
+    print('locations')
+
+    status_ids = [FAILED_STATUS_ID]
+    if include_pending:
+        status_ids.append(PENDING_STATUS_ID)
+
+    for ids in _batched_ids(
+            Location, int(batch_size),
+            Location.resolution_status_id.in_(status_ids)):
+        resolve_locations(ids)
+
+
+@manager.command
+def index_locations(batch_size=1000):
+    """Compute the geohash of every location that has coordinates"""
+    print('location geohashes')
+
+    for ids in _batched_ids(
+            Location, int(batch_size), Location.latitude.isnot(None)):
+        for location in Location.query.filter(Location.id.in_(ids)):
+            location.geohash = encode_geohash(
+                location.latitude, location.longitude)
+
+        db.session.commit()
+
+
+@manager.command
+def benchmark_nearby_queries(locations=1000000, queries=200, radius=5.0,
+                             scans=10):
+    """Compare geohash cell lookups with full scans over synthetic locations
+    in an in-memory SQLite database"""
+    locations, queries, scans = int(locations), int(queries), int(scans)
+    radius = float(radius)
+
+    engine = create_engine('sqlite://')
+    Location.__table__.create(bind=engine)
+    session = Session(bind=engine)
+    generator = random.Random(0)
+
+    # Cluster points around cities so cells see realistic densities
+    cities = [
+        (generator.uniform(-60, 60), generator.uniform(-170, 170))
+        for _ in range(200)
+    ]
+
+    def random_point():
+        latitude, longitude = generator.choice(cities)
+
+        return (latitude + generator.gauss(0, 0.3),
+                longitude + generator.gauss(0, 0.3))
+
+    started_at = time.monotonic()
+    rows = []
+    for id_ in range(1, locations + 1):
+        latitude, longitude = random_point()
+        rows.append(dict(
+            id=id_, uid=str(id_), latitude=latitude, longitude=longitude,
+            geohash=encode_geohash(latitude, longitude)))
+
+        if len(rows) == 50000 or id_ == locations:
+            session.execute(Location.__table__.insert(), rows)
+            rows = []
+
+    session.commit()
+    print('inserted {} locations in {:.1f}s'.format(
+        locations, time.monotonic() - started_at))
+
+    def run(count, use_cells):
+        timings, matches = [], 0
+
+        for _ in range(count):
+            latitude, longitude = random_point()
+            distance = distance_expression(Location, latitude, longitude)
+
+            criteria = within_radius(Location, latitude, longitude, radius)
+            if not use_cells:
+                criteria = criteria[-1:]
+
+            started_at = time.monotonic()
+            matches += len(session.query(
+                Location.id, distance
+            ).filter(
+                *criteria
+            ).order_by(
+                distance, Location.id
+            ).limit(
+                20
+            ).all())
+            timings.append(time.monotonic() - started_at)
+
+        timings.sort()
+        print('{:>10}: p50 {:7.2f}ms  p95 {:7.2f}ms  {:.1f} results'.format(
+            'cells' if use_cells else 'full scan',
+            timings[len(timings) // 2] * 1000,
+            timings[int(len(timings) * 0.95)] * 1000,
+            matches / float(count)))
+
+    run(queries, use_cells=True)
+    run(scans, use_cells=False)
+
+
+@manager.command
+def migrate_blobs(batch_size=100):
+    """Move payloads stored inline in `blobs.data` to the blob store"""
+    print('blobs')
+
+    migrated = 0
+    legacy = [Blob.data.isnot(None), Blob.digest.is_(None)]
+
+    for ids in _batched_ids(Blob, int(batch_size), *legacy):
+        for blob in Blob.query.options(
+            db.undefer(Blob.data)
+        ).filter(
+            Blob.id.in_(ids)
+        ):
+            blob.move_to_store()
+
+        db.session.commit()
+        db.session.expunge_all()
+
+        migrated += len(ids)
+        print('{} blobs migrated'.format(migrated))
+
+
+@manager.command
+def generate_derivatives(batch_size=1000):
+    """Render the missing variants of every stored image and video"""
+    print('derivatives')
+
+    pipeline = get_derivative_pipeline()
+    stored = [Blob.digest.isnot(None), Blob.status_id != DELETED_STATUS_ID]
+
+    for ids in _batched_ids(Blob, int(batch_size), *stored):
+        for digest, mime_type in db.session.query(
+            Blob.digest, Blob.mime_type
+        ).filter(
+            Blob.id.in_(ids)
+        ):
+            pipeline.schedule(digest, mime_type)
+
+    # Wait for the pool to finish before the command exits
+    pipeline.shutdown()
+
+
+@manager.command
+def purge_stale_uploads(batch_size=1000):
+    """Discard the files of uploads that were never finalized in time"""
+    print('uploads')
+
+    cutoff = datetime.utcnow() - timedelta(seconds=BLOB_UPLOAD_LIFESPAN)
+    stale = [
+        BlobUpload.status_id.in_([PENDING_STATUS_ID, FAILED_STATUS_ID]),
+        BlobUpload.created_at < cutoff
+    ]
+
+    for ids in _batched_ids(BlobUpload, int(batch_size), *stale):
+        uploads = BlobUpload.query.filter(BlobUpload.id.in_(ids)).all()
+
+        for upload in uploads:
+            if os.path.exists(upload.path):
+                os.remove(upload.path)
+
+            upload.status_id = DELETED_STATUS_ID
+
+        db.session.commit()
+
+
 @manager.command
 def run_all_commands():
     pump_statuses_table()
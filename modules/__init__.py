@@ -1 +1,10 @@
-from .stories import StoriesView
+from .blobs import BlobsView
+from .hashtags import HashTagsView, TrendingHashTagsView
+from .metrics import MetricsView
+from .notifications import (
+    NotificationsView, ReadNotificationsView, UnreadNotificationCountView)
+from .posts import NearbyPostsView
+from .search import PostSearchView
+from .stories import NearbyStoriesView, StoriesView
+from .typeahead import TypeaheadView
+from .uploads import UploadsView
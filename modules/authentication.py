@@ -1,12 +1,69 @@
 from functools import wraps
 
-from flask import current_app, request
+from flask import current_app, g, request
 from jwt import PyJWTError, ExpiredSignatureError
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 from flask_jwt_extended.exceptions import JWTExtendedException
 
 from app import errors, logger
-from app.models import App, User
+from app.constants import (
+    APP_CACHE_SIZE, APP_CACHE_TTL, AUTH_IDENTITY_CACHE_SIZE,
+    AUTH_IDENTITY_CACHE_TTL, UNKNOWN_API_KEY_CACHE_SIZE,
+    UNKNOWN_API_KEY_CACHE_TTL)
+from app.models import App, User, UserSnapshot
+from app.models.mixins import on_persistence_change
+from utils.caches import LRUCache
+
+
+# API key -> `App.snapshot()` of active apps
+_active_apps = LRUCache(
+    'auth.app_cache', max_size=APP_CACHE_SIZE, ttl=APP_CACHE_TTL,
+    index_by=lambda snapshot: snapshot['id'])
+
+# API keys that matched no active app, so bad clients can't hammer the DB
+_unknown_api_keys = LRUCache(
+    'auth.unknown_api_keys', max_size=UNKNOWN_API_KEY_CACHE_SIZE,
+    ttl=UNKNOWN_API_KEY_CACHE_TTL)
+
+# Token identity -> `User.snapshot()` of users whose tokens verified
+_verified_identities = LRUCache(
+    'auth.identity_cache', max_size=AUTH_IDENTITY_CACHE_SIZE,
+    ttl=AUTH_IDENTITY_CACHE_TTL, index_by=lambda snapshot: snapshot['id'])
+
+
+@on_persistence_change('App')
+def _forget_cached_app(app):
+    _active_apps.discard_indexed(app.id)
+    _unknown_api_keys.pop(app.api_key)
+
+
+@on_persistence_change('User')
+def _forget_verified_identity(user):
+    _verified_identities.discard_indexed(user.id)
+
+
+def preload_app_cache():
+    """Warm the api-key cache with the most recently created active apps"""
+    for app in App.prepare_get_active().limit(APP_CACHE_SIZE):
+        _active_apps.set(app.api_key, app.snapshot())
+
+
+def _get_app_for_api_key(api_key):
+    app = _active_apps.get(api_key)
+    if app is not None:
+        return app
+
+    if _unknown_api_keys.get(api_key) is not None:
+        return None
+
+    app = App.get_active(api_key=api_key)
+    if app is None:
+        _unknown_api_keys.set(api_key, True)
+        return None
+
+    _active_apps.set(api_key, app.snapshot())
+
+    return app.snapshot()
 
 
 def _do_basic_auth():
@@ -43,7 +100,18 @@ def _do_bearer_auth():
         logger.critical('PyJWTError: {}'.format(err), exc_info=True)
         raise errors.InvalidAuthToken
 
-    return User.get_for_auth(username=get_jwt_identity())
+    identity = get_jwt_identity()
+
+    snapshot = _verified_identities.get(identity)
+    if snapshot is not None:
+        g.user = UserSnapshot(**snapshot)
+        return g.user
+
+    user = User.get_for_auth(username=identity)
+    if user is not None:
+        _verified_identities.set(identity, user.snapshot())
+
+    return user
 
 
 def _authenticate_user(obtaining_token):
@@ -55,7 +123,7 @@ def _authenticate_user(obtaining_token):
     if user is None:
         raise errors.UnsuccessfulAuthentication
 
-    if not user.is_deleted():
+    if user.is_deleted():
         raise errors.DeletedResource
 
     return user
@@ -72,7 +140,7 @@ def app_auth_required():
                 raise errors.UnauthorizedError(
                     '`api-key` must be sent in headers')
 
-            app = App.get_active(api_key=api_key)
+            app = _get_app_for_api_key(api_key)
 
             if app is None:
                 raise errors.BadRequest('`api-key` is invalid')
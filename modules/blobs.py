@@ -0,0 +1,73 @@
+import io
+import time
+
+from flask import send_file
+from flask.views import MethodView
+
+from app.constants import BLOB_VARIANTS
+from app.errors import BadRequest, ResourceNotFound
+from app.models import Blob
+from utils.blob_store import (
+    decode_legacy_payload, get_blob_store, has_variants)
+from utils.contexts import get_current_request_args
+from utils.derivatives import get_derivative_pipeline
+from utils.signed_urls import offload_response, verify_blob_signature
+
+
+class BlobsView(MethodView):
+    @staticmethod
+    def get_variant_path(blob, variant):
+        pipeline = get_derivative_pipeline()
+
+        path = pipeline.path(blob, variant)
+        if path is None:
+            # Render it for next time, in case the original job was lost
+            pipeline.schedule(blob.digest, blob.mime_type)
+
+        return path
+
+
+    def get(self, blob_uid):
+        """Hand a blob, or one of its smaller variants, to the front proxy.
+
+        The URL's signature stands in for authentication, so media can be
+        fetched by clients that can't send credentials.
+        """
+        request_args = get_current_request_args()
+
+        variant = request_args.get('variant')
+        expires = verify_blob_signature(
+            blob_uid, variant, request_args.get('expires'),
+            request_args.get('signature'))
+
+        if variant is not None and variant not in BLOB_VARIANTS:
+            raise BadRequest('`variant` should be one of {}'.format(
+                sorted(BLOB_VARIANTS)))
+
+        blob = Blob.get_active(uid=blob_uid)
+        if blob is None:
+            raise ResourceNotFound('Blob not found')
+
+        # Rows `migrate_blobs` hasn't reached yet are served from memory
+        if blob.digest is None:
+            return send_file(
+                io.BytesIO(decode_legacy_payload(blob.data or '')),
+                mimetype=blob.mime_type,
+                conditional=True)
+
+        path, mime_type = blob.path, blob.mime_type
+
+        if variant is not None and has_variants(blob.mime_type):
+            variant_path = self.get_variant_path(blob, variant)
+
+            if variant_path is not None:
+                path, mime_type = variant_path, 'image/jpeg'
+            elif not blob.mime_type.startswith('image/'):
+                # Only an image can stand in for its own rendition
+                raise ResourceNotFound('Variant is not ready yet')
+
+        response = offload_response(path, get_blob_store().root, mime_type)
+        response.cache_control.private = True
+        response.cache_control.max_age = max(int(expires - time.time()), 0)
+
+        return response
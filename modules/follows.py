@@ -1,12 +1,16 @@
 from flask.views import MethodView
 
+from app import db
 from app.models import HashTag, User
 from app.models import followers, hash_tag_followers
 from app.errors import ResourceNotFound, ResourceConflict
 from modules.authentication import user_auth_required
 from utils.contexts import get_current_user
+from utils.notifications import FOLLOW_EVENT, publish_event
 from utils.response_helpers import (
     api_created_response, api_deleted_response, api_success_response)
+from utils.timelines import invalidate_timeline
+from utils.typeahead import user_index
 
 
 class UserFollowsView(MethodView):
@@ -19,7 +23,7 @@ class UserFollowsView(MethodView):
             followers.c.followed_id == user.id).paginate()
 
         return api_success_response(
-            data=[user.as_json() for user in pagination],
+            data=User.bulk_as_json(pagination.items),
             meta=pagination.meta
         )
 
@@ -36,6 +40,11 @@ class UserFollowsView(MethodView):
             raise ResourceConflict('User already follows them.')
 
         user.followed.append(to_follow)
+        db.session.commit()
+
+        invalidate_timeline(user.id)
+        user_index.bump(to_follow.id)
+        publish_event(FOLLOW_EVENT, user.id, 'User', to_follow.id)
 
         return api_created_response()
 
@@ -49,6 +58,10 @@ class UserFollowsView(MethodView):
             raise ResourceNotFound('User not found')
 
         user.followed.remove(to_unfollow)
+        db.session.commit()
+
+        invalidate_timeline(user.id)
+        user_index.bump(to_unfollow.id, -1)
 
         return api_deleted_response()
 
@@ -59,12 +72,20 @@ class HashTagFollowsView(MethodView):
         """Get a list of hash tags being followed"""
         user = get_current_user()
 
-        pagination = user.hash_tags_followed.filter(
-            hash_tag_followers.c.followed_id == user.id
-        ).paginate()
+        pagination = db.session.query(
+            hash_tag_followers.c.hash_tag_id
+        ).filter(
+            hash_tag_followers.c.follower_id == user.id
+        ).paginate(
+            cursor_columns=(hash_tag_followers.c.hash_tag_id,),
+            cursor_only=True
+        )
+
+        hash_tags = HashTag.get_active_by_ids(
+            [row.hash_tag_id for row in pagination.items])
 
         return api_success_response(
-            data=[user.as_json() for user in pagination],
+            data=HashTag.bulk_as_json(hash_tags),
             meta=pagination.meta
         )
 
@@ -73,14 +94,16 @@ class HashTagFollowsView(MethodView):
         """Follow a hash tag"""
         user = get_current_user()
 
-        to_follow = HashTag.get_active(entity=hash_tag)
+        to_follow = HashTag.get_active(entity=hash_tag.lower())
         if to_follow is None:
             raise ResourceNotFound('Hash tag not found')
 
-        if user.is_following(to_follow):
+        if to_follow.is_followed_by(user):
             raise ResourceConflict('User already follows them.')
 
         user.hash_tags_followed.append(to_follow)
+        HashTag.increment_counter(to_follow.id, 'follower_count')
+        db.session.commit()
 
         return api_created_response()
 
@@ -89,10 +112,15 @@ class HashTagFollowsView(MethodView):
         """Unfollow a hash tag"""
         user = get_current_user()
 
-        to_unfollow = HashTag.get_active(entity=hash_tag)
+        to_unfollow = HashTag.get_active(entity=hash_tag.lower())
         if to_unfollow is None:
             raise ResourceNotFound('Hash tag not found')
 
+        if not to_unfollow.is_followed_by(user):
+            raise ResourceNotFound('User does not follow hash tag')
+
         user.hash_tags_followed.remove(to_unfollow)
+        HashTag.increment_counter(to_unfollow.id, 'follower_count', -1)
+        db.session.commit()
 
         return api_deleted_response()
@@ -1,26 +1,108 @@
 from flask.views import MethodView
 
+from .authentication import user_auth_required
+from app import db
 from app.constants import (
-    DEFAULT_HASH_TAG_FETCH_SCOPE, HASH_TAG_RETRIEVAL_SCOPES)
+    DEFAULT_HASH_TAG_FETCH_SCOPE, HASH_TAG_RETRIEVAL_SCOPES,
+    TRENDING_DEFAULT_LIMIT, TRENDING_DEFAULT_WINDOW, TRENDING_MAX_LIMIT,
+    TRENDING_WINDOWS)
 from app.errors import BadRequest, ResourceNotFound
-from app.models import HashTag
+from app.models import HashTag, Post, User
+from app.models import hash_tag_followers, hash_tag_posts
+from app.models.helpers import insert_ignoring_duplicates
 from utils.contexts import get_current_request_args
 from utils.response_helpers import api_success_response
+from utils.trending import get_trending_hash_tags
 
 
 class HashTagsView(MethodView):
     @staticmethod
-    def create_hash_tag(entity):
-        hash_tag = HashTag(entity=entity)
-        hash_tag.save()
+    def tag_post(post, entities):
+        """Get or create the `entities` hash tags and link them to `post`
+        without committing. Returns the hash tag ids."""
+        if not entities:
+            return []
 
-        return hash_tag
+        post.save(_commit=False)
+        db.session.flush()  # assigns post.id
+
+        insert_ignoring_duplicates(
+            HashTag.__table__, [dict(entity=entity) for entity in entities])
+
+        hash_tag_ids = [
+            row[0] for row in db.session.query(
+                HashTag.id
+            ).filter(
+                HashTag.entity.in_(entities)
+            )
+        ]
+
+        db.session.execute(hash_tag_posts.insert(), [
+            dict(hash_tag_id=hash_tag_id, post_id=post.id)
+            for hash_tag_id in hash_tag_ids
+        ])
+
+        HashTag.increment_counters(hash_tag_ids, 'post_count')
+
+        return hash_tag_ids
 
     @staticmethod
-    def add_post_to_hash_tag(post, hash_tag):
-        post.hash_tags.append(hash_tag)
+    def untag_post(post):
+        """Unlink `post` from its hash tags without committing"""
+        hash_tag_ids = [
+            row[0] for row in db.session.query(
+                hash_tag_posts.c.hash_tag_id
+            ).filter(
+                hash_tag_posts.c.post_id == post.id
+            )
+        ]
+
+        HashTag.increment_counters(hash_tag_ids, 'post_count', -1)
 
+        db.session.execute(
+            hash_tag_posts.delete().where(
+                hash_tag_posts.c.post_id == post.id))
+
+    @staticmethod
+    def get_hash_tag_posts(hash_tag):
+        pagination = db.session.query(
+            hash_tag_posts.c.post_id
+        ).filter(
+            hash_tag_posts.c.hash_tag_id == hash_tag.id
+        ).paginate(
+            cursor_columns=(hash_tag_posts.c.post_id,),
+            cursor_only=True
+        )
 
+        posts = Post.get_active_by_ids(
+            [row.post_id for row in pagination.items])
+
+        return {
+            'data': Post.bulk_as_json(posts),
+            'meta': pagination.meta
+        }
+
+    @staticmethod
+    def get_hash_tag_followers(hash_tag):
+        pagination = db.session.query(
+            hash_tag_followers.c.follower_id
+        ).filter(
+            hash_tag_followers.c.hash_tag_id == hash_tag.id
+        ).paginate(
+            cursor_columns=(hash_tag_followers.c.follower_id,),
+            cursor_only=True
+        )
+
+        users = User.get_active_by_ids(
+            [row.follower_id for row in pagination.items])
+
+        return {
+            'data': User.bulk_as_json(users),
+            'meta': pagination.meta
+        }
+
+
+    @user_auth_required()
     def get(self, hash_tag):
         """Retrieve posts about an hashtag"""
         request_args = get_current_request_args()
@@ -30,25 +112,49 @@ class HashTagsView(MethodView):
             raise BadRequest(
                 '`scope` must be one of {}'.format(HASH_TAG_RETRIEVAL_SCOPES))
 
-        hash_tag = HashTag.get_not_deleted(hash_tag=hash_tag)
+        hash_tag = HashTag.get_not_deleted(entity=hash_tag.lower())
         if hash_tag is None:
             raise ResourceNotFound('Hash tag not found')
 
         hash_tag_details = {
             'meta': lambda x: {
-                'data': None,
-                'meta': None
-            },
-            'posts': lambda y: {
-                'data': None,
+                'data': x.as_json(),
                 'meta': None
             },
-            'followers': lambda z: {
-                'data': None,
-                'meta': None
-            }
+            'posts': self.get_hash_tag_posts,
+            'followers': self.get_hash_tag_followers
         }
 
-        scoped_details = hash_tag_details[scope]()
+        scoped_details = hash_tag_details[scope](hash_tag)
 
         return api_success_response(**scoped_details)
+
+
+class TrendingHashTagsView(MethodView):
+    @user_auth_required()
+    def get(self):
+        """Retrieve the most used hash tags over a recent window"""
+        request_args = get_current_request_args()
+
+        window = request_args.get('window') or TRENDING_DEFAULT_WINDOW
+        if window not in TRENDING_WINDOWS:
+            raise BadRequest(
+                '`window` must be one of {}'.format(sorted(TRENDING_WINDOWS)))
+
+        try:
+            limit = int(request_args.get('limit') or TRENDING_DEFAULT_LIMIT)
+        except (TypeError, ValueError):
+            raise BadRequest('`limit` should be an integer.')
+
+        limit = max(1, min(limit, TRENDING_MAX_LIMIT))
+
+        trending = get_trending_hash_tags().top(
+            TRENDING_WINDOWS[window], limit)
+
+        return api_success_response(
+            data=[
+                {'entity': entity, 'count': count}
+                for entity, count in trending
+            ],
+            meta={'window': window}
+        )
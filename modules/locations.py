@@ -1,56 +1,64 @@
 from flask.views import MethodView
-from geopy.geocoders import Nominatim
 
 from .authentication import user_auth_required
 from app.constants import MIN_LOCATION_NAME_LENGTH
+from app.constants.statuses import PENDING_STATUS_ID
 from app.errors import BadRequest, ResourceNotFound
 from app.models import Location
 from utils.contexts import get_current_request_data
+from utils.geo import encode_geohash
+from utils.geocoding import geocoding_worker
 from utils.validators import check_coordinate_field, check_field_length
 
 
 class LocationsView(MethodView):
     @staticmethod
     def create_location(params):
-        geo_locator = Nominatim()
-
-        geo_location = geo_locator.reverse(
-            "{}, {}".format(params['longitude'], params['latitude'])
-        ).raw
-
-        geo_location_details = {
-            'city': geo_location['address']['suburb'],
-            'state_or_province': geo_location['address']['state'],
-            'country': geo_location['address']['country'],
-            'postal_code': geo_location['address']['postcode'],
-            'street_address': geo_location
-        }
-
-        params.update(geo_location_details)
-
         location = Location(
+            geohash=encode_geohash(params['latitude'], params['longitude']),
+            resolution_status_id=PENDING_STATUS_ID,
             **params
         )
 
         location.save()
 
+        geocoding_worker.submit(location.id)
+
         return location
 
     @staticmethod
     def edit_location(location, params):
+        params = {
+            key: value for key, value in params.items() if value is not None
+        }
+
+        coordinates_changed = any(
+            key in params and params[key] != getattr(location, key)
+            for key in ('latitude', 'longitude'))
+        if coordinates_changed:
+            params['geohash'] = encode_geohash(
+                params.get('latitude', location.latitude),
+                params.get('longitude', location.longitude))
+            params['resolution_status_id'] = PENDING_STATUS_ID
+
         location.update(**params)
 
+        if coordinates_changed:
+            geocoding_worker.submit(location.id)
+
         return location
 
 
     def __check_locations_params(self, request_data):
         latitude = request_data.get('latitude')
         if latitude is not None:
-            check_coordinate_field(latitude)
+            check_coordinate_field(latitude=latitude)
+            latitude = float(latitude)
 
         longitude = request_data.get('longitude')
         if longitude is not None:
-            check_coordinate_field(longitude)
+            check_coordinate_field(longitude=longitude)
+            longitude = float(longitude)
 
         name = request_data.get('name')
         if name is not None:
@@ -0,0 +1,12 @@
+from flask.views import MethodView
+
+from .authentication import app_auth_required
+from utils import metrics
+from utils.response_helpers import api_success_response
+
+
+class MetricsView(MethodView):
+    @app_auth_required()
+    def get(self):
+        """Report this worker process's counters and gauges"""
+        return api_success_response(data=metrics.snapshot())
@@ -1,9 +1,11 @@
 from flask.views import MethodView
 
 from .authentication import user_auth_required
-from app.errors import ResourceNotFound
+from app.constants import NOTIFICATIONS_READ_BATCH_LIMIT
+from app.errors import BadRequest, ResourceNotFound
 from app.models import Notification, User
-from utils.contexts import get_current_user
+from utils.contexts import get_current_request_data, get_current_user
+from utils.notifications import schedule_mark_as_read
 from utils.response_helpers import api_success_response
 
 
@@ -12,16 +14,71 @@ class NotificationsView(MethodView):
     def get(self):
         current_user = get_current_user()
 
-        pagination = Notification.query.filter(
+        pagination = Notification.prepare_get_not_deleted(
             user_id=current_user.id
         ).paginate()
 
-        data = []
-        for item in pagination.items:
-            item.mark_as_read()
-            data.append(item.as_json())
+        data = Notification.bulk_as_json(pagination.items)
+
+        # Marked read once the response is out, in a single UPDATE
+        schedule_mark_as_read(
+            current_user.id,
+            [item.id for item in pagination.items if not item.is_read()])
 
         return api_success_response(
             data=data,
             meta=pagination.meta
         )
+
+
+class ReadNotificationsView(MethodView):
+    def __validate_read_params(self, request_data):
+        notification_uids = request_data.get('notification_uids') or []
+        up_to = request_data.get('up_to')
+
+        if not isinstance(notification_uids, list) or not all(
+                isinstance(uid, str) for uid in notification_uids):
+            raise BadRequest('`notification_uids` should be a list of uids')
+
+        if len(notification_uids) > NOTIFICATIONS_READ_BATCH_LIMIT:
+            raise BadRequest(
+                'At most {} `notification_uids` can be marked at once'.format(
+                    NOTIFICATIONS_READ_BATCH_LIMIT))
+
+        if not notification_uids and up_to is None:
+            raise BadRequest('`notification_uids` or `up_to` is required')
+
+        return dict(notification_uids=notification_uids, up_to=up_to)
+
+
+    @user_auth_required()
+    def post(self):
+        """Mark notifications read, by uid or up to and including the
+        notification `up_to`"""
+        current_user = get_current_user()
+
+        params = self.__validate_read_params(get_current_request_data() or {})
+
+        up_to_id = None
+        if params['up_to'] is not None:
+            watermark = Notification.get_not_deleted(
+                uid=params['up_to'], user_id=current_user.id)
+            if watermark is None:
+                raise ResourceNotFound('Notification not found')
+
+            up_to_id = watermark.id
+
+        marked = Notification.mark_all_as_read(
+            current_user.id, uids=params['notification_uids'],
+            up_to_id=up_to_id)
+
+        return api_success_response(data={'marked': marked})
+
+
+class UnreadNotificationCountView(MethodView):
+    @user_auth_required()
+    def get(self):
+        """Report how many of the user's notifications are unread"""
+        count = User.get_unread_notification_count(get_current_user().id)
+
+        return api_success_response(data={'count': count})
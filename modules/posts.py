@@ -4,7 +4,7 @@ from .authentication import user_auth_required
 from app.constants import MIN_POST_TEXT_LENGTH
 from app.errors import BadRequest, ResourceNotFound, UnauthorizedError
 from app.models import Blob, Location, Post, User
-from app.models import followers
+from app.models import timeline_entries
 from modules.hashtags import HashTagsView
 from utils.contexts import (
     get_current_request_args,
@@ -14,32 +14,44 @@ from utils.response_helpers import (
     api_created_response,
     api_deleted_response,
     api_success_response)
-from utils import extract_hash_tags_for_text, trim_hash_tag
+from utils import extract_hash_tags_for_text
+from utils.geo import (
+    distance_expression,
+    get_nearby_params,
+    paginate_nearby,
+    to_kilometers,
+    within_radius)
+from utils.timelines import (
+    fan_out_post,
+    is_timeline_warm,
+    prepare_timeline_entries_query,
+    prepare_timeline_posts_query,
+    remove_post_from_timelines,
+    schedule_timeline_rebuild)
+from utils.trending import get_trending_hash_tags
+from utils.typeahead import record_hash_tag_usages
 from utils.validators import check_boolean_field, check_field_length
 
 
 class PostsView(MethodView):
     @staticmethod
     def create_post(params):
-        text = params['text']
-
-        extracted_hash_tags = extract_hash_tags_for_text(text)
-        hash_tag_orms = map(
-            lambda x: HashTagsView.create_hash_tag(x),
-            extracted_hash_tags
-        )
-
         post = Post(
             user_id=get_current_user().id,
             **params
         )
 
+        hash_tags = extract_hash_tags_for_text(post.text)
+
+        # Tags are linked in the post's own transaction
+        HashTagsView.tag_post(post, hash_tags)
+
         post.save()
 
-        map(
-            lambda x: HashTagsView.add_post_to_hash_tag(post, x),
-            hash_tag_orms
-        )
+        fan_out_post(post)
+        # Only tags committed with the post count as used
+        get_trending_hash_tags().record(hash_tags)
+        record_hash_tag_usages(hash_tags)
 
         return post
 
@@ -120,10 +132,10 @@ class PostsView(MethodView):
 
             return api_success_response(data=post.as_json())
 
-        pagination = Post.get_active(user_id=user.id).paginate()
+        pagination = Post.prepare_get_active(user_id=user.id).paginate()
 
         return api_success_response(
-            [item.as_json() for item in pagination.items],
+            Post.bulk_as_json(pagination.items),
             meta=pagination.meta
         )
 
@@ -166,6 +178,8 @@ class PostsView(MethodView):
         if post.user != get_current_user():
             raise UnauthorizedError()
 
+        remove_post_from_timelines(post, _commit=False)
+        HashTagsView.untag_post(post)
         post.delete()
 
         return api_deleted_response()
@@ -177,21 +191,54 @@ class TimelinePostsView(MethodView):
         """Get all the posts for a timeline"""
         user = get_current_user()
 
-        followed = Post.query.join(
-            followers, (followers.c.followed_id == Post.user_id)
-        ).filter(
-            followers.c.follower_id == user.id
+        if not is_timeline_warm(user.id):
+            schedule_timeline_rebuild(user.id)
+
+            # Both branches page by post id alone so a cursor stays valid
+            # when the timeline warms up between requests
+            pagination = prepare_timeline_posts_query(user.id).paginate(
+                cursor_columns=(Post.id,))
+            posts = pagination.items
+
+        else:
+            pagination = prepare_timeline_entries_query(user.id).paginate(
+                cursor_columns=(timeline_entries.c.post_id,))
+            posts = Post.get_active_by_ids(
+                [row.post_id for row in pagination.items])
+
+        return api_success_response(
+            data=Post.bulk_as_json(posts),
+            meta=pagination.meta
         )
 
-        own = Post.query.filter_by(
-            user_id=user.id
-        ).order_by(
-            Post.created_at.desc()
+
+class NearbyPostsView(MethodView):
+    @user_auth_required()
+    def get(self):
+        """Get the posts tagged with locations near a point, nearest first"""
+        request_args = get_current_request_args()
+
+        latitude, longitude, radius = get_nearby_params(request_args)
+        distance = distance_expression(Location, latitude, longitude)
+
+        query = Post.prepare_get_active(
+            _desc=False
+        ).add_columns(
+            distance
+        ).join(
+            Location, Location.id == Post.location_id
+        ).filter(
+            *within_radius(Location, latitude, longitude, radius)
         )
 
-        pagination = followed.union(own).paginate()
+        pagination = paginate_nearby(query, distance, Post.id, request_args)
+
+        posts_json = Post.bulk_as_json(post for post, _ in pagination.items)
+        for post_json, (_, post_distance) in zip(
+                posts_json, pagination.items):
+            post_json['distance'] = to_kilometers(post_distance)
 
         return api_success_response(
-            data=[item.as_json() for item in pagination.items],
+            data=posts_json,
             meta=pagination.meta
         )
@@ -0,0 +1,51 @@
+from flask import current_app
+from flask.views import MethodView
+
+from .authentication import user_auth_required
+from app.errors import BadRequest
+from app.models import Post
+from utils.contexts import get_current_request_args
+from utils.query_middleware import (
+    CursorPagination, decode_cursor, encode_cursor)
+from utils.response_helpers import api_success_response
+from utils.search import search_post_ids
+
+
+class PostSearchView(MethodView):
+    @user_auth_required()
+    def get(self):
+        """Search posts by their text and comments, best matches first"""
+        request_args = get_current_request_args()
+
+        text = (request_args.get('q') or '').strip()
+        if not text:
+            raise BadRequest('`q` is required')
+
+        try:
+            per_page = int(request_args.get('per_page', 0))
+        except (TypeError, ValueError):
+            raise BadRequest('Pagination parameters should be integers.')
+
+        max_per_page = current_app.config['PAGINATION_DEFAULT_PER_PAGE']
+        per_page = min(per_page or max_per_page, max_per_page)
+
+        after = None
+        cursor = request_args.get('cursor')
+        if cursor:
+            after = decode_cursor(cursor, [int, float])
+
+        matches = search_post_ids(text, per_page + 1, after=after)
+
+        next_cursor = None
+        if len(matches) > per_page:
+            matches = matches[:per_page]
+            next_cursor = encode_cursor(list(matches[-1]))
+
+        pagination = CursorPagination(
+            Post.get_active_by_ids([post_id for post_id, _ in matches]),
+            per_page, next_cursor)
+
+        return api_success_response(
+            data=Post.bulk_as_json(pagination.items),
+            meta=pagination.meta
+        )
@@ -3,12 +3,18 @@ from flask.views import MethodView
 from .authentication import user_auth_required
 from app.constants import MIN_STORY_TEXT_LENGTH
 from app.errors import BadRequest, ResourceNotFound, UnauthorizedError
-from app.models import Blob, Story, User
+from app.models import Blob, Location, Story, User
 from app.models import followers
 from utils.contexts import (
     get_current_request_args,
     get_current_request_data,
     get_current_user)
+from utils.geo import (
+    distance_expression,
+    get_nearby_params,
+    paginate_nearby,
+    to_kilometers,
+    within_radius)
 from utils.response_helpers import (
     api_created_response,
     api_deleted_response,
@@ -43,7 +49,16 @@ class StoriesView(MethodView):
         if blob is None:
             raise ResourceNotFound('Blob not found')
 
-        return dict(replies_enabled=replies_enabled, blob=blob, text=text)
+        location_uid = request_data.get('location_uid')
+        location = Location.get_active(uid=location_uid)
+        if bool(location_uid) != bool(location):
+            raise ResourceNotFound('`location_uid` not found')
+
+        return dict(
+            replies_enabled=replies_enabled,
+            blob=blob,
+            location=location,
+            text=text)
 
     def __validate_story_creation_params(self, request_data):
         required_params = {'blob_uid'}
@@ -114,6 +129,38 @@ class StoriesView(MethodView):
         return api_deleted_response()
 
 
+class NearbyStoriesView(MethodView):
+    @user_auth_required()
+    def get(self):
+        """Get today's stories tagged with locations near a point, nearest
+        first"""
+        request_args = get_current_request_args()
+
+        latitude, longitude, radius = get_nearby_params(request_args)
+        distance = distance_expression(Location, latitude, longitude)
+
+        query = Story.prepare_get_active(
+            _desc=False,
+            has_expired=False
+        ).add_columns(
+            distance
+        ).join(
+            Location, Location.id == Story.location_id
+        ).filter(
+            *within_radius(Location, latitude, longitude, radius)
+        )
+
+        pagination = paginate_nearby(query, distance, Story.id, request_args)
+
+        return api_success_response(
+            data=[
+                dict(story.as_json(), distance=to_kilometers(story_distance))
+                for story, story_distance in pagination.items
+            ],
+            meta=pagination.meta
+        )
+
+
 class TimelineStoriesView(MethodView):
     @user_auth_required()
     def get(self):
@@ -0,0 +1,45 @@
+from flask.views import MethodView
+
+from .authentication import user_auth_required
+from app.constants import TYPEAHEAD_DEFAULT_LIMIT, TYPEAHEAD_MAX_LIMIT
+from app.errors import BadRequest
+from utils.contexts import get_current_request_args
+from utils.response_helpers import api_success_response
+from utils.typeahead import (
+    ensure_typeahead_sync, hash_tag_index, user_index)
+
+
+class TypeaheadView(MethodView):
+    @user_auth_required()
+    def get(self):
+        """Suggest usernames and hash tags starting with `q`.
+
+        A `q` starting with `#` only matches hash tags.
+        """
+        request_args = get_current_request_args()
+
+        query = (request_args.get('q') or '').strip()
+        if not query:
+            raise BadRequest('`q` is required')
+
+        try:
+            limit = int(request_args.get('limit') or TYPEAHEAD_DEFAULT_LIMIT)
+        except (TypeError, ValueError):
+            raise BadRequest('`limit` should be an integer.')
+
+        limit = max(1, min(limit, TYPEAHEAD_MAX_LIMIT))
+        ensure_typeahead_sync()
+
+        if query.startswith('#'):
+            users = []
+            hash_tags = hash_tag_index.search(query[1:], limit)
+        else:
+            users = user_index.search(query, limit)
+            hash_tags = hash_tag_index.search(query, limit)
+
+        return api_success_response(
+            data={
+                'users': users,
+                'hash_tags': hash_tags
+            }
+        )
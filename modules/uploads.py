@@ -0,0 +1,173 @@
+import os
+import re
+
+from flask import request
+from flask.views import MethodView
+
+from .authentication import user_auth_required
+from app.constants import (
+    ACCEPTED_MIME_TYPES, BLOB_MAX_SIZE, BLOB_UPLOAD_MAX_CHUNK_SIZE)
+from app.constants.statuses import (
+    FAILED_STATUS_ID, FULFILLED_STATUS_ID, PENDING_STATUS_ID)
+from app.errors import BadRequest, ResourceConflict, ResourceNotFound
+from app.models import Blob, BlobUpload
+from utils.blob_store import get_blob_store
+from utils.contexts import (
+    get_current_request_data,
+    get_current_request_headers,
+    get_current_user)
+from utils.response_helpers import api_created_response, api_success_response
+
+
+_CHECKSUM_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadsView(MethodView):
+    """Resumable blob uploads.
+
+    `POST /uploads` opens an upload for a file of a declared `size`. Chunks
+    are sent as raw bodies to `PATCH /uploads/<uid>` with an `Upload-Offset`
+    header that must match the bytes received so far, which `GET` reports
+    when resuming. `POST /uploads/<uid>` verifies the file and turns it
+    into a `Blob`.
+    """
+
+    @staticmethod
+    def create_upload(params):
+        upload = BlobUpload(
+            user_id=get_current_user().id,
+            status_id=PENDING_STATUS_ID,
+            offset=0,
+            **params
+        )
+
+        upload.save()
+
+        return upload
+
+    @staticmethod
+    def append_chunk(upload, stream):
+        max_size = min(upload.size - upload.offset, BLOB_UPLOAD_MAX_CHUNK_SIZE)
+
+        try:
+            offset = get_blob_store().write_at(
+                upload.path, upload.offset, stream, max_size)
+        except ValueError:
+            raise BadRequest(
+                'Chunks should be at most {} bytes and not go past `size`.'
+                .format(max_size))
+
+        upload.update(offset=offset)
+
+        return upload
+
+    @staticmethod
+    def finalize_upload(upload):
+        try:
+            digest, size = get_blob_store().put_file(
+                upload.path, expected_digest=upload.checksum)
+        except ValueError:
+            os.remove(upload.path)
+            upload.update(status_id=FAILED_STATUS_ID)
+
+            raise BadRequest('Upload does not match its `checksum`.')
+
+        blob = Blob(digest=digest, size=size, mime_type=upload.mime_type)
+        blob.save(_commit=False)
+
+        upload.update(blob=blob, status_id=FULFILLED_STATUS_ID)
+
+        return upload
+
+
+    def __validate_upload_creation_params(self, request_data):
+        required_params = {'mime_type', 'size'}
+
+        missing_required_params = required_params - set(request_data.keys())
+        if missing_required_params:
+            raise BadRequest('{} are missing.'.format(missing_required_params))
+
+        mime_type = request_data['mime_type']
+        if mime_type not in ACCEPTED_MIME_TYPES:
+            raise BadRequest('`mime_type` should be one of {}'.format(
+                ACCEPTED_MIME_TYPES))
+
+        size = request_data['size']
+        if not isinstance(size, int) or not 0 < size <= BLOB_MAX_SIZE:
+            raise BadRequest('`size` should be between 1 and {} bytes'.format(
+                BLOB_MAX_SIZE))
+
+        checksum = request_data.get('checksum')
+        if checksum is not None and not _CHECKSUM_PATTERN.match(checksum):
+            raise BadRequest('`checksum` should be a hex SHA-256 digest')
+
+        return dict(mime_type=mime_type, size=size, checksum=checksum)
+
+    def __get_pending_upload(self, upload_uid, for_update=False):
+        query = BlobUpload.prepare_get_not_deleted(
+            uid=upload_uid, user_id=get_current_user().id)
+        if for_update:
+            query = query.with_for_update()
+
+        upload = query.first()
+        if upload is None:
+            raise ResourceNotFound('Upload not found')
+
+        if upload.status_id != PENDING_STATUS_ID:
+            raise BadRequest('Upload is no longer accepting data')
+
+        return upload
+
+
+    @user_auth_required()
+    def get(self, upload_uid):
+        """Report how much of an upload has been received"""
+        upload = BlobUpload.get_not_deleted(
+            uid=upload_uid, user_id=get_current_user().id)
+        if upload is None:
+            raise ResourceNotFound('Upload not found')
+
+        return api_success_response(
+            data=upload.as_json(),
+            headers={'Upload-Offset': str(upload.offset)})
+
+    @user_auth_required()
+    def post(self, upload_uid=None):
+        """Open an upload, or finalize one once all its bytes are in"""
+        if upload_uid is None:
+            params = self.__validate_upload_creation_params(
+                get_current_request_data() or {})
+
+            upload = self.create_upload(params)
+
+            return api_created_response(upload.as_json())
+
+        upload = self.__get_pending_upload(upload_uid, for_update=True)
+        if not upload.is_complete():
+            raise BadRequest('Upload has {} of {} bytes'.format(
+                upload.offset, upload.size))
+
+        upload = self.finalize_upload(upload)
+
+        return api_created_response(upload.as_json())
+
+    @user_auth_required()
+    def patch(self, upload_uid):
+        """Append the request body to an upload"""
+        request_headers = get_current_request_headers()
+
+        try:
+            offset = int(request_headers['Upload-Offset'])
+        except (KeyError, TypeError, ValueError):
+            raise BadRequest('`Upload-Offset` header should be an integer')
+
+        upload = self.__get_pending_upload(upload_uid, for_update=True)
+        if offset != upload.offset:
+            raise ResourceConflict(
+                '`Upload-Offset` should be {}'.format(upload.offset))
+
+        upload = self.append_chunk(upload, request.stream)
+
+        return api_success_response(
+            data=upload.as_json(),
+            headers={'Upload-Offset': str(upload.offset)})
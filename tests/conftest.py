@@ -0,0 +1,85 @@
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+import pytest
+from flask import Blueprint, Flask
+from sqlalchemy import event
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('RUNNING_MODE', 'testing')
+
+
+class _SampleConfigFinder(importlib.abc.MetaPathFinder):
+    """Import `config.py.sample` as `config` on checkouts without a
+    `config.py`"""
+
+    def find_spec(self, name, path, target=None):
+        if name != 'config':
+            return None
+
+        sample_path = os.path.join(ROOT, 'config.py.sample')
+
+        return importlib.util.spec_from_loader(
+            name, importlib.machinery.SourceFileLoader(name, sample_path))
+
+
+sys.meta_path.append(_SampleConfigFinder())
+
+
+from app import config_object, db  # noqa: E402
+from utils.workers import BackgroundWorker  # noqa: E402
+
+
+def _stop_background_workers():
+    """Finish the work queued by a test on the module-level workers, which
+    would otherwise run it against the next test's application"""
+    for module in list(sys.modules.values()):
+        for value in list(vars(module).values()):
+            if isinstance(value, BackgroundWorker) and \
+                    value._thread is not None:
+                value.stop()
+
+    notifications = sys.modules.get('utils.notifications')
+    if notifications is not None:
+        notifications._lookup_ids.clear()
+
+
+@pytest.fixture
+def app():
+    """A bare application on an in-memory database, without the API
+    blueprint's authentication dependencies"""
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+
+    # Blob serialization signs URLs for this endpoint
+    api_blueprint = Blueprint('api_blueprint', __name__)
+    api_blueprint.add_url_rule(
+        '/blobs/<blob_uid>', 'blob', lambda blob_uid: '')
+    app.register_blueprint(api_blueprint)
+
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        _stop_background_workers()
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def queries(app):
+    """The SQL statements run while the test holds the list"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', record)
@@ -0,0 +1,31 @@
+from app.models import AccessLog
+from app.models.helpers import _write_api_logs, fit_to_columns
+
+
+def _access_log(api_ref, **columns):
+    # As `create_api_log` queues them; the column defaults need a request
+    record = dict(
+        api_ref=api_ref, uid=api_ref, endpoint='/posts', request_data='{}',
+        request_headers='', response_data='')
+    record.update(columns)
+
+    return record
+
+
+def test_long_values_are_truncated_to_their_columns(app):
+    record = fit_to_columns(AccessLog, _access_log(
+        'a', request_headers='h' * 5000, response_data='r' * 5000))
+
+    assert len(record['request_headers']) == 2000
+    # Text columns have no length to fit
+    assert len(record['response_data']) == 5000
+
+
+def test_a_bad_row_only_drops_itself(app):
+    _write_api_logs([_access_log('taken')])
+
+    _write_api_logs([
+        _access_log('first'), _access_log('taken'), _access_log('last')])
+
+    assert sorted(log.api_ref for log in AccessLog.query) == [
+        'first', 'last', 'taken']
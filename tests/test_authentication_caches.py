@@ -0,0 +1,53 @@
+from flask import Response, g
+
+from app.models import User, UserSnapshot
+from utils.caches import LRUCache
+from utils.contexts import handlers
+
+
+def _snapshot_cache(max_size=10):
+    return LRUCache(
+        'tests.identities', max_size=max_size,
+        index_by=lambda snapshot: snapshot['id'])
+
+
+def test_discard_indexed_drops_every_entry_of_a_user():
+    cache = _snapshot_cache()
+    cache.set('ada', {'id': 1})
+    cache.set('ada@example.com', {'id': 1})
+    cache.set('bo', {'id': 2})
+
+    cache.discard_indexed(1)
+
+    assert cache.get('ada') is None
+    assert cache.get('ada@example.com') is None
+    assert cache.get('bo') == {'id': 2}
+
+
+def test_the_index_follows_evictions_and_overwrites():
+    cache = _snapshot_cache(max_size=2)
+    cache.set('ada', {'id': 1})
+    cache.set('ada', {'id': 3})
+    cache.set('bo', {'id': 2})
+    cache.set('cy', {'id': 4})
+
+    assert cache._index == {2: {'bo'}, 4: {'cy'}}
+
+
+def test_billing_a_cached_user_runs_no_queries(app, queries, monkeypatch):
+    user = User(name='ada')
+    user.save()
+    logged = []
+    monkeypatch.setattr(
+        handlers, '_queue_api_log', lambda **kwargs: logged.append(kwargs))
+
+    with app.test_request_context('/api/v1.0/posts'):
+        g.user = UserSnapshot(**user.snapshot())
+        g.request_cost = 0
+        del queries[:]
+
+        handlers.after_every_request(Response('{}'))
+
+    assert queries == []
+    assert logged[0]['user_id'] == user.id
+    assert logged[0]['cost'] == 0
@@ -0,0 +1,77 @@
+from app import db
+from app.models import HashTag, Like, Post, User
+from app.models import mixins
+from app.models.mixins import counter_shards
+
+
+def _like_count(post):
+    return Post.bulk_counter_values(
+        [Post.query.get(post.id)], ('like_count',))[(post.id, 'like_count')]
+
+
+def _like(post, name):
+    user = User(name=name)
+    user.save()
+    Like(post_id=post.id, user_id=user.id).save()
+
+
+def test_reconciling_keeps_striped_increments(app, monkeypatch):
+    monkeypatch.setattr(mixins, 'COUNTER_STRIPING_THRESHOLD', 0)
+    post = Post(text='hello')
+    post.save()
+    for index in range(3):
+        _like(post, 'user-{}'.format(index))
+
+    # Drifted, e.g. by a crashed writer
+    Post.increment_counter(post.id, 'like_count', 5)
+    db.session.commit()
+    assert _like_count(post) == 8
+
+    Post.reconcile_counter('like_count', Like.post_id, [post.id])
+
+    assert _like_count(post) == 3
+    _like(post, 'user-3')
+    assert _like_count(post) == 4
+
+
+def test_reconciling_unstriped_counters(app):
+    posts = [Post(text='hello'), Post(text='again')]
+    for post in posts:
+        post.save()
+    _like(posts[0], 'ada')
+    _like(posts[1], 'bo')
+    _like(posts[1], 'cy')
+    for post in posts:
+        Post.query.get(post.id).like_count = 7
+    db.session.commit()
+
+    Post.reconcile_counter(
+        'like_count', Like.post_id, [post.id for post in posts])
+
+    assert [_like_count(post) for post in posts] == [1, 2]
+
+
+def test_cold_counters_are_incremented_with_one_update(app, queries):
+    hash_tags = [
+        HashTag(entity='tag-{}'.format(index), post_count=index)
+        for index in range(20)
+    ]
+    hot = HashTag(entity='hot', post_count=mixins.COUNTER_STRIPING_THRESHOLD)
+    for hash_tag in hash_tags + [hot]:
+        hash_tag.save()
+
+    del queries[:]
+    HashTag.increment_counters(
+        [hash_tag.id for hash_tag in hash_tags + [hot]], 'post_count')
+
+    updates = [query for query in queries if query.startswith('UPDATE')]
+    assert len(updates) == 2
+    assert any('counter_shards' in update for update in updates)
+
+    db.session.commit()
+    values = HashTag.bulk_counter_values(hash_tags + [hot], ('post_count',))
+    assert [values[(hash_tag.id, 'post_count')] for hash_tag in hash_tags] \
+        == list(range(1, 21))
+    assert values[(hot.id, 'post_count')] == \
+        mixins.COUNTER_STRIPING_THRESHOLD + 1
+    assert db.session.query(counter_shards).count() == 1
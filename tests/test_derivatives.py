@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+from PIL import Image
+
+from utils import derivatives
+from utils.derivatives import DerivativePipeline, _save_jpeg
+
+
+def test_failed_renders_leave_no_temporary_files(tmp_path):
+    # A non-empty directory can't be replaced by the rendition
+    target_path = tmp_path / 'photo.feed.jpg'
+    target_path.mkdir()
+    (target_path / 'taken').write_bytes(b'')
+
+    with pytest.raises(OSError):
+        _save_jpeg(Image.new('RGB', (64, 32)), str(target_path), 16)
+
+    assert os.listdir(str(tmp_path)) == ['photo.feed.jpg']
+
+
+def test_renders_are_moved_into_place(tmp_path):
+    target_path = tmp_path / 'photo.feed.jpg'
+
+    _save_jpeg(Image.new('RGB', (64, 32)), str(target_path), 16)
+
+    assert os.listdir(str(tmp_path)) == ['photo.feed.jpg']
+    with Image.open(str(target_path)) as image:
+        assert image.size == (16, 8)
+
+
+def test_videos_are_not_scheduled_without_ffmpeg(monkeypatch):
+    monkeypatch.setattr(derivatives.shutil, 'which', lambda name: None)
+    pipeline = DerivativePipeline(1)
+
+    pipeline.schedule('ab' * 32, 'video/mp4')
+
+    assert pipeline._scheduled == set()
+    assert pipeline._executor is None
+
+
+def test_failed_renders_are_not_rescheduled():
+    pipeline = DerivativePipeline(1)
+    digest = 'ab' * 32
+    pipeline._scheduled.add(digest)
+    failed = Future()
+    failed.set_exception(RuntimeError('corrupt'))
+
+    pipeline._on_rendered(digest, failed)
+    pipeline.schedule(digest, 'image/png')
+
+    assert pipeline._scheduled == set()
+    assert pipeline._executor is None
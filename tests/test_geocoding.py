@@ -0,0 +1,34 @@
+from app.constants.statuses import (
+    ACTIVE_STATUS_ID, FAILED_STATUS_ID, PENDING_STATUS_ID)
+from app.models import Location
+from utils.geocoding import (
+    get_reverse_geocoder, quantize, resolve_locations)
+
+
+def _pending_location(latitude, longitude, **fields):
+    location = Location(
+        name='cafe', latitude=latitude, longitude=longitude,
+        resolution_status_id=PENDING_STATUS_ID, **fields)
+    location.save()
+
+    return location
+
+
+def test_a_conflicting_location_fails_without_its_batch(app):
+    address = {
+        'city': 'Lagos', 'country': 'Nigeria', 'postal_code': '100001',
+        'state_or_province': 'Lagos', 'street_address': '1 Marina'}
+    # Every field is set, since NULLs never conflict
+    get_reverse_geocoder()._cache.set(quantize(1.0, 2.0), address)
+    # Already resolved with the address its pending twin is about to get
+    _pending_location(1.0, 2.0, **address)
+    twin = _pending_location(1.0, 2.0)
+    other = _pending_location(10.0, 20.0)
+
+    resolve_locations([twin.id, other.id])
+
+    twin, other = Location.query.get(twin.id), Location.query.get(other.id)
+    assert twin.resolution_status_id == FAILED_STATUS_ID
+    assert twin.city is None
+    assert other.resolution_status_id == ACTIVE_STATUS_ID
+    assert other.city == get_reverse_geocoder().reverse(10.0, 20.0)['city']
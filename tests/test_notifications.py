@@ -0,0 +1,146 @@
+import random
+
+from app import db
+from app.models import Notification, NotificationEntity, Post, User
+from utils import notifications
+from utils.notifications import (
+    COMMENT_EVENT, FOLLOW_EVENT, LIKE_EVENT, _handle_domain_events)
+
+
+def _users(count):
+    users = [User(name='user-{}'.format(index)) for index in range(count)]
+    for user in users:
+        user.save()
+
+    return users
+
+
+def _unread_count(user_id):
+    return User.bulk_counter_values(
+        [User.query.get(user_id)], ('unread_notification_count',))[
+            (user_id, 'unread_notification_count')]
+
+
+def _likes(post, actors):
+    return [(LIKE_EVENT, actor.id, 'Post', post.id) for actor in actors]
+
+
+def _setup():
+    author, *actors = _users(13)
+    post = Post(user_id=author.id, text='hello')
+    post.save()
+
+    return author, actors, post
+
+
+def test_a_burst_coalesces_into_one_notification_per_target(app):
+    author, actors, post = _setup()
+    events = _likes(post, actors[:10]) * 3 + [
+        (FOLLOW_EVENT, actor.id, 'User', author.id) for actor in actors[:5]]
+    # Nobody is notified of liking their own post
+    events.append((LIKE_EVENT, author.id, 'Post', post.id))
+
+    _handle_domain_events(events)
+
+    like, follow = Notification.query.order_by(
+        Notification.target_entity_type_id).all()
+    assert (like.actor_count, follow.actor_count) == (10, 5)
+    assert like.text == 'user-10 and 9 others liked your post'
+    # The target and one entity per distinct actor
+    assert NotificationEntity.query.filter_by(
+        notification_id=like.id).count() == 11
+    assert NotificationEntity.query.filter_by(
+        notification_id=follow.id).count() == 6
+    assert _unread_count(author.id) == 2
+
+
+def test_later_bursts_join_the_unread_notification(app):
+    author, actors, post = _setup()
+    _handle_domain_events(_likes(post, actors[:10]))
+
+    _handle_domain_events(_likes(post, actors[8:]))
+
+    (like,) = Notification.query.all()
+    assert like.actor_count == 12
+    assert NotificationEntity.query.count() == 13
+    assert _unread_count(author.id) == 1
+
+    Notification.mark_all_as_read(author.id, ids=[like.id])
+    newcomer = User(name='newcomer')
+    newcomer.save()
+    # Actors already notified about aren't counted again
+    _handle_domain_events(_likes(post, actors + [newcomer]))
+
+    read_like = Notification.query.get(like.id)
+    assert read_like.actor_count == 12
+    assert read_like.unread_aggregation_key is None
+    (new_like,) = Notification.query.filter(Notification.id != like.id)
+    assert new_like.actor_count == 1
+    assert _unread_count(author.id) == 1
+
+
+def test_a_notification_started_by_another_worker_is_joined(
+        app, monkeypatch):
+    author, actors, post = _setup()
+    author_id = author.id
+    load_aggregation_state = notifications._load_aggregation_state
+    _handle_domain_events(_likes(post, actors[:2]))
+
+    # As if the other worker's notification was committed after this
+    # worker loaded the unread ones
+    monkeypatch.setattr(
+        notifications, '_load_aggregation_state',
+        lambda *args: ({}, load_aggregation_state(*args)[1]))
+    _handle_domain_events(_likes(post, actors[2:5]))
+    db.session.remove()
+
+    (like,) = Notification.query.all()
+    assert like.actor_count == 5
+    assert NotificationEntity.query.count() == 6
+    assert _unread_count(author_id) == 1
+
+
+def _burst(post_ids, actor_ids, size, generator):
+    """`size` likes and comments piling onto `post_ids`, as when they go
+    viral"""
+    return [
+        (generator.choice([LIKE_EVENT, COMMENT_EVENT]),
+         generator.choice(actor_ids), 'Post', generator.choice(post_ids))
+        for _ in range(size)
+    ]
+
+
+def test_statements_per_batch_do_not_grow_with_the_burst(app, queries):
+    generator = random.Random(0)
+    authors, actors = _users(100), []
+    for index in range(500):
+        actor = User(name='actor-{}'.format(index))
+        db.session.add(actor)
+        actors.append(actor)
+    posts = [Post(user_id=author.id, text='hello') for author in authors]
+    db.session.add_all(posts)
+    db.session.commit()
+    post_ids = [post.id for post in posts]
+    actor_ids = [actor.id for actor in actors]
+
+    # Creates the lookup rows
+    _handle_domain_events(_burst(post_ids[:1], actor_ids, 10, generator))
+
+    statements = []
+    for burst_post_ids, size in [(post_ids[1:2], 20), (post_ids[2:], 5000)]:
+        del queries[:]
+        _handle_domain_events(
+            _burst(burst_post_ids, actor_ids, size, generator))
+        statements.append(len(queries))
+
+    assert statements[0] == statements[1]
+    # A like and a comment notification on every post
+    assert Notification.query.count() == 2 * len(posts)
+    assert db.session.query(
+        db.func.sum(Notification.actor_count)).scalar() == \
+        NotificationEntity.query.count() - Notification.query.count()
+    # Every author has their like and comment notifications unread
+    author_ids = [author.id for author in authors]
+    assert set(User.bulk_counter_values(
+        User.query.filter(User.id.in_(author_ids)),
+        ('unread_notification_count',)).values()) == {2}
@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from app import errors
+from utils.passwords import PasswordHasher
+
+
+def test_timed_out_jobs_hold_their_slot_until_they_finish(app):
+    hasher = PasswordHasher(1, timeout=0.2)
+    slots = hasher._slots._value
+
+    try:
+        with pytest.raises(errors.ServiceUnavailable):
+            hasher._run(time.sleep, 1)
+
+        # Still sleeping in the pool
+        assert hasher._slots._value == slots - 1
+
+        deadline = time.monotonic() + 5
+        while hasher._slots._value < slots and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        assert hasher._slots._value == slots
+    finally:
+        hasher.shutdown()
+
+
+def test_hashes_verify_through_the_pool(app):
+    hasher = PasswordHasher(1)
+
+    try:
+        assert hasher.verify(hasher.hash('secret'), 'secret')
+        assert hasher._slots._value == hasher._slots._initial_value
+    finally:
+        hasher.shutdown()
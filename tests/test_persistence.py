@@ -0,0 +1,55 @@
+from app import db
+from app.models import Location
+from app.models import mixins
+
+
+def _listen(monkeypatch, listener):
+    monkeypatch.setitem(mixins._persistence_listeners, 'Location', [listener])
+
+
+def test_listeners_run_once_the_change_is_committed(app, monkeypatch):
+    seen = []
+    _listen(monkeypatch, lambda location: seen.append(location.id))
+
+    location = Location(name='cafe')
+    location.save(_commit=False)
+    location.update(name='bar', _commit=False)
+    assert seen == []
+
+    db.session.commit()
+
+    assert seen == [location.id]
+
+
+def test_listeners_skip_rolled_back_changes(app, monkeypatch):
+    seen = []
+    _listen(monkeypatch, lambda location: seen.append(location.name))
+
+    Location(name='cafe').save(_commit=False)
+    db.session.rollback()
+    db.session.commit()
+
+    assert seen == []
+
+
+def test_a_failing_listener_leaves_the_session_usable(app, monkeypatch):
+    _listen(monkeypatch, lambda location: 1 / 0)
+
+    Location(name='cafe').save()
+    Location(name='bar').save()
+
+    assert Location.query.count() == 2
+
+
+def test_listeners_can_read_attributes_expired_by_an_earlier_commit(
+        app, monkeypatch):
+    location = Location(name='cafe', latitude=1.5)
+    location.save()
+    seen = []
+    _listen(monkeypatch, lambda location: seen.append(location.latitude))
+
+    # The first commit expired every attribute, and nothing changed to
+    # flush and reload them
+    location.save()
+
+    assert seen == [1.5]
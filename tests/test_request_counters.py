@@ -0,0 +1,65 @@
+import threading
+import time
+
+from app import db
+from app.models import User
+from utils.request_counters import (
+    DailyRequestCounter, DatabaseCounterBackend, LocalCounterBackend)
+
+
+class _RecordingBackend(LocalCounterBackend):
+    def __init__(self):
+        super(_RecordingBackend, self).__init__()
+        self.threads = set()
+
+    def add(self, deltas):
+        self.threads.add(threading.get_ident())
+        super(_RecordingBackend, self).add(deltas)
+
+
+class _FailingBackend(DatabaseCounterBackend):
+    def _add(self, deltas):
+        # A failed flush leaves the session unusable until rolled back
+        db.session.add(User(name='taken'))
+        db.session.flush()
+
+
+def test_syncs_run_on_the_background_worker(app):
+    backend = _RecordingBackend()
+    counter = DailyRequestCounter(backend, sync_interval=0)
+
+    assert counter.increment(1) == 1
+
+    deadline = time.monotonic() + 5
+    while not backend.threads and time.monotonic() < deadline:
+        time.sleep(0.01)
+    counter._sync_worker.stop()
+
+    assert backend.get_many([counter._key(1)]) == {counter._key(1): 1}
+    assert backend.threads and threading.get_ident() not in backend.threads
+    assert counter.count(1) == 1
+
+
+def test_a_failed_sync_keeps_its_deltas_and_the_session(app):
+    User(name='taken').save()
+    counter = DailyRequestCounter(_FailingBackend(), sync_interval=3600)
+    counter.increment(1)
+
+    counter.sync()
+
+    assert counter.count(1) == 1
+    assert counter._pending == {counter._key(1): 1}
+
+    User(name='after-failure').save()
+    assert User.query.count() == 2
+
+
+def test_database_backend_adds_to_shared_totals(app):
+    backend = DatabaseCounterBackend()
+    key = DailyRequestCounter._key(1)
+
+    backend.add({key: 2})
+    backend.add({key: 3})
+
+    assert backend.get_many([key]) == {key: 5}
+
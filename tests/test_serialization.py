@@ -0,0 +1,130 @@
+import pytest
+
+from app import db
+from app.models import (
+    Blob, Collection, Comment, HashTag, Like, Location, NotificationEntity,
+    NotificationEntityType, Post, PostSlide, Story, User)
+
+
+def _create_posts(count):
+    posts = []
+
+    for index in range(count):
+        photo = Blob(mime_type='image/png', digest='{:064x}'.format(index))
+        photo.save()
+
+        user = User(
+            name='user-{}'.format(index),
+            email='user-{}@example.com'.format(index),
+            profile_photo_id=photo.id)
+        user.save()
+        Collection(title='saved', user_id=user.id).save()
+
+        location = Location(name='place-{}'.format(index))
+        location.save()
+
+        post = Post(
+            user_id=user.id, text='post {}'.format(index),
+            location_id=location.id)
+        post.save()
+
+        PostSlide(post_id=post.id, blob_id=photo.id).save()
+        Like(post_id=post.id, user_id=user.id).save()
+        Comment(post_id=post.id, user_id=user.id, text='nice').save()
+
+        posts.append(post)
+
+    db.session.commit()
+
+    return posts
+
+
+def _count_queries(queries, serialize, records):
+    db.session.expire_all()
+    records = [type(record).query.get(record.id) for record in records]
+
+    del queries[:]
+    serialize(records)
+
+    return len(queries)
+
+
+@pytest.mark.parametrize('serializer', ['posts', 'users'])
+def test_query_count_does_not_grow_with_page_size(app, queries, serializer):
+    posts = _create_posts(50)
+    if serializer == 'posts':
+        serialize, records = Post.bulk_as_json, posts
+    else:
+        serialize, records = User.bulk_as_json, [post.user for post in posts]
+
+    single = _count_queries(queries, serialize, records[:1])
+    page = _count_queries(queries, serialize, records)
+
+    assert single == page
+
+
+def test_posts_are_serialized_with_their_relations(app):
+    post = _create_posts(1)[0]
+
+    (result,) = Post.bulk_as_json([post])
+
+    assert result['user']['name'] == 'user-0'
+    assert result['user']['collections']['count'] == 1
+    assert result['user']['profile_photo'] is not None
+    assert len(result['slides']) == 1
+    assert result['location']['name'] == 'place-0'
+    assert result['likes'] == {'count': 1}
+    assert result['comments'] == {'count': 1}
+
+
+def test_stories_keep_their_blob_url(app):
+    post = _create_posts(1)[0]
+    story = Story(user_id=post.user_id, blob_id=post.user.profile_photo_id)
+    story.save()
+
+    result = story.as_json()
+
+    assert result['blob'] == post.user.profile_photo.url
+    assert set(result['blob_variants']) == {'thumbnail', 'feed'}
+    assert result['user'] == post.user.uid
+
+
+def test_hash_tags_are_serialized_with_one_counter_query(app, queries):
+    hash_tags = []
+    for index in range(20):
+        hash_tag = HashTag(entity='tag-{}'.format(index), post_count=2)
+        hash_tag.save()
+        hash_tags.append(hash_tag)
+    HashTag.increment_counter(hash_tags[0].id, 'follower_count')
+    db.session.commit()
+    hash_tags = HashTag.get_active_by_ids(
+        [hash_tag.id for hash_tag in hash_tags])
+
+    del queries[:]
+    results = HashTag.bulk_as_json(hash_tags)
+
+    assert len(queries) == 1
+    assert results[0]['posts'] == {'count': 2}
+    assert results[0]['followers'] == {'count': 1}
+    assert results[1]['followers'] == {'count': 0}
+
+
+def test_notification_entities_of_unknown_types_serialize_as_none(app):
+    post = _create_posts(1)[0]
+    post_type = NotificationEntityType(name='Post')
+    poll_type = NotificationEntityType(name='Poll')
+    post_type.save()
+    poll_type.save()
+
+    known = NotificationEntity(
+        entity_id=post.id, notification_entity_type_id=post_type.id)
+    unknown = NotificationEntity(
+        entity_id=1, notification_entity_type_id=poll_type.id)
+    known.save()
+    unknown.save()
+
+    results = NotificationEntity.bulk_as_json([known, unknown])
+
+    assert results[known.id]['entity']['text'] == 'post 0'
+    assert results[unknown.id]['entity'] is None
+    assert results[unknown.id]['notification_entity_type']['name'] == 'Poll'
@@ -0,0 +1,120 @@
+import os
+import time
+
+import pytest
+from flask import request
+
+from app.errors import ResourceNotFound
+from utils.signed_urls import (
+    AccelRedirectEmulator, BlobUrlSigner, offload_response,
+    verify_blob_signature)
+
+
+@pytest.fixture
+def blob_root(app, tmp_path):
+    """A blob store holding `ab/photo`, served at the blob endpoint through
+    the emulator"""
+    os.makedirs(str(tmp_path / 'ab'))
+    (tmp_path / 'ab' / 'photo').write_bytes(b'0123456789')
+
+    def serve_blob(blob_uid):
+        verify_blob_signature(
+            blob_uid, request.args.get('variant'),
+            request.args.get('expires'), request.args.get('signature'))
+        response = offload_response(
+            str(tmp_path / 'ab' / 'photo'), str(tmp_path), 'image/jpeg')
+        response.cache_control.private = True
+
+        return response
+
+    app.view_functions['api_blueprint.blob'] = serve_blob
+    app.wsgi_app = AccelRedirectEmulator(
+        app.wsgi_app, '/protected-blobs/', str(tmp_path))
+
+    return tmp_path
+
+
+def _signed_query(signer, blob_uid, variant=None):
+    query = {
+        'expires': signer.expires,
+        'signature': signer.signature(blob_uid, variant)}
+    if variant is not None:
+        query['variant'] = variant
+
+    return query
+
+
+def test_valid_signatures_verify(app):
+    signer = BlobUrlSigner()
+
+    with app.test_request_context():
+        assert verify_blob_signature(
+            'blob', 'small', signer.expires,
+            signer.signature('blob', 'small')) == signer.expires
+        assert 'signature=' in signer.url('blob')
+
+
+@pytest.mark.parametrize('blob_uid, variant, signature', [
+    ('other', None, None),
+    ('blob', 'small', None),
+    ('blob', None, 'forged'),
+    ('blob', None, ''),
+])
+def test_invalid_signatures_are_rejected(app, blob_uid, variant, signature):
+    signer = BlobUrlSigner()
+
+    with pytest.raises(ResourceNotFound):
+        verify_blob_signature(
+            blob_uid, variant, signer.expires,
+            signer.signature('blob') if signature is None else signature)
+
+
+def test_expired_signatures_are_rejected(app):
+    signer = BlobUrlSigner(expires=int(time.time()) - 1)
+
+    with pytest.raises(ResourceNotFound):
+        verify_blob_signature(
+            'blob', None, signer.expires, signer.signature('blob'))
+
+    with pytest.raises(ResourceNotFound):
+        verify_blob_signature('blob', None, 'never', signer.signature('blob'))
+
+
+def test_offload_headers(app, tmp_path):
+    path = str(tmp_path / 'ab' / 'photo')
+
+    with app.test_request_context():
+        response = offload_response(path, str(tmp_path), 'image/jpeg')
+        assert response.headers['X-Accel-Redirect'] == \
+            '/protected-blobs/ab/photo'
+        assert 'X-Sendfile' not in response.headers
+
+        app.config['BLOB_DELIVERY'] = 'x-sendfile'
+        response = offload_response(path, str(tmp_path), 'image/jpeg')
+        assert response.headers['X-Sendfile'] == os.path.abspath(path)
+        assert 'X-Accel-Redirect' not in response.headers
+        assert response.get_data() == b''
+
+
+def test_emulator_serves_signed_urls_like_nginx(app, blob_root):
+    client = app.test_client()
+    signer = BlobUrlSigner()
+
+    response = client.get(
+        '/blobs/blob', query_string=_signed_query(signer, 'blob'))
+    assert response.status_code == 200
+    assert response.get_data() == b'0123456789'
+    assert response.mimetype == 'image/jpeg'
+    assert 'X-Accel-Redirect' not in response.headers
+    assert response.cache_control.private
+
+    response = client.get(
+        '/blobs/blob', query_string=_signed_query(signer, 'blob'),
+        headers={'Range': 'bytes=2-4'})
+    assert response.status_code == 206
+    assert response.get_data() == b'234'
+
+    query = _signed_query(signer, 'blob')
+    query['signature'] = 'forged'
+    with pytest.raises(ResourceNotFound):
+        client.get('/blobs/blob', query_string=query)
@@ -0,0 +1,47 @@
+import time
+
+from utils.trending import (
+    CountMinSketch, TrendingHashTags, get_snapshot_paths)
+
+
+def _tracker(usages, bucket_seconds=300):
+    tracker = TrendingHashTags(bucket_seconds=bucket_seconds)
+    now = time.time()
+
+    for entity, count, age in usages:
+        tracker.record([entity] * count, timestamp=now - age)
+
+    return tracker
+
+
+def test_top_sums_the_window_and_hashes_each_candidate_once(monkeypatch):
+    tracker = _tracker(
+        [('cats', 3, 0), ('cats', 2, 600), ('dogs', 4, 300),
+         ('old', 9, 7200)])
+    hashed = []
+    indexes = CountMinSketch._indexes
+    monkeypatch.setattr(
+        CountMinSketch, '_indexes',
+        lambda self, key: hashed.append(key) or indexes(self, key))
+
+    assert tracker.top(3600, 10) == [('cats', 5), ('dogs', 4)]
+    assert sorted(hashed) == ['cats', 'dogs']
+
+
+def test_workers_merge_each_others_snapshots(tmpdir):
+    path = str(tmpdir.join('trending.json'))
+    first = _tracker([('cats', 2, 0)])
+    second = _tracker([('cats', 3, 0), ('dogs', 1, 0)])
+    first.save(path + '.1')
+    second.save(path + '.2')
+
+    first.load_peers([path + '.2'])
+
+    assert first.top(3600, 10) == [('cats', 5), ('dogs', 1)]
+
+    # Peer buckets aren't saved again, so nothing is counted twice
+    first.save(path + '.1')
+    restarted = TrendingHashTags()
+    restarted.load_peers(get_snapshot_paths(path))
+
+    assert restarted.top(3600, 10) == [('cats', 5), ('dogs', 1)]
@@ -0,0 +1,108 @@
+import heapq
+import random
+
+from app import db
+from app.models import HashTag, User
+from utils import typeahead
+from utils.typeahead import (
+    PrefixIndex, build_typeahead_indexes, hash_tag_index,
+    sync_typeahead_indexes, user_index)
+
+
+def _brute_force(index, prefix, limit):
+    weights = {
+        ref: index._weights[ref] for ref, key in index._keys.items()
+        if key.startswith(prefix)
+    }
+
+    return sorted(
+        weights[ref] for ref in heapq.nlargest(limit, weights, weights.get))
+
+
+def test_ranked_prefixes_stay_exact_through_updates(monkeypatch):
+    monkeypatch.setattr(typeahead, 'TYPEAHEAD_SCAN_LIMIT', 5)
+    monkeypatch.setattr(typeahead, 'TYPEAHEAD_MAX_LIMIT', 3)
+    rng = random.Random(7)
+    names = ['a{:03}'.format(number) for number in range(60)]
+    index = PrefixIndex('tests.typeahead')
+    index.load(
+        (name, name, {'name': name}, rng.randrange(10)) for name in names)
+
+    for _ in range(2000):
+        name = rng.choice(names)
+        action = rng.random()
+        if action < 0.6:
+            index.bump(name, rng.choice([1, 1, -1]))
+        elif action < 0.8:
+            index.remove(name)
+        else:
+            index.upsert(name, name, {'name': name}, rng.randrange(10))
+
+        for prefix in ['a', 'a0', 'a01']:
+            found = index.search(prefix, 3)
+            assert sorted(
+                index._weights[payload['name']] for payload in found
+            ) == _brute_force(index, prefix, 3)
+
+
+def test_bumps_update_ranked_prefixes_in_place(monkeypatch):
+    monkeypatch.setattr(typeahead, 'TYPEAHEAD_SCAN_LIMIT', 1)
+    index = PrefixIndex('tests.typeahead')
+    index.load([
+        (1, 'ada', {'name': 'ada'}, 5),
+        (2, 'adam', {'name': 'adam'}, 3),
+        (3, 'bo', {'name': 'bo'}, 9)])
+
+    assert index.search('ad', 1) == [{'name': 'ada'}]
+    ranked = index._top['ad']
+
+    index.bump(2, 4)
+
+    assert index._top['ad'] is ranked
+    assert index.search('ad', 2) == [{'name': 'adam'}, {'name': 'ada'}]
+
+
+def _insert_elsewhere(model, **values):
+    """Insert a row the way another worker would, without this process's
+    persistence listeners seeing it"""
+    db.session.execute(model.__table__.insert().values(**values))
+    db.session.commit()
+
+
+def test_sync_adds_what_other_workers_created(app):
+    User(name='ada').save()
+    build_typeahead_indexes()
+
+    _insert_elsewhere(User, name='adam', uid='u-adam', status_id=1)
+    _insert_elsewhere(HashTag, entity='adventures', post_count=3)
+    assert [user['name'] for user in user_index.search('ad', 5)] == ['ada']
+    assert hash_tag_index.search('adv', 5) == []
+
+    sync_typeahead_indexes()
+
+    assert sorted(
+        user['name'] for user in user_index.search('ad', 5)
+    ) == ['ada', 'adam']
+    assert len(hash_tag_index.search('adv', 5)) == 1
+
+    # Later syncs only load what's newer still
+    sync_typeahead_indexes()
+    assert len(user_index.search('ad', 5)) == 2
+
+
+def test_rebuild_picks_up_renames_elsewhere(app):
+    user = User(name='ada')
+    user.save()
+    build_typeahead_indexes()
+
+    db.session.execute(User.__table__.update().where(
+        User.id == user.id).values(name='grace'))
+    db.session.commit()
+    sync_typeahead_indexes()
+    assert len(user_index.search('ada', 5)) == 1
+
+    build_typeahead_indexes()
+
+    assert user_index.search('ada', 5) == []
+    assert user_index.search('gra', 5) == [
+        {'uid': user.uid, 'name': 'grace'}]
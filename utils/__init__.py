@@ -5,7 +5,12 @@ import shortuuid
 from flask import current_app
 from itsdangerous import URLSafeTimedSerializer
 
-from app.constants import EMAIL_CONFIRMATION_LINK_LIFESPAN
+from app.constants import (
+    EMAIL_CONFIRMATION_LINK_LIFESPAN, MAX_HASH_TAG_LENGTH)
+
+
+# A `#` at the start of the text or after whitespace, then word characters
+HASH_TAG_PATTERN = re.compile(r'(?:^|(?<=\s))#(\w+)', re.UNICODE)
 
 
 def confirm_token(token, expiration=EMAIL_CONFIRMATION_LINK_LIFESPAN):
@@ -24,11 +29,12 @@ def confirm_token(token, expiration=EMAIL_CONFIRMATION_LINK_LIFESPAN):
 
 
 def extract_hash_tags_for_text(text):
-    text_splitted = text.split(' ')
-
-    return list(
-        filter(lambda x: trim_hash_tag(x.startswith('#')), text_splitted)
-    )
+    """Return the distinct, lower-cased hash tags in `text` in the order
+    they first appear"""
+    return list(dict.fromkeys(
+        hash_tag.lower()[:MAX_HASH_TAG_LENGTH]
+        for hash_tag in HASH_TAG_PATTERN.findall(text or '')
+    ))
 
 
 def generate_phone_verification_code():
@@ -43,9 +49,3 @@ def generate_email_confirmation_token(email_address):
 
 def generate_unique_reference():
     return shortuuid.uuid()
-
-
-def trim_hash_tag(hash_tag):
-    pattern = re.compile('[\W_]+')
-
-    pattern.sub('', hash_tag)
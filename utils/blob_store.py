@@ -0,0 +1,174 @@
+"""Content-addressed storage for blob bytes.
+
+Bytes are kept in files named by their SHA-256 digest under a two-level
+sharded directory tree (`ab/cd/abcd...`), so identical uploads share one
+file and no single directory grows too large. Writes go to a temporary
+file inside the store and are renamed into place, so readers never see
+partial content.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+import threading
+
+from flask import current_app
+
+from app.constants import BLOB_CHUNK_SIZE
+from utils import metrics
+
+
+class BlobStore(object):
+    def __init__(self, root):
+        self.root = root
+        self.temporary_root = os.path.join(root, 'tmp')
+        self.uploads_root = os.path.join(root, 'uploads')
+
+        for directory in (self.temporary_root, self.uploads_root):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def variant_path(self, digest, variant):
+        return '{}.{}.jpg'.format(self.path(digest), variant)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, stream):
+        """Store the contents of the file-like `stream` and return their
+        `(digest, size)`"""
+        hasher = hashlib.sha256()
+        size = 0
+
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.temporary_root)
+        try:
+            with os.fdopen(descriptor, 'wb') as temporary_file:
+                while True:
+                    chunk = stream.read(BLOB_CHUNK_SIZE)
+                    if not chunk:
+                        break
+
+                    hasher.update(chunk)
+                    temporary_file.write(chunk)
+                    size += len(chunk)
+
+                temporary_file.flush()
+                os.fsync(temporary_file.fileno())
+
+            digest = hasher.hexdigest()
+            self._commit(temporary_path, digest)
+        except Exception:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        return digest, size
+
+    def upload_path(self, name):
+        return os.path.join(self.uploads_root, name)
+
+    def write_at(self, path, offset, stream, max_size):
+        """Write `stream` to `path` from `offset`, discarding anything after
+        it, and return the new end offset. Raises ValueError if `stream`
+        holds more than `max_size` bytes."""
+        mode = 'r+b' if os.path.exists(path) else 'wb'
+
+        with open(path, mode) as upload:
+            upload.seek(offset)
+            written = 0
+
+            while True:
+                chunk = stream.read(BLOB_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                written += len(chunk)
+                if written > max_size:
+                    upload.truncate(offset)
+                    raise ValueError('Stream is larger than {} bytes'.format(
+                        max_size))
+
+                upload.write(chunk)
+
+            upload.truncate()
+            upload.flush()
+            os.fsync(upload.fileno())
+
+        return offset + written
+
+    def put_file(self, path, expected_digest=None):
+        """Move the file at `path` into the store and return its
+        `(digest, size)`. Raises ValueError, leaving the file in place, if
+        its digest isn't `expected_digest`."""
+        hasher = hashlib.sha256()
+        size = 0
+
+        with open(path, 'rb') as source:
+            while True:
+                chunk = source.read(BLOB_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                hasher.update(chunk)
+                size += len(chunk)
+
+        digest = hasher.hexdigest()
+        if expected_digest is not None and digest != expected_digest:
+            raise ValueError('Expected digest {}, got {}'.format(
+                expected_digest, digest))
+
+        self._commit(path, digest)
+
+        return digest, size
+
+    def _commit(self, temporary_path, digest):
+        path = self.path(digest)
+
+        if os.path.exists(path):
+            os.remove(temporary_path)
+            metrics.increment('blob_store.deduplicated')
+            return
+
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        os.replace(temporary_path, path)
+        metrics.increment('blob_store.written')
+
+
+def has_variants(mime_type):
+    """Whether blobs of `mime_type` get smaller renditions"""
+    return (mime_type or '').split('/')[0] in ('image', 'video')
+
+
+def decode_legacy_payload(data):
+    """Return the bytes of a payload stored inline in `blobs.data`, which
+    holds base64, optionally as a data URI"""
+    if data.startswith('data:') and ',' in data:
+        data = data.split(',', 1)[1]
+
+    try:
+        return base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        return data.encode('utf-8')
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    global _blob_store
+
+    if _blob_store is None:
+        with _blob_store_lock:
+            if _blob_store is None:
+                _blob_store = BlobStore(
+                    current_app.config.get('BLOB_STORE_PATH', 'data/blobs'))
+
+    return _blob_store
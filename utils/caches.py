@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from utils import metrics
+
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """Thread-safe, size-bounded LRU cache with optional per-entry expiry.
+
+    Hits, misses and evictions are reported under `name` in
+    `utils.metrics`. With `index_by`, entries are also indexed by
+    `index_by(value)`, so `discard_indexed` can drop every entry for, say,
+    one user without scanning the cache.
+    """
+
+    def __init__(self, name, max_size, ttl=None, index_by=None):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.index_by = index_by
+
+        self._entries = OrderedDict()
+        self._index = defaultdict(set)
+        self._lock = threading.Lock()
+
+        metrics.register_gauge('{}.size'.format(name), self.__len__)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        # Callers hold `_lock`
+        value, _ = self._entries.pop(key, (_MISSING, None))
+
+        if value is not _MISSING and self.index_by is not None:
+            indexed = self.index_by(value)
+            keys = self._index.get(indexed)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[indexed]
+
+        return value
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+
+        with self._lock:
+            value, expires_at = self._entries.get(key, (_MISSING, None))
+
+            if value is not _MISSING and expires_at is not None and \
+                    expires_at <= now:
+                self._remove(key)
+                value = _MISSING
+
+            if value is _MISSING:
+                metrics.increment('{}.misses'.format(self.name))
+                return default
+
+            self._entries.move_to_end(key)
+
+        metrics.increment('{}.hits'.format(self.name))
+        return value
+
+    def set(self, key, value, ttl=_MISSING):
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires_at)
+            if self.index_by is not None:
+                self._index[self.index_by(value)].add(key)
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                metrics.increment('{}.evictions'.format(self.name))
+
+    def pop(self, key):
+        with self._lock:
+            value = self._remove(key)
+
+        return None if value is _MISSING else value
+
+    def discard_indexed(self, indexed):
+        """Drop every entry whose value `index_by` maps to `indexed`"""
+        with self._lock:
+            for key in list(self._index.get(indexed, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
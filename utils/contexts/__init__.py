@@ -11,15 +11,6 @@ def get_current_api_ref():
         return g.api_ref
 
 
-def get_current_api_log():
-    try:
-        return g.api_log
-    except AttributeError:
-        from app.models.helpers import create_api_log
-        g.api_log = create_api_log()
-        return g.api_log
-
-
 def get_current_app():
     return g.app
 
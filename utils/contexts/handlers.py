@@ -3,17 +3,15 @@ from functools import wraps
 
 from flask import g, request
 
-from app import errors
-from app.constants import SUPPORTED_HTTP_METHODS
-from utils.contexts import (
-    get_current_api_log, get_current_request_headers,
-    get_current_user)
+from app.constants import (
+    REQUEST_COST, SUPPORTED_HTTP_METHODS, TOLL_FREE_DAILY_REQUESTS)
+from utils.contexts import get_current_api_ref, get_current_user
 
 
-def _update_api_log(api_log_id, request_method, request_url, user_id,
-        response_data=None, request_headers=None):
-    """Update the API log on completing request handling."""
-    # from application.core.models import APILog
+def _queue_api_log(request_method, request_url, user_id, cost,
+        response_data=None):
+    """Hand the API log for this request to the background writer."""
+    from app.models.helpers import create_api_log
 
     endpoint = (
         '{HTTP_METHOD} {ENDPOINT}'.format(
@@ -22,21 +20,7 @@ def _update_api_log(api_log_id, request_method, request_url, user_id,
         )
     )
 
-    # api_log = APILog.query.get(api_log_id)
-    api_log = get_current_api_log()  # Stub until task queue (Celery) is added
-    # if api_log is None:
-    #     logger.error('API activity is None. yourResponse: '
-    #                  '{0}'.format(repr(response_data)))
-    #     return False
-
-    api_log.update(
-        created_by_id=user_id,
-        request_headers=str(request_headers),
-        response_data=str(response_data),
-        endpoint=endpoint,
-        error_msg='API activity logging update failed!')
-
-    # return True
+    create_api_log(endpoint, user_id, cost, response_data)
 
 
 def before_every_request():
@@ -44,12 +28,9 @@ def before_every_request():
 
     g.request_cost = 0
 
-    try:
-        # DB-persist new API activity
-        g.api_log = get_current_api_log()
-    except:
-        raise errors.APIError(
-            log_message='Error persisting API activity to DB!')
+    # The API log is written in bulk once the response is ready, but the
+    # reference is fixed now so log lines can be tied to it
+    get_current_api_ref()
 
 
 def add_cors_support(f):
@@ -78,32 +59,32 @@ def add_cors_support(f):
 def after_every_request(response):
     """Do necessary operations after every request."""
     # Update API activity log: Save response payload
-    from app.models import APILog
+    from utils.request_counters import get_request_counter
 
-    try:
-        response_data = response.response[0]
-    except IndexError:
-        response_data = None
+    # Files are streamed straight from disk and are never logged
+    response_data = None
+    if not response.direct_passthrough:
+        try:
+            response_data = response.response[0]
+        except IndexError:
+            pass
 
     user = get_current_user()
 
-    _update_api_log(
-        api_log_id=get_current_api_log().id,
+    # Only `user.id` is read, so a cached `UserSnapshot` never loads the
+    # row. The cost is recorded with the API log.
+    if user:  # and g.app.ownership != 'Proprietary':
+        users_today_requests = get_request_counter().increment(user.id)
+
+        if users_today_requests > TOLL_FREE_DAILY_REQUESTS:
+            g.request_cost += REQUEST_COST
+
+    _queue_api_log(
         request_method=request.method,
         request_url=request.url,
         user_id=getattr(user, 'id', None),
-        response_data=response_data,
-        request_headers=get_current_request_headers()
+        cost=g.request_cost,
+        response_data=response_data
     )
 
-    if user:  # and g.app.ownership != 'Proprietary':
-        users_today_requests = APILog.query.filter_by(
-            created_by_id=g.user.id
-        ).count()
-
-        if users_today_requests > g.user.pricing.toll_free_daily_requests:
-            g.request_cost += g.user.pricing.request_cost
-
-        user.record_request_cost(g.request_cost)
-
     return response
@@ -0,0 +1,193 @@
+"""Smaller renditions of image and video blobs.
+
+When a blob's bytes land in the store, a process pool renders a JPEG per
+variant in `BLOB_VARIANTS`, no larger than the variant's longest edge:
+a scaled copy of an image, or a poster frame of a video. Renditions are
+written next to the original as `<digest>.<variant>.jpg`, so blobs with
+the same content share them.
+
+Blobs whose render failed aren't retried for `DERIVATIVE_RETRY_DELAY`
+seconds, and videos get no poster at all on hosts without ffmpeg.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from PIL import Image, ImageOps
+
+from app.constants import (
+    BLOB_VARIANTS, DERIVATIVE_JPEG_QUALITY, DERIVATIVE_POOL_SIZE,
+    DERIVATIVE_RETRY_DELAY, DERIVATIVE_VIDEO_POSTER_OFFSET)
+from app.logs import logger
+from app.models.mixins import on_persistence_change
+from utils import metrics
+from utils.blob_store import get_blob_store, has_variants
+from utils.caches import LRUCache
+
+
+def _save_jpeg(image, target_path, max_edge):
+    image = image.convert('RGB')
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    descriptor, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(target_path))
+    try:
+        with os.fdopen(descriptor, 'wb') as temporary_file:
+            image.save(
+                temporary_file, 'JPEG', quality=DERIVATIVE_JPEG_QUALITY,
+                optimize=True, progressive=True)
+
+        os.replace(temporary_path, target_path)
+        temporary_path = None
+    finally:
+        if temporary_path is not None:
+            os.remove(temporary_path)
+
+
+def _render_image(source_path, target_path, max_edge):
+    with Image.open(source_path) as image:
+        _save_jpeg(ImageOps.exif_transpose(image), target_path, max_edge)
+
+
+def _render_video_poster(source_path, target_path, max_edge):
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError('ffmpeg is needed to render video posters')
+
+    with tempfile.NamedTemporaryFile(suffix='.png') as frame:
+        subprocess.run(
+            [ffmpeg, '-loglevel', 'error', '-y',
+             '-ss', str(DERIVATIVE_VIDEO_POSTER_OFFSET), '-i', source_path,
+             '-frames:v', '1', frame.name],
+            check=True, timeout=60)
+
+        with Image.open(frame.name) as image:
+            _save_jpeg(image, target_path, max_edge)
+
+
+def _render(mime_type, source_path, targets):
+    """Render every `(target_path, max_edge)` of one blob; runs in the pool"""
+    render = (
+        _render_video_poster if mime_type.startswith('video/')
+        else _render_image)
+
+    for target_path, max_edge in targets:
+        render(source_path, target_path, max_edge)
+
+
+class DerivativePipeline(object):
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._scheduled = set()
+        # Digests whose last render failed, until they're due a retry
+        self._failed = LRUCache(
+            'derivatives.failed', 10000, ttl=DERIVATIVE_RETRY_DELAY)
+        self.renders_videos = shutil.which('ffmpeg') is not None
+        if not self.renders_videos:
+            logger.warning('ffmpeg is not installed; videos get no posters')
+        # (blob uid, variant) -> rendition path, for blobs known to have one
+        self._paths = LRUCache('derivatives.paths', 10000)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.pool_size)
+
+        return self._executor
+
+    def schedule(self, digest, mime_type):
+        """Render the missing variants of the blob with `digest`"""
+        if not has_variants(mime_type) or self._failed.get(digest):
+            return
+
+        if mime_type.startswith('video/') and not self.renders_videos:
+            return
+
+        store = get_blob_store()
+        targets = [
+            (store.variant_path(digest, variant), max_edge)
+            for variant, max_edge in sorted(BLOB_VARIANTS.items())
+            if not os.path.exists(store.variant_path(digest, variant))
+        ]
+        if not targets:
+            return
+
+        with self._lock:
+            if digest in self._scheduled:
+                return
+            self._scheduled.add(digest)
+
+        future = self._get_executor().submit(
+            _render, mime_type, store.path(digest), targets)
+        future.add_done_callback(
+            lambda done: self._on_rendered(digest, done))
+
+        metrics.increment('derivatives.scheduled')
+
+    def _on_rendered(self, digest, future):
+        with self._lock:
+            self._scheduled.discard(digest)
+
+        error = future.exception()
+        if error is not None:
+            self._failed.set(digest, True)
+            metrics.increment('derivatives.failed')
+            logger.error(
+                'Could not render variants of blob {}: {}'.format(
+                    digest, error))
+            return
+
+        metrics.increment('derivatives.rendered')
+
+    def path(self, blob, variant):
+        """Return the path of `blob`'s rendition for `variant`, or None
+        while it hasn't been rendered"""
+        key = (blob.uid, variant)
+
+        path = self._paths.get(key)
+        if path is not None:
+            return path
+
+        path = get_blob_store().variant_path(blob.digest, variant)
+        if not os.path.exists(path):
+            return None
+
+        self._paths.set(key, path)
+
+        return path
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+_derivative_pipeline = None
+_derivative_pipeline_lock = threading.Lock()
+
+
+def get_derivative_pipeline():
+    global _derivative_pipeline
+
+    if _derivative_pipeline is None:
+        with _derivative_pipeline_lock:
+            if _derivative_pipeline is None:
+                _derivative_pipeline = DerivativePipeline(
+                    current_app.config.get(
+                        'DERIVATIVE_POOL_SIZE', DERIVATIVE_POOL_SIZE))
+
+    return _derivative_pipeline
+
+
+@on_persistence_change('Blob')
+def _render_variants(blob):
+    if blob.digest is not None and not blob.is_deleted():
+        get_derivative_pipeline().schedule(blob.digest, blob.mime_type)
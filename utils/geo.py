@@ -0,0 +1,217 @@
+"""Proximity queries over `locations`.
+
+Every location carries the geohash of its coordinates. A radius search
+picks the finest geohash precision whose cells cover the search circle's
+bounding box in at most `NEARBY_MAX_CELLS` cells, turns each cell into an
+index range scan on `locations.geohash`, then filters and orders the
+candidates by distance.
+
+Distances use the equirectangular approximation, which only needs
+arithmetic the database can do and is within 0.5% of the great-circle
+distance at the radii allowed here. Searches don't wrap around the
+antimeridian.
+"""
+import math
+
+from flask import current_app
+
+from app import db
+from app.constants import (
+    GEOHASH_PRECISION, NEARBY_DEFAULT_RADIUS, NEARBY_MAX_CELLS,
+    NEARBY_MAX_RADIUS)
+from app.errors import BadRequest
+from utils.query_middleware import (
+    CursorPagination, decode_cursor, encode_cursor)
+
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Sorts after every geohash character, closing a prefix range
+_RANGE_END = '{'
+
+KILOMETERS_PER_DEGREE = 111.195
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+
+    characters = []
+    bits = 0
+    bit_count = 0
+    is_longitude = True
+
+    while len(characters) < precision:
+        value, bounds = (
+            (longitude, longitude_range) if is_longitude
+            else (latitude, latitude_range))
+
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+
+        is_longitude = not is_longitude
+        bit_count += 1
+
+        if bit_count == 5:
+            characters.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(characters)
+
+
+def _cell_size(precision):
+    """Return the `(height, width)` in degrees of cells at `precision`"""
+    bits = 5 * precision
+    longitude_bits = (bits + 1) // 2
+    latitude_bits = bits // 2
+
+    return 180.0 / 2 ** latitude_bits, 360.0 / 2 ** longitude_bits
+
+
+def _bounding_box(latitude, longitude, radius):
+    latitude_delta = radius / KILOMETERS_PER_DEGREE
+    longitude_delta = radius / (
+        KILOMETERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+
+    return (
+        max(latitude - latitude_delta, -90.0),
+        min(latitude + latitude_delta, 90.0),
+        max(longitude - longitude_delta, -180.0),
+        min(longitude + longitude_delta, 180.0))
+
+
+def covering_cells(latitude, longitude, radius):
+    """Return the geohash prefixes of the cells covering the circle of
+    `radius` kilometers around the coordinates"""
+    south, north, west, east = _bounding_box(latitude, longitude, radius)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = _cell_size(precision)
+
+        first_row = int(math.floor((south + 90) / height))
+        last_row = int(math.floor((north + 90) / height))
+        first_column = int(math.floor((west + 180) / width))
+        last_column = int(math.floor((east + 180) / width))
+
+        count = (last_row - first_row + 1) * (last_column - first_column + 1)
+        if count <= NEARBY_MAX_CELLS or precision == 1:
+            break
+
+    # Encode the center of every cell so float error can't pick a neighbour
+    cells = set()
+    for row in range(first_row, last_row + 1):
+        cell_latitude = min(-90 + (row + 0.5) * height, 90.0)
+        for column in range(first_column, last_column + 1):
+            cell_longitude = min(-180 + (column + 0.5) * width, 180.0)
+            cells.add(
+                encode_geohash(cell_latitude, cell_longitude, precision))
+
+    return sorted(cells)
+
+
+def distance_expression(location_model, latitude, longitude):
+    """SQL expression for the squared equirectangular distance, in degrees,
+    from the coordinates to `location_model`'s"""
+    longitude_scale = math.cos(math.radians(latitude))
+
+    latitude_delta = location_model.latitude - latitude
+    longitude_delta = (location_model.longitude - longitude) * longitude_scale
+
+    return (latitude_delta * latitude_delta +
+            longitude_delta * longitude_delta)
+
+
+def within_radius(location_model, latitude, longitude, radius):
+    """Criteria for `location_model` rows within `radius` kilometers of the
+    coordinates"""
+    south, north, west, east = _bounding_box(latitude, longitude, radius)
+
+    cells = db.or_(*[
+        db.and_(location_model.geohash >= cell,
+                location_model.geohash < cell + _RANGE_END)
+        for cell in covering_cells(latitude, longitude, radius)
+    ])
+
+    return [
+        cells,
+        location_model.latitude.between(south, north),
+        location_model.longitude.between(west, east),
+        distance_expression(location_model, latitude, longitude) <=
+        (radius / KILOMETERS_PER_DEGREE) ** 2
+    ]
+
+
+def to_kilometers(squared_distance):
+    return round(math.sqrt(squared_distance) * KILOMETERS_PER_DEGREE, 3)
+
+
+def get_nearby_params(request_args):
+    """Read `latitude`, `longitude` and `radius` (in kilometers) from the
+    request arguments"""
+    missing_params = {'latitude', 'longitude'} - set(request_args.keys())
+    if missing_params:
+        raise BadRequest('{} are missing.'.format(missing_params))
+
+    try:
+        latitude = float(request_args['latitude'])
+        longitude = float(request_args['longitude'])
+        radius = float(request_args.get('radius', NEARBY_DEFAULT_RADIUS))
+    except (TypeError, ValueError):
+        raise BadRequest('`latitude`, `longitude` and `radius` should be '
+                         'numbers.')
+
+    if not -90 <= latitude <= 90:
+        raise BadRequest('Latitude is invalid')
+
+    if not -180 <= longitude <= 180:
+        raise BadRequest('Longitude is invalid')
+
+    if not 0 < radius <= NEARBY_MAX_RADIUS:
+        raise BadRequest(
+            '`radius` should be between 0 and {} kilometers.'.format(
+                NEARBY_MAX_RADIUS))
+
+    return latitude, longitude, radius
+
+
+def paginate_nearby(query, distance, id_column, request_args):
+    """Page through `(record, squared_distance)` rows nearest first.
+
+    `query` must select the record and `distance`; pages seek past the
+    `(distance, id)` of the last row of the previous page.
+    """
+    try:
+        per_page = int(request_args.get('per_page', 0))
+    except (TypeError, ValueError):
+        raise BadRequest('Pagination parameters should be integers.')
+
+    max_per_page = current_app.config['PAGINATION_DEFAULT_PER_PAGE']
+    per_page = min(per_page or max_per_page, max_per_page)
+
+    cursor = request_args.get('cursor')
+    if cursor:
+        after_distance, after_id = decode_cursor(cursor, [float, int])
+        query = query.filter(db.or_(
+            distance > after_distance,
+            db.and_(distance == after_distance, id_column > after_id)))
+
+    rows = query.order_by(
+        None
+    ).order_by(
+        distance, id_column
+    ).limit(
+        per_page + 1
+    ).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        record, last_distance = rows[-1]
+        next_cursor = encode_cursor([last_distance, record.id])
+
+    return CursorPagination(rows, per_page, next_cursor)
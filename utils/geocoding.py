@@ -0,0 +1,313 @@
+"""Cached reverse geocoding.
+
+Coordinates are quantized to a grid cell, and every cell is geocoded at
+most once: results are kept in an on-disk store shared by all workers,
+with an in-process LRU cache in front of it. Concurrent lookups for the
+same cell wait on a single backend call.
+
+Locations are saved with their raw coordinates and resolved in the
+background by `geocoding_worker`, which backfills their address fields.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from geopy.exc import GeopyError
+from geopy.geocoders import Nominatim
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db, errors, logger
+from app.constants import (
+    GEOCODING_BATCH_SIZE, GEOCODING_CACHE_SIZE, GEOCODING_CELL_PRECISION,
+    GEOCODING_RESOLVER_THREADS, GEOCODING_TIMEOUT)
+from app.constants.statuses import ACTIVE_STATUS_ID, FAILED_STATUS_ID
+from app.models import Location
+from utils import metrics
+from utils.caches import LRUCache
+from utils.workers import BackgroundWorker
+
+
+_MISSING = object()
+
+
+def quantize(latitude, longitude, precision=GEOCODING_CELL_PRECISION):
+    """Return the key of the grid cell holding the coordinates"""
+    return '{0:.{2}f},{1:.{2}f}'.format(
+        float(latitude), float(longitude), precision)
+
+
+def _cell_center(cell):
+    latitude, longitude = cell.split(',')
+
+    return float(latitude), float(longitude)
+
+
+class NominatimGeocoder(object):
+    def __init__(self, user_agent, timeout=GEOCODING_TIMEOUT):
+        self._client = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    @staticmethod
+    def _address_from(raw_address):
+        street_address = ' '.join(
+            part for part in (
+                raw_address.get('house_number'), raw_address.get('road'))
+            if part)
+
+        city = (raw_address.get('city') or raw_address.get('town') or
+                raw_address.get('village') or raw_address.get('suburb'))
+
+        return {
+            'city': city,
+            'state_or_province': raw_address.get('state'),
+            'country': raw_address.get('country'),
+            'postal_code': raw_address.get('postcode'),
+            'street_address': street_address[:20] or None
+        }
+
+    def reverse(self, latitude, longitude):
+        try:
+            location = self._client.reverse(
+                (latitude, longitude), exactly_one=True)
+        except GeopyError as e:
+            raise errors.ServiceUnavailable(
+                log_message='Reverse geocoding failed: {}'.format(e))
+
+        if location is None:
+            return None
+
+        return self._address_from(location.raw.get('address', {}))
+
+
+class LocalGeocoder(object):
+    """Network-free stand-in that names places after their coordinates"""
+
+    def __init__(self, user_agent=None, timeout=None):
+        self.lookups = 0
+
+    def reverse(self, latitude, longitude):
+        self.lookups += 1
+        cell = quantize(latitude, longitude)
+
+        return {
+            'city': 'City {}'.format(cell),
+            'state_or_province': 'State {}'.format(cell),
+            'country': 'Country',
+            'postal_code': None,
+            'street_address': None
+        }
+
+
+GEOCODING_BACKENDS = {
+    'local': LocalGeocoder,
+    'nominatim': NominatimGeocoder
+}
+
+
+class GeocodingStore(object):
+    """Results by cell in a SQLite file shared by every worker"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._connection = sqlite3.connect(
+            path, timeout=GEOCODING_TIMEOUT, check_same_thread=False,
+            isolation_level=None)
+        self._lock = threading.Lock()
+
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS reverse_geocodes ('
+                'cell TEXT PRIMARY KEY, address TEXT, created_at REAL)')
+
+    def get(self, cell):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT address FROM reverse_geocodes WHERE cell = ?',
+                (cell,)).fetchone()
+
+        return _MISSING if row is None else json.loads(row[0])
+
+    def set(self, cell, address):
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO reverse_geocodes '
+                '(cell, address, created_at) VALUES (?, ?, ?)',
+                (cell, json.dumps(address), time.time()))
+
+
+class _PendingLookup(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.address = None
+        self.error = None
+
+
+class ReverseGeocoder(object):
+    def __init__(self, backend, store, cache_size=GEOCODING_CACHE_SIZE):
+        self.backend = backend
+        self.store = store
+
+        self._cache = LRUCache('geocoding.cache', cache_size)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def reverse(self, latitude, longitude):
+        """Return the address of the cell holding the coordinates, or None
+        if there is nothing there"""
+        cell = quantize(latitude, longitude)
+
+        address = self._cache.get(cell, _MISSING)
+        if address is not _MISSING:
+            return address
+
+        address = self.store.get(cell)
+        if address is not _MISSING:
+            metrics.increment('geocoding.store_hits')
+            self._cache.set(cell, address)
+            return address
+
+        return self._lookup(cell)
+
+    def _lookup(self, cell):
+        with self._lock:
+            pending = self._pending.get(cell)
+            is_leader = pending is None
+            if is_leader:
+                pending = self._pending[cell] = _PendingLookup()
+
+        if not is_leader:
+            metrics.increment('geocoding.coalesced')
+            pending.done.wait()
+
+            if pending.error is not None:
+                raise pending.error
+
+            return pending.address
+
+        try:
+            metrics.increment('geocoding.backend_calls')
+            pending.address = self.backend.reverse(*_cell_center(cell))
+
+            self.store.set(cell, pending.address)
+            self._cache.set(cell, pending.address)
+        except Exception as e:
+            metrics.increment('geocoding.failures')
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[cell]
+
+            pending.done.set()
+
+        return pending.address
+
+
+_reverse_geocoder = None
+_reverse_geocoder_lock = threading.Lock()
+
+
+def get_reverse_geocoder():
+    global _reverse_geocoder
+
+    if _reverse_geocoder is not None:
+        return _reverse_geocoder
+
+    with _reverse_geocoder_lock:
+        if _reverse_geocoder is None:
+            config = current_app.config
+
+            backend = GEOCODING_BACKENDS[
+                config.get('GEOCODING_BACKEND', 'nominatim')](
+                    user_agent=config.get('APP_NAME') or 'social-network',
+                    timeout=GEOCODING_TIMEOUT)
+            store = GeocodingStore(
+                config.get('GEOCODING_CACHE_PATH', 'data/geocoding.sqlite3'))
+
+            _reverse_geocoder = ReverseGeocoder(backend, store)
+
+    return _reverse_geocoder
+
+
+_ADDRESS_FIELDS = [
+    'city', 'country', 'postal_code', 'state_or_province', 'street_address']
+
+
+def _backfill_address(location, address):
+    """Save `address` on `location` in its own savepoint, so a location
+    that now duplicates another one fails alone. Returns whether it was
+    saved."""
+    try:
+        with db.session.begin_nested():
+            for field in _ADDRESS_FIELDS:
+                setattr(location, field, address.get(field))
+
+            location.resolution_status_id = ACTIVE_STATUS_ID
+    except SQLAlchemyError:
+        logger.warning(
+            'Could not backfill location {}'.format(location.id),
+            exc_info=True)
+        location.resolution_status_id = FAILED_STATUS_ID
+
+        return False
+
+    return True
+
+
+def resolve_locations(ids, _commit=True):
+    """Geocode the `Location` records with `ids`, backfill their address
+    fields and mark each one resolved or failed"""
+    locations_by_cell = defaultdict(list)
+    for location in Location.get_active_by_ids(ids):
+        cell = quantize(location.latitude, location.longitude)
+        locations_by_cell[cell].append(location)
+
+    if not locations_by_cell:
+        return
+
+    geocoder = get_reverse_geocoder()
+    threads = current_app.config.get(
+        'GEOCODING_RESOLVER_THREADS', GEOCODING_RESOLVER_THREADS)
+
+    with ThreadPoolExecutor(threads) as executor:
+        lookups = {
+            cell: executor.submit(geocoder.reverse, *_cell_center(cell))
+            for cell in locations_by_cell
+        }
+
+    for cell, lookup in lookups.items():
+        try:
+            address = lookup.result() or {}
+        except Exception:
+            logger.warning(
+                'Could not geocode {}'.format(cell), exc_info=True)
+            metrics.increment(
+                'geocoding.locations_failed', len(locations_by_cell[cell]))
+
+            for location in locations_by_cell[cell]:
+                location.resolution_status_id = FAILED_STATUS_ID
+            continue
+
+        resolved = sum(
+            _backfill_address(location, address)
+            for location in locations_by_cell[cell])
+
+        metrics.increment('geocoding.locations_resolved', resolved)
+        metrics.increment(
+            'geocoding.locations_failed',
+            len(locations_by_cell[cell]) - resolved)
+
+    if _commit:
+        db.session.commit()
+
+
+geocoding_worker = BackgroundWorker(
+    'geocoding-resolver', resolve_locations, batch_size=GEOCODING_BATCH_SIZE)
@@ -0,0 +1,35 @@
+"""Process-local counters and gauges, served by `GET /metrics`."""
+import threading
+from collections import defaultdict
+
+
+_counters = defaultdict(int)
+_gauges = {}
+_lock = threading.Lock()
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name, value):
+    _gauges[name] = value
+
+
+def register_gauge(name, func):
+    """Report the return value of `func` as gauge `name` at read time"""
+    _gauges[name] = func
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+
+    return {
+        'counters': counters,
+        'gauges': {
+            name: value() if callable(value) else value
+            for name, value in list(_gauges.items())
+        }
+    }
@@ -0,0 +1,389 @@
+"""Notification fan-out, aggregation and read state.
+
+Likes, comments and follows publish domain events onto
+`notification_worker` instead of writing notifications in the request.
+The worker folds each batch into one notification per recipient, event
+and target ("Ada and 41 others liked your post"): actors join the unread
+notification for that target if there is one, and start a new one
+otherwise. Actors are stored as `User` entities, so an actor is counted
+once per target however often their event is published.
+
+Workers in several processes can fold events for the same target at
+once, so actor counts are added in SQL rather than read and written back,
+and new notifications are inserted ignoring duplicates of their unique
+`unread_aggregation_key`: only one worker starts each.
+
+Every user's unread notifications are counted in
+`User.unread_notification_count`, which is changed in the same
+transaction as the notifications it counts: up by the worker as it
+creates them, down as they're marked read. `reconcile_counters`
+recomputes it from `notifications`.
+
+Notifications are marked read in bulk, with one UPDATE per user. Listing
+notifications marks the page it returns read, but only once the response
+is out: the ids are queued on `read_state_worker`, which folds the reads
+of each user in a batch into a single statement.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from app import db
+from app.constants import (
+    MAX_NOTIFICATION_TEXT_LENGTH, NOTIFICATION_BATCH_SIZE,
+    NOTIFICATION_FLUSH_INTERVAL, NOTIFICATION_QUEUE_SIZE)
+from app.constants.statuses import ACTIVE_STATUS_ID, DELETED_STATUS_ID
+from app.models import (
+    Notification, NotificationEntity, NotificationEntityType,
+    NotificationEvent, Post, User)
+from app.models.helpers import insert_ignoring_duplicates
+from app.models.mixins import on_persistence_change
+from utils import generate_unique_reference
+from utils.workers import BackgroundWorker
+
+
+COMMENT_EVENT = 'Comment'
+FOLLOW_EVENT = 'Follow'
+LIKE_EVENT = 'Like'
+
+_EVENT_PHRASES = {
+    COMMENT_EVENT: 'commented on your post',
+    FOLLOW_EVENT: 'followed you',
+    LIKE_EVENT: 'liked your post',
+}
+
+# (table name, name) -> id of `LookUp` rows, which never change
+_lookup_ids = {}
+
+
+def _lookup_id(model, name):
+    key = (model.__tablename__, name)
+
+    if key not in _lookup_ids:
+        record = model.get_active(name=name)
+        if record is None:
+            record = model(name=name)
+            record.save()
+
+        _lookup_ids[key] = record.id
+
+    return _lookup_ids[key]
+
+
+def notification_text(event, actor_name, actor_count):
+    if actor_count == 1:
+        actors = actor_name
+    elif actor_count == 2:
+        actors = '{} and 1 other'.format(actor_name)
+    else:
+        actors = '{} and {} others'.format(actor_name, actor_count - 1)
+
+    return '{} {}'.format(actors, _EVENT_PHRASES[event])[
+        :MAX_NOTIFICATION_TEXT_LENGTH]
+
+
+def coalesce_events(events, post_authors):
+    """Group `(event, actor_id, target_type, target_id)` domain events by
+    `(recipient_id, event, target_type, target_id)`, each with its distinct
+    actor ids in order. `post_authors` maps post ids to their authors."""
+    aggregates = {}
+
+    for event, actor_id, target_type, target_id in events:
+        if target_type == 'User':
+            recipient_id = target_id
+        else:
+            recipient_id = post_authors.get(target_id)
+
+        # Nobody is notified of what they do to their own things
+        if recipient_id is None or recipient_id == actor_id:
+            continue
+
+        actor_ids = aggregates.setdefault(
+            (recipient_id, event, target_type, target_id), [])
+        if actor_id not in actor_ids:
+            actor_ids.append(actor_id)
+
+    return aggregates
+
+
+def _load_aggregation_state(keys, actor_ids, user_type_id):
+    """Return the unread notification, if any, and the actors already
+    notified about, for every `(recipient_id, event_id, target_type_id,
+    target_id)` in `keys`"""
+    notifications = Notification.query.filter(
+        Notification.user_id.in_({key[0] for key in keys}),
+        Notification.notification_event_id.in_({key[1] for key in keys}),
+        Notification.target_entity_id.in_({key[3] for key in keys}),
+        Notification.status_id != DELETED_STATUS_ID
+    ).order_by(
+        Notification.id
+    ).all()
+
+    unread, key_by_notification = {}, {}
+    for notification in notifications:
+        key = (
+            notification.user_id, notification.notification_event_id,
+            notification.target_entity_type_id, notification.target_entity_id)
+        if key not in keys:
+            continue
+
+        key_by_notification[notification.id] = key
+        if not notification.is_read():
+            unread[key] = notification
+
+    known_actors = defaultdict(set)
+    if key_by_notification:
+        for notification_id, actor_id in db.session.query(
+            NotificationEntity.notification_id, NotificationEntity.entity_id
+        ).filter(
+            NotificationEntity.notification_id.in_(key_by_notification),
+            NotificationEntity.notification_entity_type_id == user_type_id,
+            NotificationEntity.entity_id.in_(actor_ids)
+        ):
+            known_actors[key_by_notification[notification_id]].add(actor_id)
+
+    return unread, known_actors
+
+
+def _load_unread_notifications(keys):
+    """Return `{key: (id, uid)}` of the unread notification of every
+    `(recipient_id, event_id, target_type_id, target_id)` in `keys` that
+    has one"""
+    keys_by_aggregation_key = {
+        Notification.aggregation_key(*key): key for key in keys
+    }
+
+    notifications = db.session.query(
+        Notification.id, Notification.uid, Notification.unread_aggregation_key
+    ).filter(
+        Notification.unread_aggregation_key.in_(keys_by_aggregation_key)
+    )
+
+    return {
+        keys_by_aggregation_key[aggregation_key]: (id_, uid)
+        for id_, uid, aggregation_key in notifications
+    }
+
+
+_add_actors = Notification.__table__.update().where(
+    Notification.__table__.c.id == bindparam('notification_id')
+).values(
+    actor_count=Notification.__table__.c.actor_count + bindparam('added'),
+    modified_at=bindparam('now')
+)
+
+_set_text = Notification.__table__.update().where(
+    Notification.__table__.c.id == bindparam('notification_id')
+).values(
+    text=bindparam('notification_text')
+)
+
+
+def _handle_domain_events(events):
+    post_ids = {
+        target_id for _, _, target_type, target_id in events
+        if target_type == 'Post'
+    }
+    post_authors = dict(
+        db.session.query(
+            Post.id, Post.user_id
+        ).filter(
+            Post.id.in_(post_ids)
+        ).all()
+    ) if post_ids else {}
+
+    aggregates = {}
+    for (recipient_id, event, target_type, target_id), actor_ids in \
+            coalesce_events(events, post_authors).items():
+        key = (
+            recipient_id, _lookup_id(NotificationEvent, event),
+            _lookup_id(NotificationEntityType, target_type), target_id)
+        aggregates[key] = (event, actor_ids)
+
+    if not aggregates:
+        return
+
+    user_type_id = _lookup_id(NotificationEntityType, 'User')
+    all_actor_ids = {
+        actor_id for _, actor_ids in aggregates.values()
+        for actor_id in actor_ids
+    }
+    unread, known_actors = _load_aggregation_state(
+        aggregates, all_actor_ids, user_type_id)
+
+    new_actors = {}
+    for key, (event, actor_ids) in aggregates.items():
+        actor_ids = [
+            actor_id for actor_id in actor_ids
+            if actor_id not in known_actors[key]
+        ]
+        if actor_ids:
+            new_actors[key] = actor_ids
+
+    actor_names = dict(
+        db.session.query(
+            User.id, User.name
+        ).filter(
+            User.id.in_({actor_ids[-1] for actor_ids in new_actors.values()})
+        ).all()
+    ) if new_actors else {}
+
+    now = datetime.utcnow()
+    notification_ids = {
+        key: unread[key].id for key in new_actors if key in unread
+    }
+
+    # Another worker may start one of these notifications first; then its
+    # row is the one that gets this batch's actors
+    uids = {
+        key: generate_unique_reference()
+        for key in new_actors if key not in unread
+    }
+    insert_ignoring_duplicates(Notification.__table__, [
+        dict(
+            uid=uid,
+            user_id=key[0],
+            notification_event_id=key[1],
+            target_entity_type_id=key[2],
+            target_entity_id=key[3],
+            unread_aggregation_key=Notification.aggregation_key(*key),
+            actor_count=0,
+            status_id=ACTIVE_STATUS_ID,
+            created_at=now,
+            modified_at=now)
+        for key, uid in uids.items()
+    ])
+
+    created = set()
+    if uids:
+        for key, (id_, uid) in _load_unread_notifications(uids).items():
+            notification_ids[key] = id_
+            if uid == uids[key]:
+                created.add(key)
+
+    # In id order, so concurrent workers lock rows in the same order
+    keys = sorted(notification_ids, key=notification_ids.get)
+    if not keys:
+        db.session.commit()
+        return
+
+    db.session.execute(_add_actors, [
+        dict(
+            notification_id=notification_ids[key],
+            added=len(new_actors[key]),
+            now=now)
+        for key in keys
+    ])
+
+    actor_counts = dict(
+        db.session.query(
+            Notification.id, Notification.actor_count
+        ).filter(
+            Notification.id.in_(notification_ids.values())
+        ).all()
+    )
+    db.session.execute(_set_text, [
+        dict(
+            notification_id=notification_ids[key],
+            notification_text=notification_text(
+                aggregates[key][0],
+                actor_names.get(new_actors[key][-1], 'Someone'),
+                actor_counts[notification_ids[key]]))
+        for key in keys
+    ])
+
+    entities = []
+    for key in keys:
+        notification_id = notification_ids[key]
+
+        if key in created:
+            entities.append(dict(
+                uid=generate_unique_reference(),
+                notification_id=notification_id,
+                notification_entity_type_id=key[2],
+                entity_id=key[3]))
+
+        entities.extend(
+            dict(
+                uid=generate_unique_reference(),
+                notification_id=notification_id,
+                notification_entity_type_id=user_type_id,
+                entity_id=actor_id)
+            for actor_id in new_actors[key])
+
+    db.session.bulk_insert_mappings(NotificationEntity, entities)
+
+    # Only new notifications are unread ones the recipient hasn't counted
+    created_per_recipient = defaultdict(int)
+    for recipient_id, _, _, _ in created:
+        created_per_recipient[recipient_id] += 1
+
+    recipients_by_count = defaultdict(list)
+    for recipient_id, count in created_per_recipient.items():
+        recipients_by_count[count].append(recipient_id)
+
+    for count, recipient_ids in recipients_by_count.items():
+        User.increment_counters(
+            recipient_ids, 'unread_notification_count', count)
+
+    db.session.commit()
+
+
+notification_worker = BackgroundWorker(
+    'notification-pipeline', _handle_domain_events,
+    max_queue_size=NOTIFICATION_QUEUE_SIZE,
+    batch_size=NOTIFICATION_BATCH_SIZE,
+    flush_interval=NOTIFICATION_FLUSH_INTERVAL)
+
+
+def publish_event(event, actor_id, target_type, target_id):
+    """Queue the domain event of `actor_id` doing `event` to the
+    `target_type` record `target_id`"""
+    notification_worker.submit((event, actor_id, target_type, target_id))
+
+
+@on_persistence_change('Like')
+def _publish_like(like):
+    if like.id is not None and not like.is_deleted():
+        publish_event(LIKE_EVENT, like.user_id, 'Post', like.post_id)
+
+
+@on_persistence_change('Comment')
+def _publish_comment(comment):
+    if comment.id is not None and not comment.is_deleted():
+        publish_event(COMMENT_EVENT, comment.user_id, 'Post', comment.post_id)
+
+
+def _handle_read_jobs(jobs):
+    ids, watermarks = defaultdict(set), {}
+
+    for user_id, notification_ids, up_to_id in jobs:
+        ids[user_id].update(notification_ids)
+        if up_to_id is not None:
+            watermarks[user_id] = max(up_to_id, watermarks.get(user_id, 0))
+
+    for user_id in set(ids) | set(watermarks):
+        up_to_id = watermarks.get(user_id)
+        if up_to_id is not None:
+            # Ids under the watermark are covered by it already
+            ids[user_id] = {
+                id_ for id_ in ids[user_id] if id_ > up_to_id}
+
+        Notification.mark_all_as_read(
+            user_id, ids=ids[user_id], up_to_id=up_to_id, _commit=False)
+
+    db.session.commit()
+
+
+read_state_worker = BackgroundWorker(
+    'notification-read-state', _handle_read_jobs)
+
+
+def schedule_mark_as_read(user_id, notification_ids=(), up_to_id=None):
+    """Queue `user_id`'s notifications with the given ids, or with ids up to
+    `up_to_id`, to be marked read"""
+    if not notification_ids and up_to_id is None:
+        return
+
+    read_state_worker.submit((user_id, list(notification_ids), up_to_id))
@@ -0,0 +1,99 @@
+"""Password hashing off the request thread.
+
+PBKDF2 is deliberately slow, so hashing and verification run in a bounded
+process pool instead of pinning the gunicorn worker's CPU. A pool size of
+0 hashes inline.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app import errors
+from app.constants import (
+    PASSWORD_HASH_METHOD, PASSWORD_HASHING_POOL_SIZE,
+    PASSWORD_HASHING_QUEUE_FACTOR, PASSWORD_HASHING_TIMEOUT)
+from utils import metrics
+
+
+class PasswordHasher(object):
+    def __init__(self, pool_size, timeout=PASSWORD_HASHING_TIMEOUT):
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self._executor = None
+        self._lock = threading.Lock()
+        # Bounds work waiting on the pool; the executor's own queue doesn't
+        self._slots = threading.BoundedSemaphore(
+            max(pool_size, 1) * PASSWORD_HASHING_QUEUE_FACTOR)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.pool_size)
+
+        return self._executor
+
+    def _run(self, func, *args):
+        if not self.pool_size:
+            return func(*args)
+
+        if not self._slots.acquire(timeout=self.timeout):
+            metrics.increment('password_hashing.rejected')
+            raise errors.ServiceUnavailable(
+                log_message='Password hashing pool queue is full')
+
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        # A job that times out keeps running in the pool, so it holds its
+        # slot until it's actually done
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            metrics.increment('password_hashing.timeouts')
+            raise errors.ServiceUnavailable(
+                log_message='Password hashing timed out')
+
+    def hash(self, password):
+        return self._run(
+            generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def needs_rehash(password_hash):
+    """Whether `password_hash` was made with outdated parameters"""
+    method = (password_hash or '').split('$', 1)[0]
+
+    return method != PASSWORD_HASH_METHOD
+
+
+_password_hasher = None
+_password_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    global _password_hasher
+
+    if _password_hasher is None:
+        with _password_hasher_lock:
+            if _password_hasher is None:
+                _password_hasher = PasswordHasher(current_app.config.get(
+                    'PASSWORD_HASHING_POOL_SIZE', PASSWORD_HASHING_POOL_SIZE))
+
+    return _password_hasher
@@ -1,19 +1,128 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
 from flask import current_app, request
 from flask_sqlalchemy import BaseQuery
+from sqlalchemy import and_, or_
 
+from app.constants import CURSOR_DATETIME_FORMAT
 from app.constants import statuses
 from app.errors import BadRequest
 
 
+def encode_cursor(values):
+    values = [
+        value.strftime(CURSOR_DATETIME_FORMAT)
+        if isinstance(value, datetime) else value
+        for value in values
+    ]
+
+    return base64.urlsafe_b64encode(
+        json.dumps(values).encode('utf-8')).decode('utf-8')
+
+
+def decode_cursor(cursor, types):
+    """Decode a cursor made by `encode_cursor` whose values have the given
+    python `types`"""
+    try:
+        values = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8'))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise BadRequest('`cursor` is invalid.')
+
+    if not isinstance(values, list) or len(values) != len(types):
+        raise BadRequest('`cursor` is invalid.')
+
+    decoded = []
+    for type_, value in zip(types, values):
+        if value is not None and type_ is datetime:
+            try:
+                value = datetime.strptime(value, CURSOR_DATETIME_FORMAT)
+            except (TypeError, ValueError):
+                raise BadRequest('`cursor` is invalid.')
+
+        decoded.append(value)
+
+    return decoded
+
+
+def _keyset_filter(columns, values):
+    """Build `(c1, c2, ...) < (v1, v2, ...)` without relying on row values"""
+    clauses = []
+
+    for index, (column, value) in enumerate(zip(columns, values)):
+        equalities = [
+            columns[i] == values[i] for i in range(index)
+        ]
+        clauses.append(and_(*(equalities + [column < value])))
+
+    return or_(*clauses)
+
+
+class CursorPagination(object):
+    def __init__(self, items, per_page, next_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+
+        self.meta = {
+            'pagination': {
+                'next_cursor': next_cursor,
+                'has_next_page': next_cursor is not None,
+                'per_page': per_page
+            }
+        }
+
+    def __iter__(self):
+        return iter(self.items)
+
+
 class CustomQuery(BaseQuery):
 
+    def _default_cursor_columns(self):
+        entity = self.column_descriptions[0]['entity']
+
+        return entity.created_at, entity.id
+
+    def cursor_paginate(self, cursor=None, per_page=None, cursor_columns=None):
+        """Page through the query newest-first, seeking past `cursor`.
+
+        `cursor` is the opaque value returned as `next_cursor` by the
+        previous page. No total count is computed, so every page costs the
+        same regardless of depth.
+        """
+        columns = cursor_columns or self._default_cursor_columns()
+
+        query = self.order_by(None).order_by(
+            *[column.desc() for column in columns])
+
+        if cursor:
+            query = query.filter(
+                _keyset_filter(columns, decode_cursor(
+                    cursor, [column.type.python_type for column in columns])))
+
+        rows = query.limit(per_page + 1).all()
+
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            next_cursor = encode_cursor(
+                [getattr(rows[-1], column.key) for column in columns])
+
+        return CursorPagination(rows, per_page, next_cursor)
+
     def paginate(self,
                  page=None,
                  per_page=None,
                  error_out=False,
                  max_per_page=None,
-                 use_request_args=True):
+                 use_request_args=True,
+                 cursor_columns=None,
+                 cursor_only=False):
         app = current_app
+        cursor = '' if cursor_only else None
 
         if use_request_args:
             # TODO:
@@ -30,8 +139,17 @@ class CustomQuery(BaseQuery):
             page = page or app.config['PAGINATION_DEFAULT_PAGE']
             per_page = per_page or app.config['PAGINATION_DEFAULT_PER_PAGE']
 
+            # An empty `cursor` asks for the first page in cursor mode
+            cursor = params.get('cursor', cursor)
+
         max_per_page = max_per_page or app.config['PAGINATION_DEFAULT_PER_PAGE']
 
+        if cursor is not None:
+            return self.cursor_paginate(
+                cursor=cursor,
+                per_page=min(int(per_page), int(max_per_page)),
+                cursor_columns=cursor_columns)
+
         pagination = super(CustomQuery,
                            self).paginate(page=int(page),
                                           per_page=int(per_page),
@@ -0,0 +1,221 @@
+"""Per-user daily request counts for billing.
+
+Each process counts requests in memory and periodically pushes its deltas
+to a shared backend, pulling back the totals recorded by every other
+worker. Syncs run on a background worker with its own database session,
+so requests never wait on, or inherit a failed transaction from, the
+backend. Reading a count never touches the access logs.
+"""
+import atexit
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.constants import REQUEST_COUNTER_SYNC_INTERVAL
+from app.logs import logger
+from utils import metrics
+from utils.workers import BackgroundWorker
+
+
+class LocalCounterBackend(object):
+    """Process-local stand-in for the shared backend"""
+
+    def __init__(self):
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._counts[key] += delta
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: self._counts.get(key, 0) for key in keys}
+
+
+class DatabaseCounterBackend(object):
+    """Shares counts between workers through `daily_request_counts`"""
+
+    def add(self, deltas):
+        # Leave the session usable for whoever shares it if this fails
+        try:
+            self._add(deltas)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _add(self, deltas):
+        from app.models import daily_request_counts as counts
+
+        for (user_id, day), delta in deltas.items():
+            where = db.and_(counts.c.user_id == user_id, counts.c.day == day)
+            update = counts.update().where(where).values(
+                count=counts.c.count + delta)
+
+            if db.session.execute(update).rowcount:
+                continue
+
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(counts.insert().values(
+                        user_id=user_id, day=day, count=delta))
+            except IntegrityError:
+                db.session.execute(update)
+
+        db.session.commit()
+
+    def get_many(self, keys):
+        try:
+            return self._get_many(keys)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _get_many(self, keys):
+        from app.models import daily_request_counts as counts
+
+        if not keys:
+            return {}
+
+        days = {day for _, day in keys}
+        user_ids = {user_id for user_id, _ in keys}
+
+        rows = db.session.query(
+            counts.c.user_id, counts.c.day, counts.c.count
+        ).filter(
+            counts.c.user_id.in_(user_ids),
+            counts.c.day.in_(days)
+        )
+
+        totals = {key: 0 for key in keys}
+        for user_id, day, count in rows:
+            if (user_id, day) in totals:
+                totals[(user_id, day)] = count
+
+        return totals
+
+
+COUNTER_BACKENDS = {
+    'database': DatabaseCounterBackend,
+    'local': LocalCounterBackend
+}
+
+
+class DailyRequestCounter(object):
+    """Count requests per user per UTC day in O(1).
+
+    Keys roll over at midnight, so each day's window starts from zero and
+    the previous day's entries are dropped on the next sync.
+    """
+
+    def __init__(self, backend, sync_interval=REQUEST_COUNTER_SYNC_INTERVAL):
+        self.backend = backend
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._shared = {}
+        self._synced_at = time.monotonic()
+        self._sync_scheduled = False
+        self._sync_worker = BackgroundWorker(
+            'request-counter-sync', lambda _: self.sync(), batch_size=1)
+
+    @staticmethod
+    def _key(user_id):
+        return user_id, datetime.utcnow().date()
+
+    def count(self, user_id):
+        key = self._key(user_id)
+
+        with self._lock:
+            return self._shared.get(key, 0) + self._pending.get(key, 0)
+
+    def increment(self, user_id):
+        """Record a request and return the user's count for today"""
+        key = self._key(user_id)
+
+        with self._lock:
+            self._pending[key] += 1
+            total = self._shared.get(key, 0) + self._pending[key]
+            due = not self._sync_scheduled and \
+                time.monotonic() - self._synced_at >= self.sync_interval
+            if due:
+                self._sync_scheduled = True
+
+        if due and not self._sync_worker.submit(True):
+            with self._lock:
+                self._sync_scheduled = False
+
+        return total
+
+    def sync(self):
+        """Push local deltas to the backend and pull back shared totals"""
+        today = datetime.utcnow().date()
+
+        with self._lock:
+            self._synced_at = time.monotonic()
+            self._sync_scheduled = False
+            pending, self._pending = self._pending, defaultdict(int)
+
+            # Keep what was just flushed visible until the backend answers
+            for key, delta in pending.items():
+                self._shared[key] = self._shared.get(key, 0) + delta
+
+            keys = [key for key in self._shared if key[1] == today]
+
+        try:
+            if pending:
+                self.backend.add(dict(pending))
+            totals = self.backend.get_many(keys)
+        except Exception:
+            logger.error('Request counter sync failed', exc_info=True)
+            metrics.increment('request_counter.sync_failures')
+
+            with self._lock:
+                for key, delta in pending.items():
+                    self._pending[key] += delta
+                    self._shared[key] -= delta
+            return
+
+        with self._lock:
+            self._shared = {
+                key: value for key, value in self._shared.items()
+                if key[1] == today
+            }
+            self._shared.update(totals)
+
+        metrics.increment('request_counter.syncs')
+        metrics.set_gauge('request_counter.tracked_users', len(keys))
+
+
+_request_counter = None
+_request_counter_lock = threading.Lock()
+
+
+def _flush_on_exit(app, counter):
+    with app.app_context():
+        counter.sync()
+
+
+def get_request_counter():
+    global _request_counter
+
+    if _request_counter is not None:
+        return _request_counter
+
+    with _request_counter_lock:
+        if _request_counter is None:
+            app = current_app._get_current_object()
+            backend = COUNTER_BACKENDS[
+                app.config.get('REQUEST_COUNTER_BACKEND', 'database')]()
+
+            _request_counter = DailyRequestCounter(backend)
+            atexit.register(_flush_on_exit, app, _request_counter)
+
+    return _request_counter
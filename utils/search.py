@@ -0,0 +1,200 @@
+"""Full-text search over post text and comments.
+
+Documents live in a `search_documents` table built on the database's own
+full-text facility: an FTS5 virtual table on SQLite and a GIN-indexed
+`tsvector` column on Postgres. Posts and comments are re-indexed by a
+background worker whenever they change through `Persistence`.
+"""
+import re
+
+from app import db, errors, logger
+from app.constants import SEARCH_TEXT_CONFIG
+from app.models import Comment, Post
+from app.models.mixins import on_persistence_change
+from utils.workers import BackgroundWorker
+
+
+_SEARCHABLE_MODELS = {
+    'comment': Comment,
+    'post': Post
+}
+
+_WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+class _SQLiteSearchBackend(object):
+    schema = [
+        'CREATE VIRTUAL TABLE IF NOT EXISTS search_documents USING fts5('
+        'body, entity_type UNINDEXED, entity_id UNINDEXED, '
+        'post_id UNINDEXED)'
+    ]
+
+    insert = (
+        'INSERT INTO search_documents (body, entity_type, entity_id, post_id) '
+        'VALUES (:body, :entity_type, :entity_id, :post_id)'
+    )
+
+    # bm25() is smaller for better matches, so it is negated into a score.
+    # LIMIT -1 stops SQLite flattening this into the grouping query, where
+    # bm25() can't be evaluated.
+    matches = (
+        'SELECT post_id, -bm25(search_documents) AS score '
+        'FROM search_documents WHERE search_documents MATCH :query LIMIT -1'
+    )
+
+    @staticmethod
+    def prepare_query(text):
+        # Quote every word so user input can't use FTS5 query syntax
+        return ' '.join(
+            '"{}"'.format(word) for word in _WORD_PATTERN.findall(text))
+
+
+class _PostgresSearchBackend(object):
+    schema = [
+        'CREATE TABLE IF NOT EXISTS search_documents ('
+        'entity_type VARCHAR(16) NOT NULL, entity_id INTEGER NOT NULL, '
+        'post_id INTEGER NOT NULL, document TSVECTOR NOT NULL, '
+        'PRIMARY KEY (entity_type, entity_id))',
+        'CREATE INDEX IF NOT EXISTS search_documents_document_index '
+        'ON search_documents USING GIN (document)'
+    ]
+
+    insert = (
+        'INSERT INTO search_documents '
+        '(entity_type, entity_id, post_id, document) '
+        "VALUES (:entity_type, :entity_id, :post_id, "
+        "to_tsvector('{0}', :body))".format(SEARCH_TEXT_CONFIG)
+    )
+
+    matches = (
+        "SELECT post_id, ts_rank(document, plainto_tsquery('{0}', :query)) "
+        "AS score FROM search_documents "
+        "WHERE document @@ plainto_tsquery('{0}', :query)".format(
+            SEARCH_TEXT_CONFIG)
+    )
+
+    @staticmethod
+    def prepare_query(text):
+        return ' '.join(_WORD_PATTERN.findall(text))
+
+
+_SEARCH_BACKENDS = {
+    'postgresql': _PostgresSearchBackend,
+    'sqlite': _SQLiteSearchBackend
+}
+
+
+def _get_backend():
+    dialect = db.session.get_bind().dialect.name
+
+    try:
+        return _SEARCH_BACKENDS[dialect]
+    except KeyError:
+        raise errors.InternalServerError(
+            log_message='Full-text search is not supported on {}'.format(
+                dialect))
+
+
+def create_search_index():
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in _SEARCH_BACKENDS:
+        logger.warning(
+            'Full-text search is not supported on {}; skipping'.format(
+                dialect))
+        return
+
+    for statement in _SEARCH_BACKENDS[dialect].schema:
+        db.session.execute(db.text(statement))
+
+    db.session.commit()
+
+
+def _document_for(entity_type, record):
+    post_id = record.id if entity_type == 'post' else record.post_id
+
+    return dict(
+        entity_type=entity_type, entity_id=record.id, post_id=post_id,
+        body=record.text or '')
+
+
+def index_documents(entity_type, ids, _commit=True):
+    """Bring the documents of `entity_type` records with `ids` up to date,
+    dropping those of records that are gone or no longer active"""
+    if not ids:
+        return
+
+    model = _SEARCHABLE_MODELS[entity_type]
+    backend = _get_backend()
+
+    db.session.execute(
+        db.text(
+            'DELETE FROM search_documents WHERE entity_type = :entity_type '
+            'AND entity_id IN :ids'
+        ).bindparams(db.bindparam('ids', expanding=True)),
+        dict(entity_type=entity_type, ids=list(ids)))
+
+    documents = [
+        _document_for(entity_type, record)
+        for record in model.get_active_by_ids(ids) if record.text
+    ]
+    if documents:
+        db.session.execute(db.text(backend.insert), documents)
+
+    if _commit:
+        db.session.commit()
+
+
+def search_post_ids(text, limit, after=None):
+    """Return up to `limit` `(post_id, score)` pairs for posts whose text or
+    comments match `text`, best first. `after` is the last pair of the
+    previous page."""
+    backend = _get_backend()
+
+    query = backend.prepare_query(text)
+    if not query:
+        return []
+
+    params = dict(query=query, limit=limit)
+    seek = ''
+    if after is not None:
+        seek = (
+            'WHERE score < :score OR (score = :score AND post_id < :post_id)')
+        params.update(score=after[1], post_id=after[0])
+
+    statement = (
+        'SELECT post_id, score FROM ('
+        'SELECT post_id, MAX(score) AS score FROM ({matches}) AS matches '
+        'GROUP BY post_id) AS ranked {seek} '
+        'ORDER BY score DESC, post_id DESC LIMIT :limit'
+    ).format(matches=backend.matches, seek=seek)
+
+    return [
+        (post_id, float(score))
+        for post_id, score in db.session.execute(db.text(statement), params)
+    ]
+
+
+def _handle_index_jobs(jobs):
+    ids_by_type = {}
+    for entity_type, id_ in jobs:
+        ids_by_type.setdefault(entity_type, set()).add(id_)
+
+    for entity_type, ids in ids_by_type.items():
+        index_documents(entity_type, list(ids), _commit=False)
+
+    db.session.commit()
+
+
+search_index_worker = BackgroundWorker('search-indexer', _handle_index_jobs)
+
+
+@on_persistence_change('Post')
+def _reindex_post(post):
+    if post.id is not None:
+        search_index_worker.submit(('post', post.id))
+
+
+@on_persistence_change('Comment')
+def _reindex_comment(comment):
+    if comment.id is not None:
+        search_index_worker.submit(('comment', comment.id))
@@ -0,0 +1,149 @@
+"""Signed, expiring blob URLs and delivery through the front proxy.
+
+Blob URLs carry an `expires` timestamp and an HMAC of the blob, variant
+and expiry, so anyone holding one may fetch the blob until it expires
+without authenticating. Expiries are rounded up to
+`BLOB_URL_EXPIRY_GRANULARITY`, so every URL signed in the same window is
+identical and stays cacheable.
+
+The blob endpoint only checks the signature: the bytes are sent by the
+front proxy, which is told where to find them through `X-Accel-Redirect`
+(nginx) or `X-Sendfile` (Apache, lighttpd). For nginx, map the prefix to
+the blob store with an internal location:
+
+    location /protected-blobs/ {
+        internal;
+        alias /var/lib/social-network/blobs/;
+    }
+
+`AccelRedirectEmulator` plays nginx's part when running without one.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+from flask import current_app, url_for
+from werkzeug.security import safe_join
+from werkzeug.wrappers import Request, Response
+from werkzeug.wsgi import wrap_file
+
+from app.constants import BLOB_URL_EXPIRY_GRANULARITY, BLOB_URL_LIFESPAN
+from app.errors import ResourceNotFound
+
+
+def _get_signing_key():
+    config = current_app.config
+    key = config.get('BLOB_URL_SIGNING_KEY') or config['SECRET_KEY']
+
+    return key.encode('utf-8') if isinstance(key, str) else key
+
+
+def _message(blob_uid, variant, expires):
+    return '{}:{}:{}'.format(blob_uid, variant or '', expires).encode('utf-8')
+
+
+def _encode(mac):
+    return base64.urlsafe_b64encode(mac.digest()).rstrip(b'=').decode('ascii')
+
+
+def current_expiry():
+    expires = int(time.time()) + BLOB_URL_LIFESPAN
+
+    return expires - expires % BLOB_URL_EXPIRY_GRANULARITY + \
+        BLOB_URL_EXPIRY_GRANULARITY
+
+
+class BlobUrlSigner(object):
+    """Sign many blob URLs with one key and expiry"""
+
+    def __init__(self, key=None, expires=None):
+        self.expires = expires or current_expiry()
+        self._mac = hmac.new(
+            key or _get_signing_key(), digestmod=hashlib.sha256)
+
+    def signature(self, blob_uid, variant=None):
+        mac = self._mac.copy()
+        mac.update(_message(blob_uid, variant, self.expires))
+
+        return _encode(mac)
+
+    def url(self, blob_uid, variant=None):
+        return url_for(
+            'api_blueprint.blob', blob_uid=blob_uid, variant=variant,
+            expires=self.expires, signature=self.signature(blob_uid, variant))
+
+
+def verify_blob_signature(blob_uid, variant, expires, signature):
+    """Raise ResourceNotFound unless `signature` is valid and unexpired"""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        raise ResourceNotFound('Blob not found')
+
+    expected = _encode(hmac.new(
+        _get_signing_key(), _message(blob_uid, variant, expires),
+        hashlib.sha256))
+
+    if not hmac.compare_digest(expected, signature or '') or \
+            expires < time.time():
+        raise ResourceNotFound('Blob not found')
+
+    return expires
+
+
+def offload_response(path, root, mime_type):
+    """Return an empty response telling the front proxy to send the file at
+    `path`, which lives under `root`"""
+    response = Response(mimetype=mime_type)
+
+    delivery = current_app.config.get('BLOB_DELIVERY', 'x-accel-redirect')
+    if delivery == 'x-sendfile':
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        prefix = current_app.config.get(
+            'BLOB_ACCEL_REDIRECT_PREFIX', '/protected-blobs/')
+        response.headers['X-Accel-Redirect'] = prefix + os.path.relpath(
+            path, root).replace(os.sep, '/')
+
+    return response
+
+
+class AccelRedirectEmulator(object):
+    """WSGI middleware that serves `X-Accel-Redirect` responses from disk
+    the way nginx would, for running without a front proxy"""
+
+    def __init__(self, app, prefix, root):
+        self.app = app
+        self.prefix = prefix
+        self.root = root
+
+    def __call__(self, environ, start_response):
+        response = Response.from_app(self.app, environ)
+
+        location = response.headers.get('X-Accel-Redirect')
+        if location is None or not location.startswith(self.prefix):
+            return response(environ, start_response)
+
+        response.close()
+
+        path = safe_join(self.root, location[len(self.prefix):])
+        if path is None or not os.path.isfile(path):
+            return Response(status=404)(environ, start_response)
+
+        file_response = Response(
+            wrap_file(environ, open(path, 'rb')), mimetype=response.mimetype,
+            direct_passthrough=True)
+        # nginx consumes the redirect header rather than passing it on
+        for header, value in response.headers.items():
+            if header.lower() not in (
+                    'content-type', 'content-length', 'x-accel-redirect'):
+                file_response.headers[header] = value
+
+        file_response.content_length = os.path.getsize(path)
+        file_response.make_conditional(
+            Request(environ), accept_ranges=True,
+            complete_length=os.path.getsize(path))
+
+        return file_response(environ, start_response)
@@ -0,0 +1,205 @@
+"""Materialized home timelines.
+
+Every user with a warm timeline has the ids of the posts on their home feed
+stored in `timeline_entries`. New posts are pushed to the timelines of the
+author's followers by a background worker, so reading a feed is a single
+indexed range scan instead of a join over `followers`.
+"""
+from datetime import datetime
+
+from app import db
+from app.constants import TIMELINE_FAN_OUT_BATCH_SIZE, TIMELINE_MAX_LENGTH
+from app.constants.statuses import ACTIVE_STATUS_ID
+from app.models import (
+    Post, followers, materialized_timelines, timeline_entries)
+from utils.workers import BackgroundWorker
+
+
+_FAN_OUT = 'fan_out'
+_REBUILD = 'rebuild'
+
+
+def _chunks(items, size):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+def prepare_timeline_posts_query(user_id):
+    """Return the posts of `user_id` and of the users they follow"""
+    followed = Post.query.join(
+        followers, (followers.c.followed_id == Post.user_id)
+    ).filter(
+        followers.c.follower_id == user_id
+    )
+
+    own = Post.query.filter_by(
+        user_id=user_id
+    )
+
+    return followed.union(own).filter(
+        Post.status_id == ACTIVE_STATUS_ID
+    ).order_by(
+        Post.id.desc()
+    )
+
+
+def is_timeline_warm(user_id):
+    return db.session.query(
+        materialized_timelines.c.user_id
+    ).filter(
+        materialized_timelines.c.user_id == user_id
+    ).first() is not None
+
+
+def prepare_timeline_entries_query(user_id):
+    return db.session.query(
+        timeline_entries.c.post_id
+    ).filter(
+        timeline_entries.c.user_id == user_id
+    ).order_by(
+        timeline_entries.c.post_id.desc()
+    )
+
+
+def rebuild_timeline(user_id, _commit=True):
+    """Materialize the newest `TIMELINE_MAX_LENGTH` posts for a user"""
+    post_ids = [
+        post.id for post in prepare_timeline_posts_query(
+            user_id
+        ).limit(
+            TIMELINE_MAX_LENGTH
+        )
+    ]
+
+    db.session.execute(
+        timeline_entries.delete().where(
+            timeline_entries.c.user_id == user_id)
+    )
+    db.session.execute(
+        materialized_timelines.delete().where(
+            materialized_timelines.c.user_id == user_id)
+    )
+
+    for chunk in _chunks(post_ids, TIMELINE_FAN_OUT_BATCH_SIZE):
+        db.session.execute(
+            timeline_entries.insert(),
+            [dict(user_id=user_id, post_id=post_id) for post_id in chunk]
+        )
+
+    db.session.execute(
+        materialized_timelines.insert(),
+        [dict(user_id=user_id, materialized_at=datetime.utcnow())]
+    )
+
+    if _commit:
+        db.session.commit()
+
+
+def invalidate_timeline(user_id):
+    """Drop a user's materialized timeline so it is rebuilt on next read"""
+    db.session.execute(
+        materialized_timelines.delete().where(
+            materialized_timelines.c.user_id == user_id)
+    )
+    db.session.execute(
+        timeline_entries.delete().where(
+            timeline_entries.c.user_id == user_id)
+    )
+    db.session.commit()
+
+
+def remove_post_from_timelines(post, _commit=True):
+    db.session.execute(
+        timeline_entries.delete().where(
+            timeline_entries.c.post_id == post.id)
+    )
+
+    if _commit:
+        db.session.commit()
+
+
+def _trim_timelines(user_ids):
+    """Drop the entries of `user_ids` beyond their newest
+    `TIMELINE_MAX_LENGTH`"""
+    ranked = db.session.query(
+        timeline_entries.c.user_id,
+        timeline_entries.c.post_id,
+        db.func.row_number().over(
+            partition_by=timeline_entries.c.user_id,
+            order_by=timeline_entries.c.post_id.desc()
+        ).label('position')
+    ).filter(
+        timeline_entries.c.user_id.in_(user_ids)
+    ).subquery()
+
+    # The oldest entry each full timeline keeps
+    cutoffs = [
+        dict(trimmed_user_id=user_id, cutoff=post_id)
+        for user_id, post_id in db.session.query(
+            ranked.c.user_id, ranked.c.post_id
+        ).filter(
+            ranked.c.position == TIMELINE_MAX_LENGTH
+        )
+    ]
+
+    if cutoffs:
+        db.session.execute(
+            timeline_entries.delete().where(
+                db.and_(
+                    timeline_entries.c.user_id ==
+                    db.bindparam('trimmed_user_id'),
+                    timeline_entries.c.post_id < db.bindparam('cutoff'))
+            ),
+            cutoffs
+        )
+
+
+def _fan_out_post(post_id, author_id):
+    # Only warm timelines receive entries; cold ones are rebuilt from
+    # scratch on their next read anyway.
+    recipient_ids = [
+        row[0] for row in db.session.query(
+            materialized_timelines.c.user_id
+        ).outerjoin(
+            followers, followers.c.follower_id ==
+            materialized_timelines.c.user_id
+        ).filter(
+            db.or_(
+                followers.c.followed_id == author_id,
+                materialized_timelines.c.user_id == author_id)
+        ).distinct()
+    ]
+
+    for chunk in _chunks(recipient_ids, TIMELINE_FAN_OUT_BATCH_SIZE):
+        db.session.execute(
+            timeline_entries.insert(),
+            [dict(user_id=user_id, post_id=post_id) for user_id in chunk]
+        )
+        _trim_timelines(chunk)
+
+
+def _handle_timeline_jobs(jobs):
+    rebuilt = set()
+
+    for job in jobs:
+        if job[0] == _FAN_OUT:
+            _, post_id, author_id = job
+            _fan_out_post(post_id, author_id)
+
+        elif job[0] == _REBUILD and job[1] not in rebuilt:
+            rebuilt.add(job[1])
+            rebuild_timeline(job[1], _commit=False)
+
+    db.session.commit()
+
+
+timeline_worker = BackgroundWorker('timeline-fan-out', _handle_timeline_jobs)
+
+
+def fan_out_post(post):
+    """Queue `post` to be pushed onto its author's followers' timelines"""
+    timeline_worker.submit((_FAN_OUT, post.id, post.user_id))
+
+
+def schedule_timeline_rebuild(user_id):
+    timeline_worker.submit((_REBUILD, user_id))
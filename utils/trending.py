@@ -0,0 +1,341 @@
+"""Trending hash tags from streaming sketches.
+
+Tag usages are counted into time buckets. Each bucket holds a Count-Min
+sketch, which estimates how often any tag was used, and a Space-Saving
+summary, which keeps the candidates most likely to be heavy hitters.
+Memory and the cost of a top-K query depend only on the sketch sizes and
+the number of buckets in the window, never on posting volume.
+
+Every worker process snapshots only the usages it recorded itself, to its
+own file next to `TRENDING_SNAPSHOT_PATH`, and periodically merges the
+other workers' snapshots in as read-only peer buckets.
+"""
+import atexit
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+
+from flask import current_app
+
+from app.constants import (
+    TRENDING_BUCKET_SECONDS, TRENDING_CANDIDATES, TRENDING_RESULT_TTL,
+    TRENDING_RETENTION_SECONDS, TRENDING_SKETCH_DEPTH, TRENDING_SKETCH_WIDTH,
+    TRENDING_SNAPSHOT_INTERVAL)
+from app.logs import logger
+from utils import metrics
+
+
+class CountMinSketch(object):
+    def __init__(self, width=TRENDING_SKETCH_WIDTH,
+                 depth=TRENDING_SKETCH_DEPTH, rows=None):
+        self.width = width
+        self.depth = depth
+        self.rows = rows or [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+
+        return [(first + row * second) % self.width
+                for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        for row, index in enumerate(self._indexes(key)):
+            self.rows[row][index] += count
+
+    def estimate(self, key):
+        return min(
+            self.rows[row][index]
+            for row, index in enumerate(self._indexes(key)))
+
+    def copy(self):
+        return CountMinSketch(
+            self.width, self.depth, rows=[row[:] for row in self.rows])
+
+    @classmethod
+    def merge(cls, sketches, width=TRENDING_SKETCH_WIDTH,
+              depth=TRENDING_SKETCH_DEPTH):
+        """Sum `sketches` cell by cell into one covering all their usages"""
+        sketches = list(sketches)
+        if not sketches:
+            return cls(width, depth)
+
+        return cls(
+            sketches[0].width, sketches[0].depth,
+            rows=[
+                [sum(cells) for cells in zip(
+                    *(sketch.rows[row] for sketch in sketches))]
+                for row in range(sketches[0].depth)
+            ])
+
+
+class SpaceSaving(object):
+    """Keep at most `capacity` candidate heavy hitters"""
+
+    def __init__(self, capacity=TRENDING_CANDIDATES, counts=None):
+        self.capacity = capacity
+        self.counts = counts or {}
+
+    def add(self, key, count=1):
+        if key in self.counts or len(self.counts) < self.capacity:
+            self.counts[key] = self.counts.get(key, 0) + count
+            return
+
+        # Evict the smallest candidate; the newcomer inherits its count as
+        # the upper bound on how often it may already have been seen
+        smallest = min(self.counts, key=self.counts.get)
+        self.counts[key] = self.counts.pop(smallest) + count
+
+    @classmethod
+    def merge(cls, summaries, capacity=TRENDING_CANDIDATES):
+        counts = {}
+        for summary in summaries:
+            for key, count in summary.counts.items():
+                counts[key] = counts.get(key, 0) + count
+
+        return cls(capacity, counts=dict(
+            sorted(counts.items(), key=lambda item: -item[1])[:capacity]))
+
+
+class _Bucket(object):
+    def __init__(self, start, sketch=None, candidates=None):
+        self.start = start
+        self.sketch = sketch or CountMinSketch()
+        self.candidates = candidates or SpaceSaving()
+
+    def copy(self):
+        return _Bucket(
+            self.start, sketch=self.sketch.copy(),
+            candidates=SpaceSaving(
+                self.candidates.capacity, counts=dict(self.candidates.counts)))
+
+    @classmethod
+    def merge(cls, start, buckets):
+        return cls(
+            start,
+            sketch=CountMinSketch.merge(bucket.sketch for bucket in buckets),
+            candidates=SpaceSaving.merge(
+                bucket.candidates for bucket in buckets))
+
+    def as_json(self):
+        return {
+            'start': self.start,
+            'sketch': self.sketch.rows,
+            'candidates': self.candidates.counts
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data['start'],
+            sketch=CountMinSketch(rows=data['sketch']),
+            candidates=SpaceSaving(counts=data['candidates']))
+
+
+class TrendingHashTags(object):
+    def __init__(self, bucket_seconds=TRENDING_BUCKET_SECONDS,
+                 retention_seconds=TRENDING_RETENTION_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.retention_seconds = retention_seconds
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._peer_buckets = {}
+        self._results = {}
+
+    def _bucket_start(self, timestamp):
+        return int(timestamp) - int(timestamp) % self.bucket_seconds
+
+    def _expire(self, now):
+        oldest = self._bucket_start(now - self.retention_seconds)
+
+        for buckets in [self._buckets, self._peer_buckets]:
+            for start in [start for start in buckets if start < oldest]:
+                del buckets[start]
+
+    def record(self, entities, timestamp=None):
+        now = time.time()
+        start = self._bucket_start(timestamp or now)
+
+        with self._lock:
+            bucket = self._buckets.get(start)
+            if bucket is None:
+                bucket = self._buckets[start] = _Bucket(start)
+                self._expire(now)
+
+            for entity in entities:
+                bucket.sketch.add(entity)
+                bucket.candidates.add(entity)
+
+        metrics.increment('trending.usages_recorded', len(entities))
+
+    def top(self, window_seconds, limit):
+        """Return `[(entity, estimated_count)]` for the last `window_seconds`,
+        most used first"""
+        cached = self._results.get((window_seconds, limit))
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        oldest = self._bucket_start(time.time() - window_seconds)
+
+        # Only copy under the lock; `record` waits on it
+        with self._lock:
+            buckets = [
+                bucket.copy() for start, bucket in self._buckets.items()
+                if start >= oldest
+            ]
+            # Peer buckets are replaced wholesale, never mutated
+            buckets.extend(
+                bucket for start, bucket in self._peer_buckets.items()
+                if start >= oldest)
+
+        # The cell-wise sum of the window's sketches is itself a sketch of
+        # the window, so each candidate is hashed and looked up just once
+        sketch = CountMinSketch.merge(bucket.sketch for bucket in buckets)
+
+        candidates = set()
+        for bucket in buckets:
+            candidates.update(bucket.candidates.counts)
+
+        estimates = [
+            (entity, sketch.estimate(entity)) for entity in candidates]
+
+        result = sorted(estimates, key=lambda item: (-item[1], item[0]))[
+            :limit]
+        self._results[(window_seconds, limit)] = (
+            time.monotonic() + TRENDING_RESULT_TTL, result)
+
+        return result
+
+    def save(self, path):
+        """Atomically write the buckets recorded by this process to `path`"""
+        with self._lock:
+            data = [bucket.as_json() for bucket in self._buckets.values()]
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'w') as snapshot:
+            json.dump(data, snapshot)
+
+        os.replace(temporary_path, path)
+
+    def load_peers(self, paths):
+        """Replace the peer buckets with the snapshots at `paths` merged.
+
+        They count towards `top` but are never saved by this process, so a
+        usage is only ever in the snapshot of the worker that recorded it.
+        """
+        oldest = time.time() - self.retention_seconds
+        buckets_by_start = {}
+
+        for path in paths:
+            try:
+                if os.path.getmtime(path) < oldest:
+                    # Left behind by a worker that's gone for good
+                    os.remove(path)
+                    continue
+
+                with open(path) as snapshot:
+                    buckets = [
+                        _Bucket.from_json(data)
+                        for data in json.load(snapshot)
+                    ]
+            except (IOError, OSError, ValueError, KeyError):
+                logger.error(
+                    'Could not read trending hash tags snapshot {}'.format(
+                        path),
+                    exc_info=True)
+                continue
+
+            for bucket in buckets:
+                buckets_by_start.setdefault(bucket.start, []).append(bucket)
+
+        peer_buckets = {
+            start: _Bucket.merge(start, buckets)
+            for start, buckets in buckets_by_start.items()
+        }
+
+        with self._lock:
+            self._peer_buckets = peer_buckets
+            self._expire(time.time())
+
+
+def get_snapshot_paths(path):
+    """Return the replayed snapshot at `path` and every worker's snapshot"""
+    paths = [
+        candidate for candidate in glob.glob(glob.escape(path) + '.*')
+        if not candidate.endswith('.tmp')
+    ]
+    if os.path.exists(path):
+        paths.insert(0, path)
+
+    return paths
+
+
+def remove_worker_snapshots(path):
+    for worker_path in get_snapshot_paths(path):
+        if worker_path != path:
+            os.remove(worker_path)
+
+
+def _load_peers(tracker, path, worker_path):
+    tracker.load_peers([
+        peer_path for peer_path in get_snapshot_paths(path)
+        if peer_path != worker_path
+    ])
+
+
+def _snapshot_periodically(tracker, path, worker_path):
+    while True:
+        time.sleep(TRENDING_SNAPSHOT_INTERVAL)
+
+        try:
+            tracker.save(worker_path)
+        except (IOError, OSError):
+            logger.error('Trending hash tags snapshot failed', exc_info=True)
+
+        _load_peers(tracker, path, worker_path)
+
+
+_trending_hash_tags = None
+_trending_hash_tags_lock = threading.Lock()
+
+
+def get_snapshot_path():
+    return current_app.config.get(
+        'TRENDING_SNAPSHOT_PATH', 'data/trending_hash_tags.json')
+
+
+def get_trending_hash_tags():
+    """Return this process's tracker, with the other snapshots as peers"""
+    global _trending_hash_tags
+
+    if _trending_hash_tags is not None:
+        return _trending_hash_tags
+
+    with _trending_hash_tags_lock:
+        if _trending_hash_tags is None:
+            path = get_snapshot_path()
+            # The start time keeps a reused pid from overwriting the
+            # snapshot of a worker that has since exited
+            worker_path = '{}.{}-{}'.format(
+                path, os.getpid(), int(time.time()))
+            tracker = TrendingHashTags()
+            _load_peers(tracker, path, worker_path)
+
+            threading.Thread(
+                target=_snapshot_periodically,
+                args=(tracker, path, worker_path),
+                name='trending-snapshot', daemon=True).start()
+            atexit.register(tracker.save, worker_path)
+
+            _trending_hash_tags = tracker
+
+    return _trending_hash_tags
@@ -0,0 +1,330 @@
+"""In-memory prefix indexes for username and hash tag autocomplete.
+
+Each index is a sorted array of lower-cased keys searched with bisect.
+Matches are ranked by a popularity weight. When a prefix matches more
+than `TYPEAHEAD_SCAN_LIMIT` keys, the `TYPEAHEAD_MAX_LIMIT` heaviest of
+them are kept as a ranked list that weight changes update in place, so
+short, popular prefixes are not rescanned on every keystroke or follow.
+
+Every worker process holds its own indexes. Besides its own writes, it
+adds the users and hash tags other workers created every
+`TYPEAHEAD_SYNC_INTERVAL` seconds, and rebuilds both indexes every
+`TYPEAHEAD_REBUILD_INTERVAL` seconds to pick up renames, deletions and
+the other workers' weight changes.
+"""
+import bisect
+import heapq
+import os
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.constants import (
+    TYPEAHEAD_MAX_LIMIT, TYPEAHEAD_REBUILD_INTERVAL, TYPEAHEAD_SCAN_LIMIT,
+    TYPEAHEAD_SYNC_INTERVAL)
+from app.constants.statuses import DELETED_STATUS_ID
+from app.logs import logger
+from app.models import HashTag, User, followers
+from app.models.mixins import on_persistence_change
+from utils import metrics
+
+
+class PrefixIndex(object):
+    def __init__(self, name):
+        self.name = name
+
+        self._entries = []  # sorted (key, ref)
+        self._keys = {}     # ref -> key
+        self._payloads = {}
+        self._weights = {}
+        self._top = {}      # prefix -> its heaviest refs, heaviest first
+        self._lock = threading.RLock()
+
+        metrics.register_gauge('{}.size'.format(name), self.__len__)
+
+    def __contains__(self, ref):
+        return ref in self._keys
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _ranked_prefixes_of(self, key):
+        for length in range(1, len(key) + 1):
+            top = self._top.get(key[:length])
+            if top is not None:
+                yield key[:length], top
+
+    def _rerank(self, ref, old_weight):
+        """Move `ref` within the ranked lists of its key's prefixes after
+        its weight changed from `old_weight`"""
+        weight = self._weights[ref]
+
+        for prefix, top in list(self._ranked_prefixes_of(self._keys[ref])):
+            # Keys outside a full list weigh at most as much as the lightest
+            # one in it did
+            full = len(top) >= TYPEAHEAD_MAX_LIMIT
+
+            if ref in top:
+                lightest = min([old_weight] + [
+                    self._weights[other] for other in top if other != ref])
+                if full and weight < lightest:
+                    # Some key outside the list may now outrank it
+                    del self._top[prefix]
+                    continue
+            elif not full or weight > self._weights[top[-1]]:
+                top.append(ref)
+            else:
+                continue
+
+            top.sort(key=self._weights.get, reverse=True)
+            del top[TYPEAHEAD_MAX_LIMIT:]
+
+    def _unrank(self, ref, key):
+        for prefix, top in list(self._ranked_prefixes_of(key)):
+            if ref not in top:
+                continue
+
+            if len(top) >= TYPEAHEAD_MAX_LIMIT:
+                # The next heaviest key isn't known without a rescan
+                del self._top[prefix]
+            else:
+                top.remove(ref)
+
+    def load(self, items):
+        """Replace the contents with `(ref, key, payload, weight)` items"""
+        entries, keys, payloads, weights = [], {}, {}, {}
+
+        for ref, key, payload, weight in items:
+            key = key.lower()
+            entries.append((key, ref))
+            keys[ref] = key
+            payloads[ref] = payload
+            weights[ref] = weight
+
+        entries.sort()
+
+        with self._lock:
+            self._entries, self._keys = entries, keys
+            self._payloads, self._weights = payloads, weights
+            self._top = {}
+
+    def upsert(self, ref, key, payload, weight=None):
+        key = key.lower()
+
+        with self._lock:
+            old_key = self._keys.get(ref)
+            if old_key is not None and old_key != key:
+                self.remove(ref)
+                old_key = None
+
+            if old_key is None:
+                bisect.insort(self._entries, (key, ref))
+                self._keys[ref] = key
+
+            self._payloads[ref] = payload
+            old_weight = self._weights.get(ref)
+            if weight is not None or old_weight is None:
+                self._weights[ref] = weight or 0
+
+            self._rerank(ref, old_weight)
+
+    def bump(self, ref, delta=1):
+        with self._lock:
+            if ref not in self._keys:
+                return
+
+            old_weight = self._weights[ref]
+            self._weights[ref] += delta
+            self._rerank(ref, old_weight)
+
+    def remove(self, ref):
+        with self._lock:
+            key = self._keys.pop(ref, None)
+            if key is None:
+                return
+
+            index = bisect.bisect_left(self._entries, (key, ref))
+            if index < len(self._entries) and \
+                    self._entries[index] == (key, ref):
+                del self._entries[index]
+
+            self._unrank(ref, key)
+            self._payloads.pop(ref, None)
+            self._weights.pop(ref, None)
+
+    def search(self, prefix, limit):
+        """Return the payloads of the `limit` heaviest keys starting with
+        `prefix`"""
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is not None and limit <= TYPEAHEAD_MAX_LIMIT:
+                return [self._payloads[ref] for ref in top[:limit]]
+
+            start = bisect.bisect_left(self._entries, (prefix,))
+            end = bisect.bisect_left(self._entries, (prefix + '\uffff',))
+
+            refs = [ref for _, ref in self._entries[start:end]]
+            ranked = end - start > TYPEAHEAD_SCAN_LIMIT and \
+                limit <= TYPEAHEAD_MAX_LIMIT
+            best = heapq.nlargest(
+                TYPEAHEAD_MAX_LIMIT if ranked else limit, refs,
+                key=self._weights.get)
+
+            if ranked:
+                self._top[prefix] = best
+
+            return [self._payloads[ref] for ref in best[:limit]]
+
+
+user_index = PrefixIndex('typeahead.users')
+hash_tag_index = PrefixIndex('typeahead.hash_tags')
+
+
+def _user_payload(user):
+    return {'uid': user.uid, 'name': user.name}
+
+
+def _hash_tag_payload(entity):
+    return {'entity': entity}
+
+
+# Ids up to which the indexes hold every user and hash tag
+_synced_up_to = {'hash_tags': 0, 'users': 0}
+
+
+def build_typeahead_indexes():
+    """Load every active username and hash tag, weighted by popularity"""
+    follower_counts = dict(
+        db.session.query(
+            followers.c.followed_id, db.func.count()
+        ).group_by(
+            followers.c.followed_id
+        )
+    )
+
+    users = db.session.query(
+        User.id, User.uid, User.name
+    ).filter(
+        User.status_id != DELETED_STATUS_ID,
+        User.name.isnot(None)
+    ).all()
+
+    user_index.load(
+        (id_, name, {'uid': uid, 'name': name}, follower_counts.get(id_, 0))
+        for id_, uid, name in users)
+
+    # The post count columns leave out striped increments, which is close
+    # enough to rank suggestions by
+    hash_tags = db.session.query(
+        HashTag.id, HashTag.entity, HashTag.post_count
+    ).filter(
+        HashTag.status_id != DELETED_STATUS_ID
+    ).all()
+
+    hash_tag_index.load(
+        (entity, entity, _hash_tag_payload(entity), post_count or 0)
+        for _, entity, post_count in hash_tags)
+
+    _synced_up_to['users'] = max([row[0] for row in users] or [0])
+    _synced_up_to['hash_tags'] = max([row[0] for row in hash_tags] or [0])
+
+
+def sync_typeahead_indexes():
+    """Add the users and hash tags created since the indexes were last
+    built or synced, such as by other worker processes"""
+    users = db.session.query(
+        User.id, User.uid, User.name
+    ).filter(
+        User.id > _synced_up_to['users'],
+        User.status_id != DELETED_STATUS_ID,
+        User.name.isnot(None)
+    ).all()
+
+    for id_, uid, name in users:
+        user_index.upsert(id_, name, {'uid': uid, 'name': name})
+
+    hash_tags = db.session.query(
+        HashTag.id, HashTag.entity, HashTag.post_count
+    ).filter(
+        HashTag.id > _synced_up_to['hash_tags'],
+        HashTag.status_id != DELETED_STATUS_ID
+    ).all()
+
+    for _, entity, post_count in hash_tags:
+        if entity not in hash_tag_index:
+            hash_tag_index.upsert(
+                entity, entity, _hash_tag_payload(entity), post_count or 0)
+
+    # Rows committed out of id order are left to the next rebuild
+    _synced_up_to['users'] = max(
+        [row[0] for row in users] + [_synced_up_to['users']])
+    _synced_up_to['hash_tags'] = max(
+        [row[0] for row in hash_tags] + [_synced_up_to['hash_tags']])
+
+
+def _sync_periodically(app):
+    rebuild_at = time.monotonic() + TYPEAHEAD_REBUILD_INTERVAL
+
+    while True:
+        time.sleep(TYPEAHEAD_SYNC_INTERVAL)
+
+        with app.app_context():
+            try:
+                if time.monotonic() >= rebuild_at:
+                    build_typeahead_indexes()
+                    rebuild_at = time.monotonic() + TYPEAHEAD_REBUILD_INTERVAL
+                else:
+                    sync_typeahead_indexes()
+            except SQLAlchemyError:
+                logger.error('Typeahead index sync failed', exc_info=True)
+            finally:
+                db.session.remove()
+
+
+_sync_pid = None
+_sync_lock = threading.Lock()
+
+
+def ensure_typeahead_sync():
+    """Start keeping this process's indexes in step with the database, once
+    per process: a thread started before a fork doesn't survive it"""
+    global _sync_pid
+
+    if _sync_pid == os.getpid():
+        return
+
+    with _sync_lock:
+        if _sync_pid != os.getpid():
+            threading.Thread(
+                target=_sync_periodically,
+                args=(current_app._get_current_object(),),
+                name='typeahead-sync', daemon=True).start()
+
+            _sync_pid = os.getpid()
+
+
+def record_hash_tag_usages(entities):
+    """Add new hash tags to the index and bump the weight of known ones"""
+    for entity in entities:
+        if entity in hash_tag_index:
+            hash_tag_index.bump(entity)
+        else:
+            hash_tag_index.upsert(entity, entity, _hash_tag_payload(entity), 1)
+
+
+@on_persistence_change('User')
+def _index_user(user):
+    if user.id is None:
+        return
+
+    if user.is_deleted() or not user.name:
+        user_index.remove(user.id)
+    else:
+        user_index.upsert(user.id, user.name, _user_payload(user))
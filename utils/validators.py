@@ -46,10 +46,12 @@ def check_boolean_field(value):
 
 
 def check_coordinate_field(latitude=None, longitude=None):
-    if latitude is not None and not -90 < latitude < 90:
+    if latitude is not None and not (
+            isinstance(latitude, (int, float)) and -90 < latitude < 90):
         raise BadRequest('Latitude is invalid')
 
-    if longitude is not None and not -180 < longitude < 180:
+    if longitude is not None and not (
+            isinstance(longitude, (int, float)) and -180 < longitude < 180):
         raise BadRequest('Longitude is invalid')
 
 
@@ -0,0 +1,128 @@
+import atexit
+import queue
+import threading
+import time
+
+from flask import current_app
+
+from app.logs import logger
+from utils import metrics
+
+
+class BackgroundWorker(object):
+    """Drain a bounded in-process queue on a daemon thread.
+
+    Items are handed to `handler` in batches of at most `batch_size`, or
+    whatever has arrived after `flush_interval` seconds, inside an
+    application context so handlers can use the database session. Queue
+    depth, drops and batch timings are reported under `name` in
+    `utils.metrics`.
+    """
+
+    def __init__(self, name, handler, max_queue_size=10000, batch_size=100,
+                 flush_interval=1.0):
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._app = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stopping = threading.Event()
+        self._thread = None
+
+        metrics.register_gauge(
+            '{}.queue_depth'.format(name), self._queue.qsize)
+        metrics.set_gauge('{}.queue_capacity'.format(name), max_queue_size)
+
+    def submit(self, item):
+        """Queue `item` without blocking. Returns False if it was dropped."""
+        self._ensure_started()
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            metrics.increment('{}.dropped'.format(self.name))
+            logger.error('{} queue is full; dropping item'.format(self.name))
+            return False
+
+        metrics.increment('{}.submitted'.format(self.name))
+        return True
+
+    def drain(self):
+        """Process everything still queued in the calling thread."""
+        while True:
+            batch = self._collect_batch(timeout=0)
+            if not batch:
+                return
+
+            self._process(batch)
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        self.drain()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+
+            self._app = current_app._get_current_object()
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+            atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._collect_batch(timeout=self.flush_interval)
+            if batch:
+                self._process(batch)
+
+    def _collect_batch(self, timeout):
+        batch = []
+        deadline = time.monotonic() + timeout
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _process(self, batch):
+        app = self._app or current_app._get_current_object()
+        started_at = time.monotonic()
+
+        with app.app_context():
+            try:
+                self.handler(batch)
+            except Exception:
+                metrics.increment('{}.failed'.format(self.name), len(batch))
+                logger.error(
+                    '{} failed to process a batch of {} items'.format(
+                        self.name, len(batch)),
+                    exc_info=True)
+            else:
+                metrics.increment('{}.processed'.format(self.name), len(batch))
+
+        metrics.increment('{}.batches'.format(self.name))
+        metrics.set_gauge(
+            '{}.last_batch_seconds'.format(self.name),
+            round(time.monotonic() - started_at, 6))
@@ -1,4 +1,7 @@
 from app import create_app, db
+from modules.authentication import preload_app_cache
+from utils.search import create_search_index
+from utils.typeahead import build_typeahead_indexes
 
 
 application = create_app()
@@ -7,6 +10,10 @@ with application.app_context():
     db.init_app(application)
     db.Model.metadata.reflect(db.engine)  # load existing DB schema
     db.create_all()
+    create_search_index()
+
+    preload_app_cache()
+    build_typeahead_indexes()
 
 
 if __name__ == '__main__':